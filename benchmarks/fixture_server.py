@@ -0,0 +1,129 @@
+"""
+Local http server of the benchmarks: serves pages and images from memory, with delays and failures,
+and counts the bytes sent (the bytes downloaded by the previews).
+
+Exemple:
+    with FixtureServer({"/": Route(body=b"<html></html>"), "/slow.png": Route(body=png, delay=0.5)}) as server:
+        url = server.url("/")
+"""
+
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import multiprocessing
+from socketserver import ThreadingMixIn
+import time
+from typing import Dict, Optional
+
+class Route:
+    """
+    Small POD struct: the response to a path.
+    """
+    def __init__(self, body: bytes = b"", status: int = 200, content_type: Optional[str] = "text/html",
+                 delay: float = 0, reset: bool = False):
+        """
+        Args:
+            delay: seconds before the response.
+            reset: if True, the connection is closed without response.
+        """
+        self.body = body
+        self.status = status
+        self.content_type = content_type
+        self.delay = delay
+        self.reset = reset
+
+class FixtureServer:
+    """
+    Serves routes: path (without query) -> Route. The unknown paths are 404, unless default is given.
+    The server runs in a child process: its threads, memory and cpu are not counted with the previews.
+    """
+    def __init__(self, routes: Dict[str, Route], default: Optional[Route] = None):
+        self.routes = routes
+        self.default = default
+        self._requests = multiprocessing.Value("q", 0)
+        self._bytes_sent = multiprocessing.Value("q", 0)
+        self._process: Optional[multiprocessing.Process] = None
+        self._port = 0
+
+    @property
+    def requests(self) -> int:
+        return self._requests.value
+
+    @property
+    def bytes_sent(self) -> int:
+        """
+        Returns:
+            the bytes of the bodies sent (the bytes downloaded by the previews).
+        """
+        return self._bytes_sent.value
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self._port}{path}"
+
+    def reset_counters(self):
+        with self._requests.get_lock():
+            self._requests.value = 0
+        with self._bytes_sent.get_lock():
+            self._bytes_sent.value = 0
+
+    def __enter__(self):
+        receiver, sender = multiprocessing.Pipe(duplex=False)
+        self._process = multiprocessing.Process(target=_serve, name="fixture-server", daemon=True,
+                                                args=(self.routes, self.default, self._requests, self._bytes_sent,
+                                                      sender))
+        self._process.start()
+        self._port = receiver.recv()
+        return self
+
+    def __exit__(self, *args):
+        self._process.terminate()
+        self._process.join()
+
+class _Server(ThreadingMixIn, HTTPServer):  # http.server.ThreadingHTTPServer is not in python 3.6
+    daemon_threads = True
+    request_queue_size = 1024  # connections of many previews at once
+
+    def handle_error(self, request, client_address):
+        pass  # connections reset by the previews (cancelled probes): not an error of the benchmark
+
+def _serve(routes: Dict[str, Route], default: Optional[Route], requests, bytes_sent, port_sender):
+    """
+    Run the server (in the child process), after sending its port.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            route = routes.get(self.path.split("?", 1)[0], default)
+            if route is None:
+                route = Route(b"not found", status=404, content_type="text/plain")
+            if route.delay:
+                time.sleep(route.delay)
+            if route.reset:
+                self.close_connection = True
+                return
+            body = route.body
+            status = route.status
+            byte_range = self.headers.get("Range", "")
+            if status == 200 and byte_range.startswith("bytes=0-"):
+                body = body[:int(byte_range[len("bytes=0-"):]) + 1]
+                status = 206
+            self.send_response(status)
+            if route.content_type:
+                self.send_header("Content-Type", route.content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            with requests.get_lock():
+                requests.value += 1
+            try:
+                self.wfile.write(body)
+            except (BrokenPipeError, ConnectionResetError):
+                return  # the client stopped reading (enough bytes, or cancelled probe)
+            with bytes_sent.get_lock():
+                bytes_sent.value += len(body)
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            pass
+
+    httpd = _Server(("127.0.0.1", 0), Handler)
+    port_sender.send(httpd.server_port)
+    httpd.serve_forever()
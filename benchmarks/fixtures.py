@@ -0,0 +1,124 @@
+"""
+Scenarios of the benchmarks: the pages and images served by the FixtureServer, and the pages to preview.
+The pages are generated (always the same), except the recorded ones: html files of a folder, whose links to
+other sites are rewritten to the local server.
+
+Exemple:
+    scenario = SCENARIOS["image_scraping"]()
+    with FixtureServer(scenario.routes, scenario.default) as server:
+        urls = [server.url(path) for path in scenario.pages]
+"""
+
+import os
+import re
+import struct
+from typing import Callable, Dict, List, Optional
+from fixture_server import Route
+
+RECORDED_PAGES = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "tests", "fixtures")
+_WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et "
+          "dolore magna aliqua").split()
+
+class Scenario:
+    """
+    Small POD struct: routes of the server, and the paths of the pages to preview (with a query, to be
+    different urls for the caches).
+    """
+    def __init__(self, name: str, description: str, routes: Dict[str, Route], pages: List[str],
+                 default: Optional[Route] = None):
+        self.name = name
+        self.description = description
+        self.routes = routes
+        self.pages = pages
+        self.default = default
+
+def png(width: int, height: int, size: int = 20 * 1024) -> bytes:
+    """
+    Returns: a png header with the given size, padded to size bytes (as the rest of the image).
+    """
+    header = b'\211PNG\r\n\032\n' + b'\0\0\0\rIHDR' + struct.pack(">LL", width, height) + b'\x08\x02\0\0\0'
+    return header + b'\0' * max(size - len(header), 0)
+
+def jpeg(width: int, height: int, exif_size: int = 30 * 1024, size: int = 200 * 1024) -> bytes:
+    """
+    Returns: a jpeg whose size is after exif_size bytes of EXIF, padded to size bytes.
+    """
+    exif = b'\xff\xe1' + struct.pack(">H", exif_size + 2) + b'\0' * exif_size
+    header = b'\xff\xd8' + exif + b'\xff\xc0' + struct.pack(">HBHHB", 17, 8, height, width, 3) + b'\0' * 9
+    return header + b'\0' * max(size - len(header), 0)
+
+def text(words: int, seed: int = 0) -> str:
+    return " ".join(_WORDS[(seed + index * 7) % len(_WORDS)] for index in range(words))
+
+def page(head: str = "", body: str = "") -> bytes:
+    return f'<!DOCTYPE html><html><head><meta charset="utf-8">{head}</head><body>{body}</body></html>'.encode()
+
+OG_HEAD = '<title>Benchmark page</title><meta property="og:title" content="Benchmark page">' \
+          '<meta property="og:type" content="article"><meta property="og:description" content="A page.">' \
+          '<meta property="og:image" content="/og.png"><meta property="og:site_name" content="Bench">'
+
+def og_complete(count: int) -> Scenario:
+    routes = {"/page": Route(page(OG_HEAD, "".join(f"<p>{text(60, index)}</p>" for index in range(20))))}
+    return Scenario("og_complete", "small page with all og properties: no image probe", routes,
+                    [f"/page?{index}" for index in range(count)])
+
+def large_html(count: int) -> Scenario:
+    body = "".join(f'<div class="c"><p>{text(80, index)}</p><span>{text(20, index)}</span></div>'
+                   for index in range(4000))
+    routes = {"/large": Route(page('<title>Large page</title><meta property="og:image" content="/og.png">',
+                                   body))}
+    return Scenario("large_html", f"{len(routes['/large'].body) // 1024}KB page, description from its text",
+                    routes, [f"/large?{index}" for index in range(count)])
+
+def image_scraping(count: int) -> Scenario:
+    images = "".join(f'<img src="/thumb{index}.png" width="40" height="40">' for index in range(30))
+    images += "".join(f'<img src="/photo{index}.jpg">' for index in range(10))
+    images += '<img src="/hero.jpg" srcset="/hero.jpg 1200w">'
+    routes = {"/gallery": Route(page("<title>Gallery</title>", f"<p>{text(50)}</p>{images}"))}
+    routes.update({f"/thumb{index}.png": Route(png(40, 40, 2048), content_type="image/png") for index in range(30)})
+    routes.update({f"/photo{index}.jpg": Route(jpeg(300, 200), content_type="image/jpeg") for index in range(10)})
+    routes["/hero.jpg"] = Route(jpeg(1200, 630, size=400 * 1024), content_type="image/jpeg")
+    return Scenario("image_scraping", "no og:image: 41 <img> to choose from", routes,
+                    [f"/gallery?{index}" for index in range(count)])
+
+def slow_images(count: int) -> Scenario:
+    images = "".join(f'<img src="/slow{index}.png">' for index in range(8))
+    routes = {"/slow": Route(page("<title>Slow images</title>", f"<p>{text(50)}</p>{images}"))}
+    routes.update({f"/slow{index}.png": Route(png(200 + index * 50, 200), content_type="image/png", delay=0.3)
+                   for index in range(8)})
+    return Scenario("slow_images", "8 images, each answered after 300ms", routes,
+                    [f"/slow?{index}" for index in range(count)])
+
+def failing_images(count: int) -> Scenario:
+    images = '<img src="/missing.png"><img src="/error.png"><img src="/reset.png"><img src="/notimage.png">' \
+             '<img src="/good.png">'
+    routes = {
+        "/failing": Route(page("<title>Failing images</title>", f"<p>{text(50)}</p>{images}")),
+        "/error.png": Route(b"error", status=500, content_type="text/plain"),
+        "/reset.png": Route(reset=True),
+        "/notimage.png": Route(b"<html>not an image</html>", content_type="image/png"),
+        "/good.png": Route(png(400, 300), content_type="image/png"),
+    }
+    return Scenario("failing_images", "404, 500, reset connection, bad content, and one good image", routes,
+                    [f"/failing?{index}" for index in range(count)])
+
+def recorded(count: int, folder: str = RECORDED_PAGES) -> Scenario:
+    routes = {}
+    for name in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+        if name.endswith(".html"):
+            with open(os.path.join(folder, name), "rb") as file:
+                # links to other sites are served by the local server
+                routes[f"/recorded/{name}"] = Route(re.sub(rb'https?://[^/"\'\s>]+', b'', file.read()))
+    names = sorted(routes)
+    pages = [f"{names[index % len(names)]}?{index}" for index in range(count)] if names else []
+    return Scenario("recorded", f"{len(names)} recorded pages of {folder}", routes, pages,
+                    default=Route(png(600, 400), content_type="image/png"))
+
+SCENARIOS: Dict[str, Callable[[int], Scenario]] = {
+    "og_complete": og_complete,
+    "large_html": large_html,
+    "image_scraping": image_scraping,
+    "slow_images": slow_images,
+    "failing_images": failing_images,
+    "recorded": recorded,
+}
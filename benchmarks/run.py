@@ -0,0 +1,196 @@
+"""
+Offline benchmarks of HyperLinkPreview: the scenarios of fixtures.py are served by a local server, and
+previewed by a pool of threads (as an application would). For each scenario are measured: throughput,
+latency percentiles, bytes downloaded, requests, threads created and peak memory (python allocations,
+in a second pass with tracemalloc).
+
+Only the HyperLinkPreview(url) / get_data() API is used, so releases can be compared: run the benchmarks
+with each release installed (--installed), save the results (--json), and compare them (--compare).
+
+Exemple:
+    python benchmarks/run.py --count 200 --workers 16 --json current.json
+    python benchmarks/run.py --installed --compare current.json
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fixture_server import FixtureServer  # pylint: disable=wrong-import-position
+from fixtures import SCENARIOS, Scenario  # pylint: disable=wrong-import-position
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "src")
+POOL_PREFIX = "bench-pool"
+# metric -> True if higher is better, for --compare
+METRICS = {"throughput": True, "latency_p50": False, "latency_p90": False, "latency_p99": False,
+           "bytes_downloaded": False, "requests": False, "threads_created": False, "peak_memory": False,
+           "errors": False}
+
+class ThreadCounter:
+    """
+    Counts the threads started in its context (but the benchmark pool ones), and the peak of running threads.
+    """
+    def __init__(self):
+        self.created = 0
+        self.peak = threading.active_count()
+        self._start = threading.Thread.start
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        counter = self
+
+        def start(thread, *args, **kwargs):
+            counter._start(thread, *args, **kwargs)  # pylint: disable=protected-access
+            with counter._lock:  # pylint: disable=protected-access
+                if not thread.name.startswith(POOL_PREFIX):
+                    counter.created += 1
+                counter.peak = max(counter.peak, threading.active_count())
+
+        threading.Thread.start = start
+        return self
+
+    def __exit__(self, *args):
+        threading.Thread.start = self._start
+
+def import_package(installed: bool):
+    """
+    Returns:
+        the hyperlink_preview package: the installed one, or the one of this repository.
+    """
+    if not installed:
+        sys.path.insert(0, os.path.abspath(SRC))
+    import hyperlink_preview  # pylint: disable=import-outside-toplevel
+    try:
+        from hyperlink_preview import image_cache  # pylint: disable=import-outside-toplevel
+        image_cache.set_default_image_cache(None)  # each page probes its images, as the first time
+    except ImportError:
+        pass
+    return hyperlink_preview
+
+def percentile(values: List[float], ratio: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(ratio * len(ordered)), len(ordered) - 1)]
+
+def preview_all(package, urls: List[str], workers: int) -> Dict[str, Any]:
+    """
+    Preview urls with a pool of workers threads.
+
+    Returns:
+        the latencies (seconds) of the previews, the number of errors, and the elapsed seconds.
+    """
+    def preview(url):
+        start = time.perf_counter()
+        try:
+            package.HyperLinkPreview(url=url).get_data(wait_for_imgs=True)
+        except Exception:  # pylint: disable=broad-except
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=POOL_PREFIX) as pool:
+        latencies = list(pool.map(preview, urls))
+    return {"latencies": [latency for latency in latencies if latency is not None],
+            "errors": latencies.count(None), "elapsed": time.perf_counter() - start}
+
+def run_scenario(package, scenario: Scenario, workers: int, memory: bool) -> Dict[str, Any]:
+    with FixtureServer(scenario.routes, scenario.default) as server:
+        urls = [server.url(path) for path in scenario.pages]
+        package.HyperLinkPreview(url=urls[0]).get_data()  # warm up: imports, connections, shared threads
+        server.reset_counters()
+        with ThreadCounter() as threads:
+            run = preview_all(package, urls, workers)
+        result = {
+            "previews": len(urls),
+            "throughput": len(urls) / run["elapsed"],
+            "latency_p50": percentile(run["latencies"], 0.5),
+            "latency_p90": percentile(run["latencies"], 0.9),
+            "latency_p99": percentile(run["latencies"], 0.99),
+            "bytes_downloaded": server.bytes_sent,
+            "requests": server.requests,
+            "threads_created": threads.created,
+            "peak_threads": threads.peak,
+            "errors": run["errors"],
+        }
+        if memory:
+            tracemalloc.start()
+            preview_all(package, [url + "&memory" for url in urls], workers)
+            result["peak_memory"] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    return result
+
+def print_results(results: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None):
+    for name, metrics in results["scenarios"].items():
+        print(f"\n{name}: {metrics['previews']} previews")
+        previous = (baseline or {}).get("scenarios", {}).get(name, {})
+        for metric, higher_is_better in METRICS.items():
+            value = metrics.get(metric)
+            if value is None:
+                continue
+            line = f"  {metric:<18}{format_value(metric, value):>14}"
+            if previous.get(metric):
+                change = (value - previous[metric]) / previous[metric] * 100
+                better = (change > 0) == higher_is_better
+                line += f"   was {format_value(metric, previous[metric]):>12}  {change:+7.1f}%" \
+                        f"{'' if abs(change) < 5 else (' better' if better else ' WORSE')}"
+            print(line)
+
+def format_value(metric: str, value: float) -> str:
+    if metric.startswith("latency"):
+        return f"{value * 1000:.1f} ms"
+    if metric == "throughput":
+        return f"{value:.1f} /s"
+    if metric in ("bytes_downloaded", "peak_memory"):
+        return f"{value / 1024:.0f} KB"
+    return str(value)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks of HyperLinkPreview.")
+    parser.add_argument("scenarios", nargs="*", help=f"scenarios to run (default: all): {', '.join(SCENARIOS)}")
+    parser.add_argument("--count", type=int, default=100, help="previews per scenario (default: 100)")
+    parser.add_argument("--workers", type=int, default=16, help="previews at the same time (default: 16)")
+    parser.add_argument("--installed", action="store_true",
+                        help="benchmark the installed hyperlink_preview, instead of the one of this repository")
+    parser.add_argument("--no-memory", action="store_true", help="don't measure the peak memory (faster)")
+    parser.add_argument("--json", help="file to save the results")
+    parser.add_argument("--compare", help="results file of a previous run, to compare with")
+    args = parser.parse_args(argv)
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    package = import_package(args.installed)
+    results = {"package": os.path.dirname(package.__file__), "python": platform.python_version(),
+               "date": time.strftime("%Y-%m-%d %H:%M:%S"), "count": args.count, "workers": args.workers,
+               "scenarios": {}}
+    for name in args.scenarios or SCENARIOS:
+        scenario = SCENARIOS[name](args.count)
+        if not scenario.pages:
+            print(f"{name}: no page, skipped", file=sys.stderr)
+            continue
+        print(f"{name}: {scenario.description}...", file=sys.stderr)
+        results["scenarios"][name] = run_scenario(package, scenario, args.workers, not args.no_memory)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if (baseline.get("count"), baseline.get("workers")) != (args.count, args.workers):
+            print(f"Warning: {args.compare} was run with --count {baseline.get('count')} "
+                  f"--workers {baseline.get('workers')}", file=sys.stderr)
+    print_results(results, baseline)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,2 +1,6 @@
 from .hyperlink_preview import HyperLinkPreview
-from . import demo_html
\ No newline at end of file
+from .async_hyperlink_preview import AsyncHyperLinkPreview
+from .scheduler import FetchScheduler
+from .batch import preview_many
+from .result import PreviewResult
+from . import demo_html
@@ -0,0 +1,121 @@
+"""
+Command line: preview the urls of a file (one per line) or of stdin, in parallel, and write one JSON object
+per url (JSON Lines), in completion order, with the phases timings and the error if any.
+
+Exemple:
+    python -m hyperlink_preview urls.txt --workers 32 --timeout 10 > previews.jsonl
+    cat urls.txt | python -m hyperlink_preview --store previews.hlp
+"""
+
+import argparse
+import json
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, TextIO, Union
+from .batch import preview_many
+from .hyperlink_preview import HyperLinkPreview
+from . import extractor
+from .parse_pool import ParsePool
+from .store import PreviewStore
+
+def read_urls(lines: TextIO) -> Iterator[str]:
+    """
+    Returns:
+        the urls of the lines, without the empty lines and the comments (#).
+    """
+    for line in lines:
+        url = line.strip()
+        if url and not url.startswith("#"):
+            yield url
+
+def preview_record(url: str, result: Union[HyperLinkPreview, Exception]) -> Dict[str, Any]:
+    """
+    Returns:
+        the JSON object of a preview_many result. status is "ok", "not_a_page" (not valid: a pdf, a video...)
+        or "error" (then error is the exception).
+    """
+    if isinstance(result, Exception):
+        return {"url": url, "status": "error", "error": f"{type(result).__name__}: {result}"}
+    return {
+        "url": url,
+        "status": "ok" if result.is_valid else "not_a_page",
+        "data": result.get_data(wait_for_imgs=False).to_dict(),
+        "is_partial": result.is_partial,
+        "content_type": result.content_type,
+        "fetched_bytes": result.fetched_bytes,
+        "timings": {phase: round(seconds, 4) for phase, seconds in result.timings.items()},
+    }
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m hyperlink_preview",
+                                     description="Preview urls in parallel, and write the results as JSON Lines.")
+    parser.add_argument("input", nargs="?", default="-", help="file of urls, one per line (default: stdin)")
+    parser.add_argument("-o", "--output", default="-", help="JSON Lines file to write (default: stdout)")
+    parser.add_argument("-w", "--workers", type=int, default=16, help="simultaneous fetches (default: 16)")
+    parser.add_argument("--per-host", type=int, default=4, help="simultaneous fetches to a host (default: 4)")
+    parser.add_argument("--timeout", type=float, help="max seconds of a preview")
+    parser.add_argument("--fetch-timeout", type=float, help="max seconds to download a page")
+    parser.add_argument("--images-timeout", type=float, help="max seconds to search the image of a page")
+    parser.add_argument("--head-only", action="store_true", help="stop the download once the head gives the data")
+    parser.add_argument("--max-bytes", type=int, help="max bytes of a page to download")
+    parser.add_argument("--parser", choices=sorted(set(extractor.PARSERS) | {"lxml"}), help="html parser")
+    parser.add_argument("--parse-processes", type=int, default=0,
+                        help="worker processes parsing the pages (see parse_pool), to use all cpus (default: 0, "
+                             "the pages are parsed in the threads)")
+    parser.add_argument("--store", help="preview store file (see store.PreviewStore): the previews found there "
+                                        "are not fetched, the others are added")
+    parser.add_argument("--ttl", type=float, default=30 * 24 * 3600,
+                        help="seconds a preview of the store is used (default: 30 days)")
+    parser.add_argument("--refresh", action="store_true", help="fetch again the previews of the store")
+    args = parser.parse_args(argv)
+    if args.workers < 1 or args.per_host < 1:
+        parser.error("--workers and --per-host must be >= 1")
+    if args.parse_processes < 0:
+        parser.error("--parse-processes must be >= 0")
+    return args
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Returns:
+        the exit status: 0, or 130 if interrupted.
+    """
+    args = parse_args(argv)
+    store = PreviewStore(args.store, ttl=args.ttl) if args.store else None
+    pool = ParsePool(processes=args.parse_processes) if args.parse_processes else None
+    preview_kwargs = {"cache": store, "refresh_cache": args.refresh, "timeout": args.timeout,
+                      "fetch_timeout": args.fetch_timeout, "images_timeout": args.images_timeout,
+                      "head_only": args.head_only, "max_bytes": args.max_bytes, "parser": args.parser,
+                      "parse_pool": pool}
+    # pylint: disable=consider-using-with
+    lines = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    # pylint: enable=consider-using-with
+    counts = {"ok": 0, "not_a_page": 0, "error": 0}
+    start = time.monotonic()
+    status = 0
+    try:
+        for url, result in preview_many(read_urls(lines), max_concurrency=args.workers, per_host_limit=args.per_host,
+                                        max_pending=4 * args.workers, **preview_kwargs):
+            record = preview_record(url, result)
+            counts[record["status"]] += 1
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+    except KeyboardInterrupt:
+        status = 130
+    finally:
+        if lines is not sys.stdin:
+            lines.close()
+        if output is not sys.stdout:
+            output.close()
+        if store is not None:
+            store.close()
+        if pool is not None:
+            pool.close()
+    elapsed = time.monotonic() - start
+    total = sum(counts.values())
+    print(f"{total} urls in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f}/s): {counts['ok']} ok, "
+          f"{counts['not_a_page']} not a page, {counts['error']} errors", file=sys.stderr)
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""
+asyncio version of HyperLinkPreview: fetch, parse and image probing run on the event loop, without threads.
+Requires aiohttp (pip install hyperlink_preview[async]).
+
+Exemple:
+    hlp = await AsyncHyperLinkPreview.create(url="https://en.wikipedia.org/wiki/Your_Name")
+    if hlp.is_valid:
+        preview_data = hlp.get_data()  # doesn't wait for images
+        preview_data = await hlp.get_data_full()  # waits for images
+"""
+
+import asyncio
+import logging
+import time
+from typing import Iterable, List, Optional
+from requests.compat import chardet
+from .hyperlink_preview import HyperLinkPreview
+from . import image_size
+from . import image_probe
+from . import sniffing
+
+try:
+    import aiohttp
+except ImportError:  # pragma: no cover
+    aiohttp = None
+
+logger = logging.getLogger('hyperlinkpreview')
+
+class AsyncHyperLinkPreview(HyperLinkPreview):
+    """
+    Class to parse an url preview data, with asyncio.
+    Don't instantiate it directly: use "await AsyncHyperLinkPreview.create(url)".
+    Warning: create raises if url is not accessible: handle it.
+    """
+
+    def __init__(self, url: str, session=None):  # pylint: disable=super-init-not-called
+        """
+        Only init the members: the fetch and parse are done by create().
+
+        Raises:
+            - ValueError if no url or None
+        """
+        if aiohttp is None:
+            raise ImportError("aiohttp is required for AsyncHyperLinkPreview: pip install hyperlink_preview[async]")
+        self._init_state(url)
+        self.scheduler = None
+        self.fetched_bytes: Optional[int] = None  # bytes of the page downloaded
+        self._session = session
+        self._own_session = False
+        self._pending_candidates: Optional[List[image_probe.ImageCandidate]] = None
+        self._images_task: Optional[asyncio.Future] = None
+
+    @classmethod
+    async def create(cls, url: str, session=None) -> "AsyncHyperLinkPreview":
+        """
+        Fetch and parse the url. If images must be probed, it is done in a task on the running loop.
+
+        Args:
+            url: the link to preview.
+            session: an aiohttp.ClientSession to use. If None, a session is created for this preview,
+                     and closed when the images are probed.
+
+        Raises:
+            - aiohttp.ClientError: if cannot get url
+            - ValueError if no url or None
+        """
+        self = cls(url, session)
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+            self._own_session = True
+        try:
+            _html = await self._fetch_async(url)
+            if logger.getEffectiveLevel() <= logging.DEBUG:
+                logger.debug(f"fetched html size: {len(_html)}")
+            if self.parse_pool is None:
+                self._parse(_html)
+            else:
+                await self._parse_async(_html)
+        except BaseException:
+            await self._close_own_session()
+            raise
+
+        if self._pending_candidates is None:
+            await self._close_own_session()
+        else:
+            self._images_task = asyncio.ensure_future(
+                self._parse_deeper_image_in_tags_async(self._pending_candidates))
+            self._pending_candidates = None
+        return self
+
+    def get_data(self, wait_for_imgs=False, timeout: Optional[float] = None,
+                 fields: Optional[Iterable[str]] = None):
+        """
+        Args:
+            wait_for_imgs: must be False: await get_data_full() to wait for the images parse.
+            timeout: ignored (no wait).
+            fields: see HyperLinkPreview.get_data.
+
+        Returns:
+            The data, without waiting for the images parse. If the 'image' value is None,
+            await get_data_full() to have the image.
+        """
+        if wait_for_imgs and not self.full_parsed.is_set():
+            raise RuntimeError("Cannot block the event loop: use 'await get_data_full()'")
+        return super().get_data(wait_for_imgs=False, fields=fields)
+
+    async def _parse_async(self, html):
+        """
+        As HyperLinkPreview._parse, awaiting the parse pool: the event loop runs while a worker parses the page.
+        """
+        if not self._is_markup(html):
+            self._set_full_parsed()
+            return
+        start = time.monotonic()
+        page = await self.parse_pool.extract_async(str(html), self.parser,
+                                                   self._phase_deadline(start, self.parse_timeout))
+        with self.data_lock:
+            self._use_page(page, start)
+
+    async def get_data_full(self, fields: Optional[Iterable[str]] = None):
+        """
+        Args:
+            fields: see HyperLinkPreview.get_data.
+
+        Returns:
+            The data, once images are parsed.
+        """
+        if self._images_task is not None:
+            await asyncio.shield(self._images_task)
+        return super().get_data(wait_for_imgs=False, fields=fields)
+
+    async def _fetch_async(self, url: str) -> str:
+        """
+        As HyperLinkPreview._fetch: the body is read only if it is a page (at most max_page_bytes), the first
+        bytes telling when the Content-Type doesn't. When the url is an image, only its header is read.
+
+        Returns:
+            the html content of the given url ("" if not a page).
+
+        Raises:
+            aiohttp.ClientError: If cannot get url.
+        """
+        try:
+            async with self._session.get(url) as response:
+                self.final_url = str(response.url)
+                self.content_type = sniffing.media_type(response.headers.get("Content-Type"))
+                kind = sniffing.kind_from_headers(self.content_type, response.headers.get("Content-Length"),
+                                                  self.max_page_bytes)
+                first_bytes = b''
+                if kind is None:
+                    first_bytes = await _read_async(response, sniffing.SNIFF_BYTES)
+                    kind = sniffing.sniff(first_bytes)
+                if kind == sniffing.IMAGE:
+                    self._preview_image(url, await image_size.get_size_and_format_async(response, first_bytes))
+                    return ""
+                if kind != sniffing.HTML:
+                    logger.info("Not a page: [%s] (%s)", url, self.content_type)
+                    return ""
+                content = first_bytes + await _read_async(response, self.max_page_bytes - len(first_bytes))
+                self.fetched_bytes = len(content)
+                encoding = response.charset or chardet.detect(content)["encoding"] or "utf-8"
+                try:
+                    return str(content, encoding, errors="replace")
+                except LookupError:
+                    return str(content, "utf-8", errors="replace")
+        except aiohttp.ClientError as ex:
+            logging.error("Cannot fetch url [%s]: [%s]", url, ex)
+            raise ex
+
+    def _scrape_images(self, candidates: List[image_probe.ImageCandidate]):
+        """
+        The images are probed by create(), once the parse is done.
+        """
+        self._pending_candidates = candidates
+
+    async def _parse_deeper_image_in_tags_async(self, candidates: List[image_probe.ImageCandidate]):
+        try:
+            search = self._create_image_search(candidates)
+            search.finish_if_done()
+            workers = [asyncio.ensure_future(self._probe_images_async(search))
+                       for _ in range(min(self.max_concurrent_images, len(candidates)))]
+            if workers:
+                _, pending = await asyncio.wait(workers, timeout=search.remaining_time())
+                for worker in pending:
+                    worker.cancel()
+                search.expire()  # when the deadline is reached
+        finally:
+            if not self.full_parsed.is_set():  # the end of the search sets it, unless it raised before
+                self._set_full_parsed()
+            await self._close_own_session()
+
+    async def _probe_images_async(self, search: image_probe.ImageSearch):
+        candidate = search.next_candidate()
+        while candidate is not None:
+            search.add_result(candidate, await self.fetch_image_size_async(candidate.url, search))
+            candidate = search.next_candidate()
+
+    async def fetch_image_size_async(self, src: str, search: Optional[image_probe.ImageSearch] = None
+                                     ) -> Optional[image_size.ImageSize]:
+        """
+        Args:
+            src: url of the image to fetch (its header, at most image_size.MAX_HEADER_BYTES) and get size.
+            search: the search the probe is for (to know if it is cancelled).
+
+        Returns:
+            the image size, None if not found.
+        """
+        try:
+            # the body is streamed, and its read stops at the header: the range is only its limit
+            headers = {"Range": f"bytes=0-{image_size.MAX_HEADER_BYTES - 1}"}
+            async with self._session.get(src, headers=headers) as response:
+                result = (-1, -1, None)
+                if response.status in (200, 206):
+                    result = await image_size.get_size_and_format_async(response)
+                if search is not None:
+                    self._cache_image_size(search, src, response.status, result)
+                if result[0] != -1:
+                    return image_size.ImageSize(src, result[0], result[1])
+        except Exception:  # pylint: disable=broad-except
+            pass
+        return None
+
+    async def _close_own_session(self):
+        if self._own_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+async def _read_async(response, size: int) -> bytes:
+    """
+    Returns:
+        the next size bytes of the body of an aiohttp response (less at the end of the body).
+    """
+    chunks = []
+    read = 0
+    while read < size:
+        chunk = await response.content.read(min(size - read, 64 * 1024))
+        if not chunk:
+            break
+        chunks.append(chunk)
+        read += len(chunk)
+    return b"".join(chunks)
@@ -0,0 +1,69 @@
+"""
+Preview many urls with a bounded number of threads and sockets.
+
+Exemple:
+    for url, result in preview_many(urls, max_concurrency=32, per_host_limit=4):
+        if isinstance(result, Exception):
+            print(f"cannot preview {url}: {result}")
+        else:
+            print(result.get_data(wait_for_imgs=False))
+"""
+
+import queue
+from typing import Iterable, Iterator, Optional, Tuple, Union
+import requests
+from .hyperlink_preview import HyperLinkPreview
+from .scheduler import FetchScheduler
+
+def preview_many(urls: Iterable[str], max_concurrency: int = 16, per_host_limit: int = 4,
+                 scheduler: Optional[FetchScheduler] = None, session: Optional[requests.Session] = None,
+                 max_pending: Optional[int] = None, **preview_kwargs
+                 ) -> Iterator[Tuple[str, Union[HyperLinkPreview, Exception]]]:
+    """
+    Fetch and parse all urls, with one scheduler shared by the pages fetches and the images probes:
+    at most max_concurrency threads, and per_host_limit simultaneous requests to a given host.
+
+    Args:
+        urls: the links to preview.
+        max_concurrency: number of worker threads (ignored if scheduler is given).
+        per_host_limit: max simultaneous requests to a host (ignored if scheduler is given).
+        scheduler: the scheduler to use. If None, one is created for this call, and shut down at the end.
+        session: the requests.Session for all fetches. If None, the default shared session is used.
+        max_pending: if given, at most max_pending urls are in progress: the next urls are read from urls
+                     as results are yielded (for a long or endless iterator). If None, all urls are
+                     scheduled at once.
+        preview_kwargs: other arguments of the HyperLinkPreview constructor (cache, timeout, head_only...).
+
+    Returns:
+        an iterator of (url, result), in completion order. result is the HyperLinkPreview, fully parsed
+        (images included), or the exception raised by its constructor.
+    """
+    own_scheduler = scheduler is None
+    if scheduler is None:
+        scheduler = FetchScheduler(max_concurrency=max_concurrency, per_host_limit=per_host_limit)
+    results: "queue.Queue[Tuple[str, Union[HyperLinkPreview, Exception]]]" = queue.Queue()
+
+    def on_page_done(url, future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            results.put((url, error))
+            return
+        future.result().add_done_callback(lambda preview: results.put((url, preview)))
+
+    try:
+        pending = 0
+        for url in urls:
+            while max_pending is not None and pending >= max_pending:
+                yield results.get()
+                pending -= 1
+            future = scheduler.submit(url, HyperLinkPreview, url, scheduler=scheduler, session=session,
+                                      **preview_kwargs)
+            future.add_done_callback(lambda future, url=url: on_page_done(url, future))
+            pending += 1
+        for _ in range(pending):
+            yield results.get()
+    finally:
+        if own_scheduler:
+            scheduler.shutdown(wait=False)
@@ -0,0 +1,364 @@
+"""
+Caches of previews data, keyed on normalized url (see normalization.UrlNormalizer): in memory (LRU), or on disk
+(sqlite). An entry is found by the other urls of its page too (aliases: url after redirects, og:url, canonical).
+
+Exemple:
+    cache = MemoryCache(max_entries=10000, ttl=3600, stale_while_revalidate=600)
+    hlp = HyperLinkPreview(url, cache=cache)  # no fetch if url is in cache
+    print(cache.stats())
+"""
+
+from collections import OrderedDict
+import json
+import logging
+import sqlite3
+import time
+from threading import Lock
+from typing import Dict, Iterable, Optional, Set, Tuple
+from . import normalization
+from .result import PreviewResult
+
+logger = logging.getLogger('hyperlinkpreview')
+
+FRESH = "fresh"
+STALE = "stale"
+EXPIRED = "expired"
+
+class CacheEntry:
+    """
+    Small POD struct to store the data of a preview, and the validators (ETag, Last-Modified headers)
+    of the page they come from.
+    """
+    __slots__ = ("datas", "is_valid", "stored_at", "etag", "last_modified")
+
+    def __init__(self, datas: Dict[str, Optional[str]], is_valid: bool, stored_at: Optional[float] = None,
+                 etag: Optional[str] = None, last_modified: Optional[str] = None):
+        self.datas = datas if isinstance(datas, PreviewResult) else PreviewResult(datas)
+        self.is_valid = is_valid
+        self.stored_at = time.time() if stored_at is None else stored_at
+        self.etag = etag
+        self.last_modified = last_modified
+
+    def validation_headers(self) -> Dict[str, str]:
+        """
+        Returns:
+            the headers of a conditional request for the page of this entry.
+        """
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    def to_json(self) -> str:
+        return json.dumps({"datas": self.datas.to_dict(), "is_valid": self.is_valid, "stored_at": self.stored_at,
+                           "etag": self.etag, "last_modified": self.last_modified})
+
+    @staticmethod
+    def from_json(text: str) -> "CacheEntry":
+        values = json.loads(text)
+        return CacheEntry(values["datas"], values["is_valid"], values["stored_at"],
+                          values.get("etag"), values.get("last_modified"))
+
+    def __repr__(self):
+        return f"CacheEntry({self.datas}, is_valid={self.is_valid}, stored_at={self.stored_at})"
+
+class PreviewCache:
+    """
+    Base class of the caches: freshness, counters, and background refresh bookkeeping.
+    Subclasses implement _load, _store, delete, clear and __len__.
+
+    An entry is fresh during ttl seconds. Then, during stale_while_revalidate seconds, it is still returned
+    (as stale) while the preview refreshes it in background. After that, it is a miss, but its validators
+    are used for a conditional request: if the page is not modified, the entry is reused without parse.
+
+    The aliases (other urls of a page -> key of its entry) are kept in memory, at most max_aliases:
+    subclasses may persist them (_load_alias, _store_alias, _clear_aliases).
+    """
+    max_aliases = 100000
+
+    def __init__(self, ttl: float = 3600, stale_while_revalidate: float = 0,
+                 normalizer: Optional[normalization.UrlNormalizer] = None):
+        """
+        Args:
+            normalizer: gives the keys of the urls. If None, the default one (see normalization).
+        """
+        self.normalizer = normalizer if normalizer is not None else normalization.get_default_normalizer()
+        self.ttl = ttl
+        self.stale_while_revalidate = stale_while_revalidate
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._counters_lock = Lock()
+        self._refreshing: Set[str] = set()
+        self._aliases = LRUDict(self.max_aliases)
+
+    def key(self, url: str) -> str:
+        """
+        Returns:
+            the cache key of an url: the same for its variants (see normalization.UrlNormalizer.key).
+        """
+        return self.normalizer.key(url)
+
+    def lookup(self, url: str) -> Tuple[Optional[CacheEntry], Optional[str]]:
+        """
+        Returns:
+            (entry, FRESH), (entry, STALE) or (entry, EXPIRED), or (None, None) if not in cache.
+            An EXPIRED entry counts as a miss: it is returned only for its validators.
+        """
+        entry = self._find_entry(self.key(url))
+        state = None
+        if entry is not None:
+            age = time.time() - entry.stored_at
+            if age <= self.ttl:
+                state = FRESH
+            elif age <= self.ttl + self.stale_while_revalidate:
+                state = STALE
+            else:
+                state = EXPIRED
+        with self._counters_lock:
+            if state == FRESH:
+                self.hits += 1
+            elif state == STALE:
+                self.stale_hits += 1
+            else:
+                self.misses += 1
+        return (entry, state)
+
+    def peek(self, url: str) -> Optional[CacheEntry]:
+        """
+        Returns:
+            the entry of url, even if expired, without counting a hit or a miss.
+        """
+        return self._find_entry(self.key(url))
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        """
+        Returns:
+            the entry of url if fresh or stale, None otherwise.
+        """
+        entry, state = self.lookup(url)
+        return entry if state in (FRESH, STALE) else None
+
+    def set(self, url: str, entry: CacheEntry, aliases: Iterable[str] = ()):
+        """
+        Args:
+            aliases: other urls of the page (url after redirects, canonical...): they find this entry too.
+        """
+        key = self.key(url)
+        self._store(key, entry)
+        for alias in aliases:
+            alias_key = self.key(alias)
+            if alias_key != key:
+                self._store_alias(alias_key, key)
+
+    def _find_entry(self, key: str) -> Optional[CacheEntry]:
+        """
+        Returns:
+            the entry of key, or of the key it is an alias of.
+        """
+        entry = self._load(key)
+        if entry is None:
+            target = self._load_alias(key)
+            if target is not None and target != key:
+                entry = self._load(target)
+        return entry
+
+    def _load_alias(self, key: str) -> Optional[str]:
+        """
+        Returns:
+            the key of the entry of which key is an alias, None if not an alias.
+        """
+        return self._aliases.get(key)
+
+    def _store_alias(self, key: str, target: str):
+        self._aliases.set(key, target)
+
+    def _clear_aliases(self):
+        self._aliases.clear()
+
+    def count_not_modified(self):
+        """
+        Count an entry revalidated by a conditional request (304 Not Modified).
+        """
+        with self._counters_lock:
+            self.not_modified += 1
+
+    def start_refresh(self, url: str) -> bool:
+        """
+        Returns:
+            True if the caller must refresh url (and then call end_refresh), False if a refresh is running.
+        """
+        key = self.key(url)
+        with self._counters_lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, url: str):
+        with self._counters_lock:
+            self._refreshing.discard(self.key(url))
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            the counters, to size the cache: hits, stale_hits, misses, not_modified (revalidated entries),
+            and size (number of entries).
+        """
+        with self._counters_lock:
+            return {"hits": self.hits, "stale_hits": self.stale_hits, "misses": self.misses,
+                    "not_modified": self.not_modified, "size": len(self)}
+
+    def _load(self, key: str) -> Optional[CacheEntry]:
+        raise NotImplementedError
+
+    def _store(self, key: str, entry: CacheEntry):
+        raise NotImplementedError
+
+    def delete(self, url: str):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+class LRUDict:
+    """
+    Thread safe dict with a max number of items: the least recently used is removed.
+    """
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, object]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._items.move_to_end(key)
+                return self._items[key]
+            except KeyError:
+                return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._items.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+class MemoryCache(PreviewCache):
+    """
+    In memory cache, with LRU eviction.
+    """
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600, stale_while_revalidate: float = 0,
+                 normalizer: Optional[normalization.UrlNormalizer] = None):
+        super().__init__(ttl=ttl, stale_while_revalidate=stale_while_revalidate, normalizer=normalizer)
+        self._entries = LRUDict(max_entries)
+
+    def _load(self, key: str) -> Optional[CacheEntry]:
+        return self._entries.get(key)
+
+    def _store(self, key: str, entry: CacheEntry):
+        self._entries.set(key, entry)
+
+    def delete(self, url: str):
+        self._entries.pop(self.key(url))
+
+    def clear(self):
+        self._entries.clear()
+        self._clear_aliases()
+
+    def __len__(self):
+        return len(self._entries)
+
+class SqliteCache(PreviewCache):
+    """
+    Persistent cache in a sqlite file. When there are more than max_entries, the oldest stored are removed.
+    The aliases are stored in the file too: those of the removed entries are removed with them, and at most
+    max_aliases are kept (the oldest stored are removed).
+    """
+    def __init__(self, path: str, max_entries: Optional[int] = None, ttl: float = 3600,
+                 stale_while_revalidate: float = 0, normalizer: Optional[normalization.UrlNormalizer] = None):
+        super().__init__(ttl=ttl, stale_while_revalidate=stale_while_revalidate, normalizer=normalizer)
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS previews "
+                                     "(key TEXT PRIMARY KEY, stored_at REAL, entry TEXT)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS previews_stored_at ON previews (stored_at)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS aliases (key TEXT PRIMARY KEY, target TEXT)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS aliases_target ON aliases (target)")
+
+    def _load(self, key: str) -> Optional[CacheEntry]:
+        with self._lock:
+            row = self._connection.execute("SELECT entry FROM previews WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return CacheEntry.from_json(row[0])
+        except (ValueError, KeyError) as ex:
+            logger.warning("Invalid cache entry for [%s]: [%s]", key, ex)
+            return None
+
+    def _store(self, key: str, entry: CacheEntry):
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO previews (key, stored_at, entry) VALUES (?, ?, ?)",
+                                     (key, entry.stored_at, entry.to_json()))
+            if self.max_entries is not None:
+                evicted = self._connection.execute("SELECT key FROM previews ORDER BY stored_at DESC "
+                                                   "LIMIT -1 OFFSET ?", (self.max_entries,)).fetchall()
+                self._connection.executemany("DELETE FROM previews WHERE key = ?", evicted)
+                self._connection.executemany("DELETE FROM aliases WHERE target = ?", evicted)
+
+    def _load_alias(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._connection.execute("SELECT target FROM aliases WHERE key = ?", (key,)).fetchone()
+        return None if row is None else row[0]
+
+    def _store_alias(self, key: str, target: str):
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO aliases (key, target) VALUES (?, ?)", (key, target))
+            # a replaced row gets a new rowid: the smallest are the oldest stored
+            self._connection.execute("DELETE FROM aliases WHERE rowid IN (SELECT rowid FROM aliases "
+                                     "ORDER BY rowid DESC LIMIT -1 OFFSET ?)", (self.max_aliases,))
+
+    def _clear_aliases(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM aliases")
+
+    def delete(self, url: str):
+        key = self.key(url)
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM previews WHERE key = ?", (key,))
+            self._connection.execute("DELETE FROM aliases WHERE target = ?", (key,))
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM previews")
+        self._clear_aliases()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM previews").fetchone()[0]
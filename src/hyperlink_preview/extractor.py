@@ -0,0 +1,562 @@
+"""
+Html scanners: extract what a preview needs from a page (PageData).
+Parser backends:
+  - "html.parser": one pass of the python html.parser, without building a tree (the default, see default_parser).
+  - "bs4": BeautifulSoup tree with "html.parser" (the reference, slowest).
+  - "lxml": lxml tree (fastest), if lxml is installed. Opt-in: on malformed markup, lxml nests the tags as browsers
+    do (an unclosed <p> ends at the next block), so the paragraphs can differ from "bs4".
+"lxml" and "html.parser" can stop at a deadline: the page is then parsed up to where they are (truncated).
+
+Exemple:
+    page_data = extract(html, parser="lxml")
+"""
+
+import html
+import re
+import time
+from html.entities import html5
+from html.parser import HTMLParser
+from typing import Callable, Dict, Iterable, List, Optional, Set
+from bs4 import BeautifulSoup
+from . import utils
+
+try:
+    import lxml.html
+    import lxml.etree
+except ImportError:  # pragma: no cover
+    lxml = None
+
+class HeadScanner(HTMLParser):  # pylint: disable=abstract-method
+    """
+    Scans the beginning of a page to know when the rest is not needed for the preview:
+    either all og properties are found, or the <head> is over and gives what _parse_deeper_* need.
+
+    Exemple:
+        scanner = HeadScanner(HyperLinkPreview.properties)
+        for chunk in chunks:
+            scanner.feed(chunk)
+            if scanner.is_complete() or (scanner.head_ended and not scanner.needs_body()):
+                break
+    """
+    def __init__(self, properties: Iterable[str]):
+        super().__init__(convert_charrefs=True)
+        self.properties = set(properties)
+        self.found: Set[str] = set()  # og properties with a content
+        self.has_title = False
+        self.has_description = False  # <meta name="Description">
+        self.has_image_link = False  # <link rel="image_src">
+        self.head_ended = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "meta":
+            attributes = dict(attrs)
+            _property = attributes.get("property") or ""
+            if _property.startswith("og:") and _property[len("og:"):] in self.properties \
+                    and attributes.get("content") is not None:
+                self.found.add(_property[len("og:"):])
+            if attributes.get("name") == "Description" and attributes.get("content") is not None:
+                self.has_description = True
+        elif tag == "title":
+            self.has_title = True
+        elif tag == "link":
+            if "image_src" in (dict(attrs).get("rel") or "").split():
+                self.has_image_link = True
+        elif tag == "body":
+            self.head_ended = True
+
+    def handle_endtag(self, tag):
+        if tag == "head":
+            self.head_ended = True
+
+    def is_complete(self) -> bool:
+        """
+        Returns:
+            True if all og properties are found.
+        """
+        return self.found >= self.properties
+
+    def needs_body(self) -> bool:
+        """
+        Returns:
+            True if the title, the description or the image must be searched in the page body.
+        """
+        return ("title" not in self.found and not self.has_title) \
+            or ("description" not in self.found and not self.has_description) \
+            or ("image" not in self.found and not self.has_image_link)
+
+
+class PageData:
+    """
+    Small POD struct with everything the preview needs from a page.
+    """
+    def __init__(self):
+        self.og: Dict[str, str] = {}  # og properties with their content
+        self.description_meta: Optional[str] = None  # content of the first <meta name="Description">
+        self.title: Optional[str] = None  # text of the first <title>, None if no <title>
+        self.h1: Optional[str] = None
+        self.h2: Optional[str] = None
+        self.paragraphs: List[str] = []  # text of the visible <p>, until the description is complete
+        self.description = ""  # normalized text of paragraphs, at most DESCRIPTION_MAX_CHARS
+        self.image_link: Optional[str] = None  # href of the first <link rel="image_src">
+        self.canonical_link: Optional[str] = None  # href of the first <link rel="canonical">
+        self.img_srcs: List[str] = []  # src of the <img>
+        self.img_hints: List[Dict[str, str]] = []  # for each img_srcs: its IMG_HINT_ATTRIBUTES
+        self.truncated = False  # True if the parse stopped at its deadline, before the end of the page
+
+    def __repr__(self):
+        return str(self.__dict__)
+
+# Same rules as BeautifulSoup with "html.parser", for the tags text to be the same:
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'keygen', 'link', 'menuitem', 'meta',
+             'param', 'source', 'track', 'wbr', 'basefont', 'bgsound', 'command', 'frame', 'image', 'isindex',
+             'nextid', 'spacer'}
+HIDDEN_TEXT_TAGS = {'rt', 'rp', 'style', 'script', 'template'}  # their strings are not in the text of a tag
+PRESERVE_WHITESPACE_TAGS = {'pre', 'textarea'}
+ASCII_SPACES = '\x20\x0a\x09\x0c\x0d'
+IMG_HINT_ATTRIBUTES = ('width', 'height', 'srcset')  # to rank the images before probing them
+INVISIBLE_PARENTS = {'style', 'script', 'head', 'title', 'meta', '[document]'}  # as utils.tag_visible
+
+DESCRIPTION_MAX_CHARS = 1000
+PARSE_CHUNK_CHARS = 64 * 1024  # with a deadline, the page is parsed by chunks, the deadline checked between them
+_WORDS = re.compile(r"\S+")
+
+class DescriptionBuilder:
+    """
+    Builds the description from the text of the paragraphs, given in document order: the words are joined
+    by one space, and cut at max_chars. Once complete, the next paragraphs are ignored: extractors check
+    is_complete() to stop collecting them.
+    """
+    def __init__(self, max_chars: int = DESCRIPTION_MAX_CHARS):
+        self.max_chars = max_chars
+        self.paragraphs: List[str] = []  # the paragraphs used
+        self._words: List[str] = []
+        self._length = -1  # length of the words joined by spaces
+
+    def is_complete(self) -> bool:
+        return self._length >= self.max_chars
+
+    def add(self, text: str):
+        if self.is_complete():
+            return
+        self.paragraphs.append(text)
+        for word in _WORDS.finditer(text):  # lazy: a long paragraph is not split entirely
+            self._words.append(word.group())
+            self._length += len(self._words[-1]) + 1
+            if self._length >= self.max_chars:
+                return
+
+    def text(self) -> str:
+        return " ".join(self._words)[:self.max_chars]
+
+    def fill(self, page: PageData):
+        page.paragraphs = self.paragraphs
+        page.description = self.text()
+
+class _TextCollector:
+    """
+    Collects the text of an open tag.
+    """
+    def __init__(self, depth: int, skip_hidden: bool = False):
+        self.depth = depth  # index of the tag in the stack of open tags
+        self.skip_hidden = skip_hidden  # ignore the text of hidden elements (utils.is_hidden)
+        self.parts: List[str] = []
+
+class PageExtractor(HTMLParser):  # pylint: disable=abstract-method
+    """
+    Single pass extraction of the PageData, with the same result as searching a BeautifulSoup tree
+    (findAll("meta"), find("title"), findAll("p"), ...), but without building the tree.
+
+    Exemple:
+        page_data = PageExtractor.extract(html)
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.page = PageData()
+        self._stack: List[str] = []  # open tags
+        self._hidden_text_depth = 0  # number of open HIDDEN_TEXT_TAGS
+        self._hidden_depths: List[int] = []  # depths of the open hidden elements (utils.is_hidden)
+        self._preserve_whitespace_depth = 0
+        self._pending_data: List[str] = []
+        self._collectors: List[_TextCollector] = []
+        self._paragraph_collectors: Dict[_TextCollector, int] = {}  # collector -> index in self._paragraphs
+        self._paragraphs: List[Optional[str]] = []  # None until the <p> is closed
+        self._description = DescriptionBuilder()
+        self._description_index = 0  # next paragraph to give to self._description
+        self._title_collector: Optional[_TextCollector] = None
+        self._h1_collector: Optional[_TextCollector] = None
+        self._h2_collector: Optional[_TextCollector] = None
+        self._has_description_meta = False
+        self._already_closed_void_tags: List[str] = []
+
+    @staticmethod
+    def extract(html_text: str, deadline: Optional[float] = None) -> PageData:
+        """
+        Args:
+            deadline: time.monotonic() after which the parse stops (page.truncated).
+        """
+        extractor = PageExtractor()
+        if deadline is None:
+            extractor.feed(html_text)
+        else:
+            for start in range(0, len(html_text), PARSE_CHUNK_CHARS):
+                if time.monotonic() >= deadline:
+                    extractor.page.truncated = True
+                    break
+                extractor.feed(html_text[start:start + PARSE_CHUNK_CHARS])
+        extractor.close()
+        return extractor.page
+
+    def close(self):
+        super().close()
+        self._flush_data()
+        self._pop_to(0)
+        self._description.fill(self.page)
+
+    def handle_starttag(self, tag, attrs, handle_empty_element=True):  # pylint: disable=arguments-differ
+        self._flush_data()
+        attributes = {name: ("" if value is None else value) for name, value in attrs}
+        if tag == "meta":
+            self._handle_meta(attributes)
+        elif tag == "link":
+            if self.page.image_link is None and "image_src" in attributes.get("rel", "").split():
+                self.page.image_link = attributes.get("href")
+            if self.page.canonical_link is None and "canonical" in attributes.get("rel", "").lower().split():
+                self.page.canonical_link = attributes.get("href")
+        elif tag == "img":
+            if "src" in attributes:
+                self.page.img_srcs.append(attributes["src"])
+                self.page.img_hints.append(_img_hints(attributes))
+        if tag in VOID_TAGS:
+            if handle_empty_element:
+                self._already_closed_void_tags.append(tag)  # a later </tag> must be ignored
+            return
+
+        depth = len(self._stack)
+        hidden = utils.is_hidden(tag, attributes)
+        if tag == "p":
+            parent = self._stack[-1] if self._stack else "[document]"
+            if parent not in INVISIBLE_PARENTS and not hidden and not self._hidden_depths \
+                    and not self._description.is_complete():
+                collector = _TextCollector(depth, skip_hidden=True)
+                self._paragraph_collectors[collector] = len(self._paragraphs)
+                self._paragraphs.append(None)
+                self._collectors.append(collector)
+        elif tag == "title" and self.page.title is None and self._title_collector is None:
+            self._title_collector = _TextCollector(depth)
+            self._collectors.append(self._title_collector)
+        elif tag == "h1" and self.page.h1 is None and self._h1_collector is None:
+            self._h1_collector = _TextCollector(depth)
+            self._collectors.append(self._h1_collector)
+        elif tag == "h2" and self.page.h2 is None and self._h2_collector is None:
+            self._h2_collector = _TextCollector(depth)
+            self._collectors.append(self._h2_collector)
+
+        self._stack.append(tag)
+        if hidden:
+            self._hidden_depths.append(depth)
+        if tag in HIDDEN_TEXT_TAGS:
+            self._hidden_text_depth += 1
+        if tag in PRESERVE_WHITESPACE_TAGS:
+            self._preserve_whitespace_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, handle_empty_element=False)
+        self.handle_endtag(tag, check_already_closed=False)
+
+    def handle_endtag(self, tag, check_already_closed=True):  # pylint: disable=arguments-differ
+        if check_already_closed and tag in self._already_closed_void_tags:
+            self._already_closed_void_tags.remove(tag)
+            return
+        self._flush_data()
+        for index in range(len(self._stack) - 1, -1, -1):
+            if self._stack[index] == tag:
+                self._pop_to(index)
+                return
+
+    def handle_data(self, data):
+        self._pending_data.append(data)
+
+    def handle_entityref(self, name):
+        character = html5.get(name + ";")
+        self._pending_data.append(character if character is not None else "&" + name)
+
+    def handle_charref(self, name):
+        self._pending_data.append(html.unescape(f"&#{name};"))
+
+    def handle_comment(self, data):
+        self._flush_data()
+
+    def handle_decl(self, decl):
+        self._flush_data()
+
+    def handle_pi(self, data):
+        self._flush_data()
+
+    def unknown_decl(self, data):
+        self._flush_data()
+        if data.upper().startswith("CDATA["):
+            self._add_text(data[len("CDATA["):])
+
+    def _handle_meta(self, attributes: Dict[str, str]):
+        _property = attributes.get("property", "")
+        if _property.startswith("og:") and "content" in attributes:
+            self.page.og[_property[len("og:"):]] = attributes["content"]
+        if attributes.get("name") == "Description" and not self._has_description_meta:
+            self._has_description_meta = True
+            self.page.description_meta = attributes.get("content")
+
+    def _flush_data(self):
+        """
+        End the current string (as BeautifulSoup does, whitespace only strings are reduced to one char).
+        """
+        if not self._pending_data:
+            return
+        data = "".join(self._pending_data)
+        self._pending_data = []
+        if not self._preserve_whitespace_depth and not data.strip(ASCII_SPACES):
+            data = "\n" if "\n" in data else " "
+        if not self._hidden_text_depth:
+            self._add_text(data)
+
+    def _add_text(self, text: str):
+        for collector in self._collectors:
+            if not (collector.skip_hidden and self._hidden_depths):
+                collector.parts.append(text)
+
+    def _pop_to(self, depth: int):
+        """
+        Close the open tags, until the stack has depth tags.
+        """
+        while len(self._stack) > depth:
+            tag = self._stack.pop()
+            if tag in HIDDEN_TEXT_TAGS:
+                self._hidden_text_depth -= 1
+            if tag in PRESERVE_WHITESPACE_TAGS:
+                self._preserve_whitespace_depth -= 1
+            if self._hidden_depths and self._hidden_depths[-1] == len(self._stack):
+                self._hidden_depths.pop()
+            while self._collectors and self._collectors[-1].depth >= len(self._stack):
+                self._end_collector(self._collectors.pop())
+
+    def _end_collector(self, collector: _TextCollector):
+        text = "".join(collector.parts)
+        if collector in self._paragraph_collectors:
+            self._paragraphs[self._paragraph_collectors.pop(collector)] = text
+            # the description is built in document order: from the first paragraph not closed
+            while self._description_index < len(self._paragraphs) \
+                    and self._paragraphs[self._description_index] is not None:
+                self._description.add(self._paragraphs[self._description_index])
+                self._description_index += 1
+        elif collector is self._title_collector:
+            self.page.title = text
+        elif collector is self._h1_collector:
+            self.page.h1 = text
+        elif collector is self._h2_collector:
+            self.page.h2 = text
+
+def _img_hints(attributes) -> Dict[str, str]:
+    return {name: attributes[name] for name in IMG_HINT_ATTRIBUTES if name in attributes}
+
+def soup_page_data(soup) -> PageData:
+    """
+    Extraction of the PageData from a BeautifulSoup tree.
+
+    Args:
+        soup: a BeautifulSoup
+    """
+    page = PageData()
+    for one_meta_tag in soup.findAll("meta"):
+        try:
+            _property = one_meta_tag["property"]
+            if _property.startswith("og:"):
+                page.og[_property[len("og:"):]] = one_meta_tag["content"]
+        except: # pylint: disable=bare-except
+            pass # don't care if meta tag has no "content" attribute.
+    description_meta_tag = soup.find('meta', {"name": "Description"})
+    if description_meta_tag:
+        page.description_meta = description_meta_tag.get("content")
+    for name in ("title", "h1", "h2"):
+        tag = soup.find(name)
+        if tag:
+            setattr(page, name, tag.text)
+    description = DescriptionBuilder()
+    for one_p in soup.findAll('p'):
+        if description.is_complete():
+            break
+        if utils.tag_visible(one_p) and not any(utils.is_hidden(tag.name, tag.attrs)
+                                                for tag in (one_p, *one_p.parents)):
+            description.add(_soup_visible_text(one_p))
+    description.fill(page)
+    image_tag = soup.find('link', {"rel": "image_src"})
+    if image_tag:
+        page.image_link = image_tag.get("href")
+    canonical_tag = soup.find('link', {"rel": "canonical"})
+    if canonical_tag:
+        page.canonical_link = canonical_tag.get("href")
+    for one_tag in soup.findAll("img"):
+        try:
+            page.img_srcs.append(one_tag["src"])
+            page.img_hints.append(_img_hints(one_tag.attrs))
+        except:  # pylint: disable=bare-except
+            continue
+    return page
+
+
+def _soup_visible_text(tag) -> str:
+    """
+    Returns:
+        tag.text, without the strings in hidden elements (utils.is_hidden).
+    """
+    parts = []
+    for string in tag.strings:
+        parent = string.parent
+        while parent is not tag and not utils.is_hidden(parent.name, parent.attrs):
+            parent = parent.parent
+        if parent is tag:
+            parts.append(string)
+    return "".join(parts)
+
+def lxml_page_data(html_text: str, deadline: Optional[float] = None) -> PageData:
+    """
+    Extraction of the PageData from a lxml tree.
+
+    Args:
+        deadline: time.monotonic() after which the parse stops (page.truncated).
+    """
+    page = PageData()
+    try:
+        if deadline is None:
+            root = lxml.html.document_fromstring(html_text.encode("utf-8", errors="replace"),
+                                                 parser=_lxml_parser())
+        else:
+            root = _lxml_parse_until(html_text, deadline, page)
+    except (lxml.etree.ParserError, lxml.etree.XMLSyntaxError, ValueError):
+        return page  # empty document
+    has_description_meta = False
+    description = DescriptionBuilder()
+    for element in root.iter("meta", "title", "h1", "h2", "p", "link", "img"):
+        tag = element.tag
+        if tag == "meta":
+            _property = element.get("property") or ""
+            content = element.get("content")
+            if _property.startswith("og:") and content is not None:
+                page.og[_property[len("og:"):]] = content
+            if element.get("name") == "Description" and not has_description_meta:
+                has_description_meta = True
+                page.description_meta = content
+        elif tag == "p":
+            if description.is_complete():
+                continue
+            parent = element.getparent()
+            if parent is not None and parent.tag not in INVISIBLE_PARENTS \
+                    and not any(utils.is_hidden(one.tag, one.attrib) for one in (element, *element.iterancestors())):
+                description.add(_lxml_text(element, skip_hidden=True))
+        elif tag in ("title", "h1", "h2"):
+            if getattr(page, tag) is None:
+                text = _lxml_text(element)
+                if tag == "title":
+                    # lxml keeps the markup of a <title> as text, html.parser parses it
+                    text = _MARKUP_RE.sub("", text)
+                setattr(page, tag, text)
+        elif tag == "link":
+            if page.image_link is None and "image_src" in (element.get("rel") or "").split():
+                page.image_link = element.get("href")
+            if page.canonical_link is None and "canonical" in (element.get("rel") or "").lower().split():
+                page.canonical_link = element.get("href")
+        elif tag == "img":
+            src = element.get("src")
+            if src is not None:
+                page.img_srcs.append(src)
+                page.img_hints.append(_img_hints(element.attrib))
+    description.fill(page)
+    return page
+
+def _lxml_parse_until(html_text: str, deadline: float, page: PageData):
+    """
+    Feed a new lxml parser (the shared one is not for the feed interface) by chunks, until deadline.
+
+    Returns:
+        the root of the tree of what was fed.
+    """
+    parser = lxml.html.HTMLParser(encoding="utf-8")
+    for start in range(0, len(html_text), PARSE_CHUNK_CHARS):
+        if time.monotonic() >= deadline:
+            page.truncated = True
+            break
+        parser.feed(html_text[start:start + PARSE_CHUNK_CHARS].encode("utf-8", errors="replace"))
+    return parser.close()
+
+_LXML_PARSER = None
+_MARKUP_RE = re.compile(r"</?[a-zA-Z][^>]*>")
+
+def _lxml_parser():
+    global _LXML_PARSER  # pylint: disable=global-statement
+    if _LXML_PARSER is None:
+        _LXML_PARSER = lxml.html.HTMLParser(encoding="utf-8")
+    return _LXML_PARSER
+
+def _lxml_text(element, skip_hidden: bool = False) -> str:
+    """
+    Args:
+        skip_hidden: if True, the text of the hidden descendants (utils.is_hidden) is ignored.
+
+    Returns:
+        the text of a lxml element, with the same rules as BeautifulSoup Tag.text.
+    """
+    hidden = preserve = False
+    for ancestor in element.iterancestors():
+        hidden = hidden or ancestor.tag in HIDDEN_TEXT_TAGS
+        preserve = preserve or ancestor.tag in PRESERVE_WHITESPACE_TAGS
+    parts = []
+    # Iterative walk (pages can be deeper than the recursion limit): (node or text, hidden, preserve)
+    stack = [(element, hidden, preserve)]
+    while stack:
+        node, hidden, preserve = stack.pop()
+        if isinstance(node, str):
+            if not preserve and not node.strip(ASCII_SPACES):
+                node = "\n" if "\n" in node else " "
+            if not hidden:
+                parts.append(node)
+            continue
+        if not isinstance(node.tag, str):
+            continue  # comment or processing instruction
+        hidden = hidden or node.tag in HIDDEN_TEXT_TAGS \
+            or (skip_hidden and node is not element and utils.is_hidden(node.tag, node.attrib))
+        preserve = preserve or node.tag in PRESERVE_WHITESPACE_TAGS
+        for child in reversed(node):
+            if child.tail:
+                stack.append((child.tail, hidden, preserve))
+            stack.append((child, hidden, preserve))
+        if node.text:
+            stack.append((node.text, hidden, preserve))
+    return "".join(parts)
+
+PARSERS: Dict[str, Callable[..., PageData]] = {  # (html_text, deadline=None) -> PageData
+    "html.parser": PageExtractor.extract,
+    "bs4": lambda html_text, deadline=None: soup_page_data(BeautifulSoup(html_text, "html.parser")),
+}
+if lxml is not None:
+    PARSERS["lxml"] = lxml_page_data
+
+default_parser = "html.parser"  # pylint: disable=invalid-name
+
+def extract(html_text: str, parser: Optional[str] = None, deadline: Optional[float] = None) -> PageData:
+    """
+    Args:
+        parser: one of PARSERS keys. If None: default_parser.
+                If "lxml" is asked but not installed, "html.parser" is used.
+        deadline: time.monotonic() after which the parse stops, and the PageData is of the page parsed so far
+                  (page.truncated). Ignored by "bs4".
+
+    Raises:
+        ValueError: if parser is unknown.
+    """
+    if parser is None:
+        parser = default_parser
+    if parser == "lxml" and lxml is None:
+        parser = "html.parser"
+    try:
+        extract_function = PARSERS[parser]
+    except KeyError:
+        raise ValueError(f"Unknown parser [{parser}]: use one of {list(PARSERS)}") from None
+    return extract_function(html_text, deadline=deadline)
@@ -3,113 +3,653 @@ Parse an url preview data (base on Open Graph protocol, but not only)
 Instantiate a HyperLinkPreview object.
 """
 
+import codecs
+import copy
+from concurrent.futures import Future
+import itertools
 import logging
-import queue
-from threading import Thread, Lock, Event
-from typing import Dict, Optional
-from urllib.parse import urlparse
+import time
+from threading import RLock, Event
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import unquote, urljoin, urlparse
 import requests
-from bs4 import BeautifulSoup
+from requests.compat import chardet
 from . import utils
+from . import extractor
 from . import image_size
+from . import image_probe
+from . import image_cache as image_cache_module
+from . import instrumentation
+from . import normalization
+from . import parse_pool as parse_pool_module
+from . import session as session_module
+from . import sniffing
+from . import scheduler as scheduler_module
+from .scheduler import FetchScheduler
+from .cache import CacheEntry, PreviewCache, FRESH, STALE
+from .result import PreviewResult
+from .singleflight import SingleFlight
 
 logger = logging.getLogger('hyperlinkpreview')
 
+_previews_in_flight = SingleFlight()  # the previews fetching or parsing, by url and options (see coalesce)
+_probes_in_flight = SingleFlight()  # the images probed, by url
+
+def _copy_exception(ex: Exception) -> Exception:
+    """
+    Returns:
+        a copy of ex, without its traceback, for a follower to raise the error of its leader: raising the same
+        object in several threads would add their frames to its shared __traceback__.
+        A RuntimeError if ex cannot be copied.
+    """
+    try:
+        return copy.copy(ex)
+    except Exception:  # pylint: disable=broad-except
+        return RuntimeError(f"Preview failed: [{ex!r}]")
+
 class HyperLinkPreview:
     """
     Class to parse an url preview data (base on Open Graph protocol, but not only)
     Warning: constructor raises if url is not accessible: handle it.
+    The body of a link that is not a page (pdf, video...) is not downloaded: the preview is not valid.
+    A link to an image is its own preview: see direct_image.
     """
 
     properties = ['title', 'type', 'image', 'url', 'description', 'site_name']
+    fields_all = properties + ['domain']  # the keys of get_data
+    deeper_steps = ['url', 'domain', 'site_name', 'title', 'description', 'image']  # _parse_deeper_*, in order
+    _step_dependencies = {'domain': ['url'], 'site_name': ['url', 'domain']}
+    max_image_probes = 24  # images probed at most: the most promising ones (see image_probe.rank)
+    max_concurrent_images = 16  # images probed at the same time by a preview
+    image_probe_bytes = 64 * 1024  # bytes first requested (Range) to get the size of an image, more when needed
+    max_page_bytes = 10 * 1024 * 1024  # a longer page is cut (when max_bytes is not given)
+
+    def __init__(self, url:str, scheduler: Optional[FetchScheduler] = None,
+                 session: Optional[requests.Session] = None, cache: Optional[PreviewCache] = None,
+                 refresh_cache: bool = False, head_only: bool = False, max_bytes: Optional[int] = None,
+                 parser: Optional[str] = None, images_timeout: Optional[float] = None,
+                 image_cache: Optional[image_cache_module.ImageSizeCache] = None, timeout: Optional[float] = None,
+                 fetch_timeout: Optional[float] = None, parse_timeout: Optional[float] = None,
+                 observer: Optional[instrumentation.PreviewObserver] = None, fields: Optional[Iterable[str]] = None,
+                 parse_pool: Optional[parse_pool_module.ParsePool] = None, coalesce: bool = True):
+        """
+        Args:
+            url: the link to preview.
+            scheduler: the scheduler of the images probes. If None, the scheduler shared by all previews is
+                       used (see scheduler.get_default_scheduler): it bounds the probes of all previews together,
+                       per host too, and pauses the hosts answering 429 (Retry-After).
+            session: the requests.Session for the page and the images. If None, a pooled session shared by
+                     all previews is used (see session.get_default_session).
+            cache: if given, the data are taken from this cache when there (no fetch), and stored in it
+                   once fully parsed, found by the other urls of the page too (final_url, canonical_url).
+                   A stale entry is returned, and refreshed in background.
+                   An expired entry is revalidated with a conditional request (ETag / Last-Modified):
+                   if the page is not modified, its data are reused without parse.
+            refresh_cache: if True, the cache entry is revalidated even if fresh or stale.
+            head_only: if True, the page download stops once all og properties are found, or at the end
+                       of <head> when it has the title, the description and the image. The body is read
+                       only when needed to search them.
+            max_bytes: if given, at most max_bytes of the page are downloaded (and parsed).
+            parser: the html parser: "html.parser", "lxml" (fastest, if installed) or "bs4" (BeautifulSoup,
+                    slowest). If None, extractor.default_parser is used.
+            images_timeout: if given, max seconds to search the image when it must be probed among the
+                            <img> of the page: then the probes are cancelled, and the best image found so
+                            far is used (see image_search.timed_out).
+            image_cache: the cache of the probed images. If None, the cache shared by all previews is used
+                         (see image_cache.get_default_image_cache).
+            timeout: if given, max seconds of the whole preview: page fetch, parse and images search.
+            fetch_timeout: if given, max seconds to download the page. Once the response has started, the page
+                           is cut at the deadline (see is_partial), and parsed as is. With a deadline (this
+                           one or timeout), the request is not retried (see session.single_try).
+            parse_timeout: if given, max seconds to parse the page (see extractor.extract): the data are then
+                           taken from the part of the page parsed (see is_partial).
+            The images search is limited by images_timeout, and by what is left of timeout.
+            A partial result is not stored in the cache.
+            observer: receives the spans and counters of the preview (see instrumentation). If None, the
+                      default observer is used (see instrumentation.set_default_observer): none by default.
+            fields: if given, only these keys of the data are searched after the page parse (such as
+                    ["title", "domain"]: then no image is probed). The others are searched when first requested
+                    (see get_data). A preview with fields left unsearched is not stored in the cache.
+            parse_pool: the worker processes parsing the page. If None, the default pool is used (see
+                        parse_pool.set_default_parse_pool): none by default, the page is parsed in this thread.
+            coalesce: if True, a preview of the same url with the same options in flight in another thread is not
+                      fetched again: this preview waits for its result, and shares it (see shared), its image too
+                      once searched. The same for the probes of the same image by concurrent previews. The urls are
+                      compared by their key (see normalization.UrlNormalizer).
+
+        Raises:
+            - requests.exceptions.RequestException: if cannot get url (requests.exceptions.Timeout if the
+              response has not started before the deadline of the fetch)
+            - ValueError if no url or None, or unknown parser, or unknown field
+        """
+        self._init_state(url)
+        if fields is not None:
+            self.fields = self._check_fields(fields)
+        start = self._started
+        self.deadline = None if timeout is None else start + timeout
+        if parser is not None and parser not in extractor.PARSERS and parser != "lxml":
+            raise ValueError(f"Unknown parser [{parser}]")
+        self.parser = parser
+        self.images_timeout = images_timeout
+        self.parse_timeout = parse_timeout
+        if image_cache is not None:
+            self.image_cache = image_cache
+        if observer is not None:
+            self.observer = observer
+        if parse_pool is not None:
+            self.parse_pool = parse_pool
+        self.scheduler = scheduler if scheduler is not None else scheduler_module.get_default_scheduler()
+        self.session = session if session is not None else session_module.get_default_session()
+        self.cache = cache
+        self.head_only = head_only
+        self.max_bytes = max_bytes
+        self.fetched_bytes: Optional[int] = None  # bytes of the page downloaded
+        self._etag: Optional[str] = None
+        self._last_modified: Optional[str] = None
+        entry = None
+        if cache is not None:
+            if refresh_cache:
+                entry = cache.peek(url)
+            else:
+                entry, state = cache.lookup(url)
+                if state in (FRESH, STALE):
+                    instrumentation.report_count(self.observer, "cache_hits", url)
+                    self._load_cache_entry(entry)
+                    if state == STALE and cache.start_refresh(url):
+                        self._refresh_cache_in_background()
+                    return
+
+        self.coalesce = coalesce
+        if not coalesce:
+            self._fetch_and_parse(url, entry, fetch_timeout)
+            return
+        key = (normalization.get_default_normalizer().key(url), id(self.session), id(cache), refresh_cache, head_only,
+               max_bytes, parser, timeout, fetch_timeout, parse_timeout, images_timeout, tuple(self.fields))
+        flight, leader = _previews_in_flight.begin(key)
+        if not leader:
+            try:
+                leader_preview = flight.result()
+            except Exception as ex:  # pylint: disable=broad-except
+                raise _copy_exception(ex) from ex
+            self._follow(leader_preview)
+            return
+        try:
+            self._fetch_and_parse(url, entry, fetch_timeout)
+        except BaseException as ex:
+            _previews_in_flight.fail(key, flight, ex)
+            raise
+        # until its image is searched, this preview is shared with the previews of the same url
+        _previews_in_flight.succeed(key, flight, self, forget=False)
+        self.add_done_callback(lambda _: _previews_in_flight.forget(key, flight))
+
+    def _fetch_and_parse(self, url: str, entry: Optional[CacheEntry], fetch_timeout: Optional[float]):
+        """
+        Fetch the page (conditionally if entry), and parse it.
+
+        Raises:
+            requests.exceptions.RequestException: If cannot get url.
+        """
+        start = self._started
+        cache = self.cache
+        _html = self._fetch(url, entry, self._phase_deadline(start, fetch_timeout))
+        self.timings["fetch"] = time.monotonic() - start
+        instrumentation.report_span(self.observer, "fetch", url, start, content_type=self.content_type,
+                                    bytes=self.fetched_bytes, not_modified=_html is None)
+        instrumentation.report_count(self.observer, "page_bytes", url, self.fetched_bytes or 0)
+        if self.is_partial:
+            instrumentation.report_count(self.observer, "timeouts", url, phase="fetch")
+        if _html is None:
+            # 304 Not Modified: the cached data are still valid (the 304 may update the validators).
+            etag, last_modified = self._etag, self._last_modified
+            self._load_cache_entry(entry)
+            self._etag = etag or self._etag
+            self._last_modified = last_modified or self._last_modified
+            cache.count_not_modified()
+            instrumentation.report_count(self.observer, "not_modified", url)
+            self._store_in_cache()
+            return
+        if logger.getEffectiveLevel() <= logging.DEBUG:
+            logger.debug(f"fetched html size: {len(_html)}")
+
+        self._parse(_html)
+        if cache is not None:
+            self.add_done_callback(HyperLinkPreview._store_in_cache)
 
-    def __init__(self, url:str):
+    def _init_state(self, url: str):
         """
+        Init the members, before any fetch.
+
         Raises:
-            - requests.exceptions.RequestException: if cannot get url
             - ValueError if no url or None
         """
-        self.data_lock = Lock()
+        self.data_lock = RLock()
+        self._started = time.monotonic()
+        self.timings: Dict[str, float] = {}  # seconds of the phases done: fetch, parse, images, and total
+        self.parser: Optional[str] = None
+        self.images_timeout: Optional[float] = None
+        self.image_search: Optional[image_probe.ImageSearch] = None  # when the image is probed
+        self.coalesce = False
+        self.shared = False  # True if the result is the one of a concurrent preview of the same url (see coalesce)
+        self._images_started = 0.0
+        self.deadline: Optional[float] = None  # time.monotonic() of the end of the whole preview (timeout)
+        self.parse_timeout: Optional[float] = None
+        self.is_partial = False  # True if a deadline cut the page fetch, its parse, or the images search
+        self.content_type: Optional[str] = None  # media type of the response (see sniffing.media_type)
+        self.final_url: Optional[str] = None  # url of the page, after the redirects
+        self.canonical_url: Optional[str] = None  # <link rel="canonical"> or og:url, when on the site of the page
+        self.cache: Optional[PreviewCache] = None
+        self.direct_image: Optional[image_size.ImageSize] = None  # size of the image, when url is an image
+        self.image_cache = image_cache_module.get_default_image_cache()
+        self.observer = instrumentation.get_default_observer()
+        self.parse_pool = parse_pool_module.get_default_parse_pool()
+        self.fields: List[str] = HyperLinkPreview.fields_all  # searched after the page parse
+        self._page: Optional[extractor.PageData] = None  # kept while deeper steps are left (see fields)
+        self._resolved: Set[str] = set()  # the deeper steps done
         self.is_valid = False
         self.full_parsed = Event()
+        self._preview_reported = False  # the "preview" span is reported once (see _set_full_parsed)
+        self._done_callbacks: List[Callable[["HyperLinkPreview"], None]] = []
         self._datas: Dict[str, Optional[str]] = \
             {property: None for property in HyperLinkPreview.properties}
         if url is None or not url:
             raise ValueError("url is None")
-        _html = self._fetch(url)
-        if logger.getEffectiveLevel() <= logging.DEBUG:
-            logger.debug(f"fetched html size: {len(_html)}")
-
         self.link_url = url
-        self._parse(_html)
 
-    def get_data(self, wait_for_imgs=True):
+    def get_data(self, wait_for_imgs=True, timeout: Optional[float] = None,
+                 fields: Optional[Iterable[str]] = None) -> PreviewResult:
         """
         Args:
             wait_for_imgs: - if True, waits for the images parse before returning.
                              The image parse is when no image info in the head, and we need to parse the whole html for img tags.
                            - if False, retruns without waiting. Caller should check the 'image' value in the returned dict,
                              if it is None, another call to this method with wait_for_imgs=True is required to have the image.
+            timeout: if given with wait_for_imgs, max seconds to wait for the images parse: the data are then returned
+                     with the best image found so far, and marked partial. Only this wait ends: the search goes on
+                     for the other callers (and previews sharing it, see coalesce). Bound the search itself with
+                     images_timeout.
+            fields: the keys wanted (see fields_all), searched now if not yet (once: the results are kept).
+                    If None, the fields given to the constructor (all by default).
         Returns:
-            The data dict (a copy). Keys are ['title', 'type', 'image', 'url', 'description', 'site_name']
+            The data (a frozen mapping, see result.PreviewResult). Keys are ['title', 'type', 'image', 'url',
+            'description', 'site_name', 'domain'], or the fields when the constructor or this call restricts them.
+            Its is_partial is True if a deadline cut the preview (see is_partial), or if the wait timed out.
+
+        Raises:
+            ValueError: if unknown field.
         """
-        if wait_for_imgs:
-            self.full_parsed.wait()
-            with self.data_lock:
-                return self._datas.copy()
+        fields = self.fields if fields is None else self._check_fields(fields)
+        self._resolve(fields)
+        best_so_far = None
+        waited_out = wait_for_imgs and not self.full_parsed.wait(timeout)
+        if waited_out and self.image_search is not None:
+            best_so_far = self.image_search.best_image()
+
+        with self.data_lock:
+            datas = self._datas
+            if best_so_far is not None and datas["image"] is None:
+                datas = dict(datas, image=best_so_far)
+            is_partial = self.is_partial or waited_out
+            if fields is HyperLinkPreview.fields_all:
+                return PreviewResult(datas, is_partial=is_partial)
+            return PreviewResult({field: datas.get(field) for field in fields}, is_partial=is_partial)
+
+    @staticmethod
+    def _check_fields(fields: Iterable[str]) -> List[str]:
+        """
+        Raises:
+            ValueError: if unknown field.
+        """
+        fields = list(fields)
+        unknown = set(fields) - set(HyperLinkPreview.fields_all)
+        if unknown:
+            raise ValueError(f"Unknown fields {sorted(unknown)}: not in {HyperLinkPreview.fields_all}")
+        return fields
+
+    def _resolve(self, fields: Iterable[str]):
+        """
+        Run the deeper steps of fields (and the ones they depend on) that are not done yet. When the image step
+        starts an images search, the preview is not fully parsed until it ends.
+        """
+        with self.data_lock:
+            if self._page is None:
+                return
+            steps = set()
+            for field in fields:
+                if field in HyperLinkPreview.deeper_steps:
+                    steps.add(field)
+                    steps.update(HyperLinkPreview._step_dependencies.get(field, []))
+            steps -= self._resolved
+            if not steps:
+                return
+            if "image" in steps:
+                self.full_parsed.clear()
+            self._run_deeper_steps(steps)
+
+    def add_done_callback(self, callback: Callable[["HyperLinkPreview"], None]):
+        """
+        Args:
+            callback: called with this preview as argument, once fully parsed (images included).
+                      Called immediately if it is already the case.
+        """
+        with self.data_lock:
+            if not self.full_parsed.is_set():
+                self._done_callbacks.append(callback)
+                return
+        callback(self)
+
+    def _set_full_parsed(self):
+        """
+        The fields searched are done. The total timing runs up to the last phase done (an image searched when
+        first requested included). The "preview" span is reported the first time only.
+        """
+        with self.data_lock:
+            self.timings["total"] = time.monotonic() - self._started
+            self.full_parsed.set()
+            callbacks, self._done_callbacks = self._done_callbacks, []
+            report, self._preview_reported = not self._preview_reported, True
+        if report:
+            instrumentation.report_span(self.observer, "preview", self.link_url, self._started,
+                                        is_valid=self.is_valid, is_partial=self.is_partial)
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Error in preview done callback")
+
+    def _follow(self, leader: "HyperLinkPreview"):
+        """
+        Share the result of leader, the concurrent preview of the same url: its data now, its image once searched.
+        """
+        self.shared = True
+        instrumentation.report_count(self.observer, "coalesced", self.link_url)
+        with leader.data_lock:
+            self._copy_result(leader)
+        leader.add_done_callback(self._end_follow)
+
+    def _end_follow(self, leader: "HyperLinkPreview"):
+        with leader.data_lock:
+            self._copy_result(leader)
+        self._set_full_parsed()
+
+    def _copy_result(self, leader: "HyperLinkPreview"):
+        """
+        Must be called with leader.data_lock.
+        """
+        with self.data_lock:
+            self._datas = dict(leader._datas)  # pylint: disable=protected-access
+            for name in ("is_valid", "is_partial", "content_type", "final_url", "canonical_url", "direct_image",
+                         "fetched_bytes", "image_search", "_etag", "_last_modified", "_page"):
+                setattr(self, name, getattr(leader, name))
+            self._resolved = set(leader._resolved)  # pylint: disable=protected-access
+            self.timings = {phase: seconds for phase, seconds in leader.timings.items() if phase != "total"}
 
+    def _load_cache_entry(self, entry: CacheEntry):
         with self.data_lock:
-            return self._datas.copy()
+            self._datas = dict(entry.datas)
+            self.is_valid = entry.is_valid
+            self._etag = entry.etag
+            self._last_modified = entry.last_modified
+        self._set_full_parsed()
+
+    def _store_in_cache(self):
+        if self.is_partial or self._page is not None:
+            return
+        with self.data_lock:
+            entry = CacheEntry(self._datas.copy(), self.is_valid, etag=self._etag, last_modified=self._last_modified)
+        self.cache.set(self.link_url, entry, aliases=[url for url in (self.final_url, self.canonical_url) if url])
+
+    def _refresh_cache_in_background(self):
+        """
+        Revalidate the url, the new preview storing itself in the cache.
+        """
+        cache = self.cache
+
+        def end_refresh(preview: HyperLinkPreview):
+            cache.end_refresh(preview.link_url)
+
+        def refresh():
+            try:
+                preview = HyperLinkPreview(self.link_url, scheduler=self.scheduler, session=self.session,
+                                           cache=cache, refresh_cache=True)
+            except Exception as ex:  # pylint: disable=broad-except
+                logger.warning("Cannot refresh cache of [%s]: [%s]", self.link_url, ex)
+                cache.end_refresh(self.link_url)
+                return
+            preview.add_done_callback(end_refresh)
 
-    def _fetch(self, url: str) -> str:
+        self.scheduler.submit(self.link_url, refresh, group=self)
+
+    def _phase_deadline(self, start: float, phase_timeout: Optional[float]) -> Optional[float]:
+        """
+        Returns:
+            the deadline of a phase started at start: the earliest of its own and of the whole preview.
         """
+        deadlines = [deadline for deadline in (self.deadline, None if phase_timeout is None else start + phase_timeout)
+                     if deadline is not None]
+        return min(deadlines) if deadlines else None
+
+    def _fetch(self, url: str, cached: Optional[CacheEntry] = None, deadline: Optional[float] = None
+               ) -> Optional[str]:
+        """
+        Args:
+            cached: if given, the request is conditional on its validators.
+            deadline: time.monotonic() of the end of the download.
+
+        The body is read only if it is a page, the first bytes telling when the Content-Type doesn't
+        (see sniffing). When the url is an image, only its header is read, for its size (see _parse_image).
+
         Returns:
-            the html content of the given url
+            the html content of the given url ("" if not a page), None if cached is not modified.
 
         Raises:
             requests.exceptions.RequestException: If cannot get url.
         """
+        cut = None
         try:
-            return requests.get(url).text
+            headers = cached.validation_headers() if cached is not None else None
+            if deadline is None:
+                response = self.session.get(url, headers=headers, stream=True)
+            else:
+                with session_module.single_try():
+                    response = self.session.get(url, headers=headers, stream=True,
+                                                timeout=max(deadline - time.monotonic(), 0.001))
+                # the timeout bounds each read: a slow body is cut at the deadline
+                cut = self.scheduler.call_later(deadline - time.monotonic(), session_module.cut, response)
+            with response:
+                self.final_url = response.url
+                self.scheduler.defer_host_if_throttled(url, response)
+                self._etag = response.headers.get("ETag")
+                self._last_modified = response.headers.get("Last-Modified")
+                if response.status_code == 304 and cached is not None:
+                    return None
+                self.content_type = sniffing.media_type(response.headers.get("Content-Type"))
+                max_bytes = self.max_bytes if self.max_bytes is not None else self.max_page_bytes
+                kind = sniffing.kind_from_headers(self.content_type, response.headers.get("Content-Length"),
+                                                  max_bytes)
+                reader = image_size.ResponseReader(response)
+                if kind is None:
+                    reader.available(sniffing.SNIFF_BYTES)
+                    kind = sniffing.sniff(bytes(reader.data))
+                if kind == sniffing.IMAGE:
+                    self._parse_image(url, reader)
+                    return ""
+                if kind != sniffing.HTML:
+                    logger.info("Not a page: [%s] (%s)", url, self.content_type)
+                    return ""
+                return self._read_streaming(response, deadline, bytes(reader.data))
         except requests.exceptions.RequestException as ex:
             logging.error("Cannot fetch url [%s]: [%s]", url, ex)
+            if isinstance(ex, requests.exceptions.Timeout):
+                instrumentation.report_count(self.observer, "timeouts", url, phase="fetch")
             raise ex
+        finally:
+            if cut is not None:
+                cut.cancel()
+
+    def _read_streaming(self, response: requests.Response, deadline: Optional[float] = None,
+                        first_bytes: bytes = b'') -> str:
+        """
+        Read the page by chunks, until max_bytes (or max_page_bytes), or until the rest of the page is not
+        needed (head_only), or until deadline (then is_partial: the response is cut at the deadline, or the read
+        stops at the first chunk after it).
+
+        Args:
+            first_bytes: the start of the page, already read from the response (to sniff it).
+
+        Returns:
+            the html content read.
+        """
+        scanner = extractor.HeadScanner(HyperLinkPreview.properties) if self.head_only else None
+        encoding = response.encoding
+        try:
+            decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+        except LookupError:
+            encoding = "utf-8"
+            decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        max_bytes = self.max_bytes if self.max_bytes is not None else self.max_page_bytes
+        chunks = []
+        read = 0
+        # when cut, the chunk in progress is lost: smaller chunks keep more of a slow page
+        chunk_size = 16 * 1024 if deadline is None else 1024
+        try:
+            for chunk in itertools.chain([first_bytes] if first_bytes else [], response.iter_content(chunk_size)):
+                if read + len(chunk) > max_bytes:
+                    chunk = chunk[:max_bytes - read]
+                chunks.append(chunk)
+                read += len(chunk)
+                if scanner is not None:
+                    scanner.feed(decoder.decode(chunk))
+                    if scanner.is_complete() or scanner.head_ended:
+                        if scanner.is_complete() or not scanner.needs_body():
+                            break
+                        scanner = None  # the body is needed: no more scan.
+                if read >= max_bytes:
+                    break
+                if deadline is not None and time.monotonic() >= deadline:
+                    self.is_partial = True
+                    break
+        except requests.exceptions.RequestException:
+            if deadline is None or time.monotonic() < deadline:
+                raise
+            self.is_partial = True  # the response was cut at the deadline (see _fetch)
+        self.fetched_bytes = read
+        content = b"".join(chunks)
+        if encoding is None:
+            encoding = chardet.detect(content)["encoding"] or "utf-8"
+        return str(content, encoding, errors="replace")
+
+    def _parse_image(self, url: str, reader: image_size.ResponseReader):
+        """
+        The url is an image: it is the image of the preview, its title is the file name.
+        Only the header of the image is read, for its size (direct_image).
+        """
+        self.fetched_bytes = reader.read_count
+        self._preview_image(url, image_size.get_size_and_format_from_reader(reader))
+
+    def _preview_image(self, url: str, size: Tuple[int, int, Optional[str]]):
+        """
+        The data of the preview of an image, from its width, height and format ((-1, -1, None) if not found).
+        """
+        width, height, image_format = size
+        with self.data_lock:
+            self.is_valid = True
+            if width != -1:
+                self.direct_image = image_size.ImageSize(url, width, height)
+                if self.image_cache is not None:
+                    self.image_cache.set(url, width, height, image_format)
+            self._datas["image"] = url
+            self._datas["title"] = unquote(urlparse(url).path.rsplit("/", 1)[-1]) or None
+            self._parse_deeper_url()
+            self._parse_deeper_domain()
+            self._parse_deeper_site_name()
 
     def _parse(self, html):
         """
         First parse og tags, then search deeper if some tags were not present.
         """
-        if not html:
-            self.full_parsed.set()
+        if not self._is_markup(html):
+            self._set_full_parsed()
             return
-        
+        with self.data_lock:
+            start = time.monotonic()
+            extract = extractor.extract if self.parse_pool is None else self.parse_pool.extract
+            page = extract(str(html), self.parser, self._phase_deadline(start, self.parse_timeout))
+            self._use_page(page, start)
+
+    @staticmethod
+    def _is_markup(html) -> bool:
+        """
+        Returns:
+            True if html starts with a tag (after the spaces): else, there is nothing to parse.
+        """
+        if not html:
+            return False
         i = 0
         html_len = len(html)
         skip_chars = ["\n", "\r", "\t", " "]
         while i < html_len and html[i] in skip_chars:
             i += 1
 
-        if not html[i] == "<" and not html[i + 1] == "<":
-            self.full_parsed.set()
-            return
-        with self.data_lock:
-            soup = BeautifulSoup(str(html), "html.parser")
-            self.is_valid = True
-            metas = soup.findAll("meta")
-            for one_meta_tag in metas:
-                _property = utils.has_og_property(one_meta_tag, HyperLinkPreview.properties)
-                if _property:
-                    try:
-                        self._datas[_property] = one_meta_tag["content"]
-                    except: # pylint: disable=bare-except
-                        pass # don't care if meta tag has no "content" attribute.
+        return html[i] == "<" or html[i + 1] == "<"
 
-            self._parse_deeper_url()
-            self._parse_deeper_domain()
-            self._parse_deeper_site_name()
-            self._parse_deeper_title(soup)
-            self._parse_deeper_description(soup)
-            self._parse_deeper_image(soup)
+    def _use_page(self, page: extractor.PageData, start: float):
+        """
+        Takes the data of the parsed page (under data_lock).
+
+        Args:
+            start: time.monotonic() when the parse started.
+        """
+        self.timings["parse"] = time.monotonic() - start
+        instrumentation.report_span(self.observer, "parse", self.link_url, start, parser=self.parser,
+                                    truncated=page.truncated)
+        if page.truncated:
+            instrumentation.report_count(self.observer, "timeouts", self.link_url, phase="parse")
+        self.is_valid = True
+        self.is_partial = self.is_partial or page.truncated
+        self.canonical_url = self._find_canonical_url(page)
+        for _property, content in page.og.items():
+            if _property in HyperLinkPreview.properties:
+                self._datas[_property] = content
+
+        self._page = page
+        self._resolve(self.fields)
+        if "image" not in self._resolved:
+            self._set_full_parsed()  # the image is searched when requested
+
+    def _find_canonical_url(self, page: extractor.PageData) -> Optional[str]:
+        """
+        Returns:
+            the canonical url of the page (<link rel="canonical">, else og:url), absolute, None if not on the site
+            of the page: a page of another site could claim any url (and take its place in the cache).
+        """
+        page_url = self.final_url or self.link_url
+        normalizer = self.cache.normalizer if self.cache is not None else normalization.get_default_normalizer()
+        for link in (page.canonical_link, page.og.get("url")):
+            if link and link.strip():
+                link = urljoin(page_url, link.strip())
+                if normalizer.same_site(link, page_url):
+                    return link
+        return None
+
+    def _run_deeper_steps(self, steps: Iterable[str]):
+        """
+        Run the given _parse_deeper_* steps on the page parsed, in the order of deeper_steps.
+        Must be called with self.data_lock. The page is released once all steps are done.
+        """
+        page = self._page
+        parse_deeper = {"url": self._parse_deeper_url, "domain": self._parse_deeper_domain,
+                        "site_name": self._parse_deeper_site_name, "title": lambda: self._parse_deeper_title(page),
+                        "description": lambda: self._parse_deeper_description(page),
+                        "image": lambda: self._parse_deeper_image(page)}
+        steps = set(steps)
+        for name in HyperLinkPreview.deeper_steps:
+            if name in steps and name not in self._resolved:
+                self._resolved.add(name)
+                start = time.monotonic()
+                parse_deeper[name]()
+                instrumentation.report_span(self.observer, f"parse.{name}", self.link_url, start)
+        if len(self._resolved) == len(HyperLinkPreview.deeper_steps):
+            self._page = None
 
     def _parse_deeper_url(self):
         url = self._datas["url"]
@@ -136,36 +676,27 @@ class HyperLinkPreview:
             pass
         self._datas["site_name"] = name
 
-    def _parse_deeper_title(self, soup: BeautifulSoup):
+    def _parse_deeper_title(self, page: extractor.PageData):
         title = self._datas["title"]
         if title:
             return
-        title_tag = soup.find('title')
-        if title_tag:
-            self._datas["title"] = title_tag.text
-            return
-        title_tag = soup.find('h1')
-        if title_tag:
-            self._datas["title"] = title_tag.text
-            return
-        title_tag = soup.find('h2')
-        if title_tag:
-            self._datas["title"] = title_tag.text
-            return
+        for title_text in (page.title, page.h1, page.h2):
+            if title_text is not None:
+                self._datas["title"] = title_text
+                return
 
-    def _parse_deeper_description(self, soup: BeautifulSoup):
+    def _parse_deeper_description(self, page: extractor.PageData):
         """
         If self.get_description() == None, search a description in:
           - <meta name="description">
           - then <meta name="twitter:description">
-          - then: 1000 first char of text in <p> tags.
+          - then: 1000 first char of visible text in <p> tags.
         """
         description = self._datas["description"]
         if description:
             return
-        description_meta_tag = soup.find('meta',  {"name": "Description"})
-        if description_meta_tag:
-            self._datas["description"] = str(description_meta_tag["content"]) # type: ignore
+        if page.description_meta is not None:
+            self._datas["description"] = page.description_meta
             return
 
         # usually twitter description are for subscription: it's not a description on the page.
@@ -175,74 +706,223 @@ class HyperLinkPreview:
         #     return
         # let's take the visible text from <p>:
 
-        p_tags = soup.findAll('p')
-        visible_p_tags = list(filter(utils.tag_visible, p_tags))
-        visible_text = " ".join(one_p.text.strip() for one_p in visible_p_tags)
-        visible_text = visible_text.replace("\n", " ")
-        visible_text = ' '.join(visible_text.split()) # remove multiple spaces
-        self._datas["description"] = visible_text[0:1000]
+        # (the extractor stopped collecting it after 1000 chars, and ignored hidden elements)
+        self._datas["description"] = page.description
 
-    def _parse_deeper_image(self, soup):
+    def _parse_deeper_image(self, page: extractor.PageData):
         image = self._datas["image"]
         if image:
-            self.full_parsed.set()
+            self._set_full_parsed()
             return
-        image_tag = soup.find('link',  {"rel": "image_src"})
-        if image_tag:
-            self._datas["image"] = image_tag["href"]
-            self.full_parsed.set()
+        if page.image_link is not None:
+            self._datas["image"] = page.image_link
+            self._set_full_parsed()
             return
 
-        # No image info provided. We'll search for all images, in a dedicated thread:
-        Thread(target=self._parse_deeper_image_in_tags, args=[soup]).start()
+        # No image info provided. We'll search for the biggest image:
+        self._scrape_images(self._get_image_candidates(page))
 
-    def _parse_deeper_image_in_tags(self, soup):
+    def _get_image_candidates(self, page: extractor.PageData) -> List[image_probe.ImageCandidate]:
+        """
+        Returns:
+            the images of the page (absolute urls), with the hints of their <img> tag.
+        """
+        candidates = []
+        for position, (src, hints) in enumerate(zip(page.img_srcs, page.img_hints)):
+            src = utils.get_img_url(src, utils.get_base_url(self.link_url))
+            if src is None:
+                continue
+            candidates.append(image_probe.ImageCandidate.from_tag(src, position, hints))
+        return candidates
+
+    def _create_image_search(self, candidates: List[image_probe.ImageCandidate]) -> image_probe.ImageSearch:
+        """
+        The images in the image cache are not probed (nor counted in max_image_probes).
+        """
+        known = []
+        to_probe = []
+        ranked = image_probe.rank(candidates)
+        for candidate in ranked:
+            entry = self.image_cache.get(candidate.url) if self.image_cache is not None else None
+            if entry is None:
+                to_probe.append(candidate)
+            elif not entry.is_negative():
+                known.append(image_size.ImageSize(candidate.url, entry.width, entry.height))
+        instrumentation.report_count(self.observer, "image_cache_hits", self.link_url, len(ranked) - len(to_probe))
+        self._images_started = time.monotonic()
+        deadline = self._phase_deadline(self._images_started, self.images_timeout)
+        self.image_search = image_probe.ImageSearch(to_probe[:self.max_image_probes], on_finish=self._end_image_parse,
+                                                    deadline=deadline, known=known)
+        return self.image_search
+
+    def _cache_image_size(self, search: image_probe.ImageSearch, url: str, status: int,
+                          size: Tuple[int, int, Optional[str]], truncated: bool = False):
+        """
+        Store the result of a probe in the image cache. A failure is stored only if it will be the same next
+        time: a client error (404...), or an image read without finding its size (not a probe cancelled by the end
+        of search, nor cut by the end of its range: see image_size.ResponseReader.truncated).
+        """
+        if self.image_cache is None:
+            return
+        width, height, image_format = size
+        if width != -1:
+            self.image_cache.set(url, width, height, image_format)
+        elif (status in (200, 206) and not truncated) or (400 <= status < 500 and status not in (408, 429)):
+            if not search.finished:
+                self.image_cache.set_failed(url)
+
+    def _scrape_images(self, candidates: List[image_probe.ImageCandidate]):
+        """
+        Starts the search of the best image among the most promising candidates (see image_probe), in the
+        scheduler tasks of this preview (its group). At most max_concurrent_images are probed at the same time.
+        The deadline of the search is a delayed call of the scheduler (no thread of its own).
+        """
+        search = self._create_image_search(candidates)
+        if search.deadline is not None:
+            expiry = self.scheduler.call_later(search.remaining_time(), search.expire)
+            self.add_done_callback(lambda _: expiry.cancel())
+        search.finish_if_done()
+        for _ in range(self.max_concurrent_images):
+            if not self._submit_next_probe(search):
+                break
+
+    def _submit_next_probe(self, search: image_probe.ImageSearch) -> bool:
+        """
+        Submit the probe of the next candidate to the scheduler. When done, the next one is submitted.
+
+        Returns:
+            False if there is no more candidate to probe.
+        """
+        candidate = search.next_candidate()
+        if candidate is None:
+            return False
+        future = self.scheduler.submit(candidate.url, self._probe_image, search, candidate, group=self)
+        future.add_done_callback(lambda _: self._after_probe(search, future))
+        return True
+
+    def _after_probe(self, search: image_probe.ImageSearch, future: Future):
+        """
+        The next probe is submitted when this one is over: now, or when the probe it follows is (see _probe_image).
+        """
+        following = None if future.cancelled() or future.exception() is not None else future.result()
+        if following is None:
+            self._submit_next_probe(search)
+        else:
+            following.add_done_callback(lambda _: self._submit_next_probe(search))
+
+    def _end_image_parse(self, candidates: image_size.ImageDataList):
         try:
-            src_queue = queue.Queue()
-            img_tags = soup.findAll("img")
-            candidates = image_size.ImageDataList()
-            for one_tag in img_tags:
-                try:
-                    src = one_tag["src"]
-                except:  # pylint: disable=bare-except
-                    continue
-                src = utils.get_img_url(src, utils.get_base_url(self.link_url))
-                if src is None:
-                    continue
-                src_queue.put(src)
-
-            for _ in range(16):
-                Thread(target=self.fetch_image_size, args=[src_queue, candidates], daemon=True).start()
-
-            src_queue.join()
             with self.data_lock:
                 self._datas["image"] = candidates.get_best_image()
+                self.is_partial = self.is_partial or self.image_search.timed_out
+                self.timings["images"] = time.monotonic() - self._images_started
+            instrumentation.report_span(self.observer, "images", self.link_url, self._images_started,
+                                        timed_out=self.image_search.timed_out)
+            if self.image_search.timed_out:
+                instrumentation.report_count(self.observer, "timeouts", self.link_url, phase="images")
         finally:
-            self.full_parsed.set()
+            self._set_full_parsed()
 
-    def fetch_image_size(self, src_queue, candidates: image_size.ImageDataList):
+    def _probe_image(self, search: image_probe.ImageSearch, candidate: image_probe.ImageCandidate
+                     ) -> Optional[Future]:
         """
-        Args:
-            src_queue: the queue containing all urls to image to fetch and get size.
-            candidates: the list to append images
+        Fetch the beginning of the image (Range request), and give its size to search (None if not found).
+        With coalesce, an image probed by a concurrent preview is not fetched again: its result is shared when
+        that probe ends, without holding a worker until then.
+        Never raises.
+
+        Returns:
+            None if the probe is over, else a future done when it is (the probe follows a concurrent one).
         """
+        start = time.monotonic()
+        if not self.coalesce:
+            self._end_probe(search, candidate, start, *self._fetch_image_size(search, candidate.url))
+            return None
+        flight, leader = _probes_in_flight.begin(candidate.url)
+        if not leader:
+            following: Future = Future()
+            flight.add_done_callback(lambda _: self._end_follow_probe(search, candidate, start, flight.result(),
+                                                                      following))
+            return following
+        status, result = None, None
         try:
-            while True:
-                src = src_queue.get(block=False)
-                # logging.debug(f"Start processing {src}")
-                try: # important to avoid dead lock of queue join.
-                    with requests.get(src, stream=True) as response:
-                        if response.status_code == 200:
-                            width, height = image_size.get_size(response)
-                            # logging.debug(f"Processing {src}: width: [{width}]")
-                            if width != -1:
-                                candidates.append(image_size.ImageSize(src, width, height))
-                except: # pylint: disable=bare-except
-                    # logging.debug(f"End processing {src}: exception")
-                    pass
-                finally:
-                    src_queue.task_done()
-
-        except queue.Empty:
-            # logging.debug(f"End processing: Queue empty")
+            status, result = self._fetch_image_size(search, candidate.url)
+        finally:
+            # a probe cut by the end of its search is not shared: the waiting ones probe by themselves
+            cut = result is None or (result[0] == -1 and search.finished)
+            _probes_in_flight.succeed(candidate.url, flight, None if cut else (status, result))
+        self._end_probe(search, candidate, start, status, result)
+        return None
+
+    def _end_follow_probe(self, search: image_probe.ImageSearch, candidate: image_probe.ImageCandidate,
+                          start: float, shared: Optional[Tuple], following: Future):
+        """
+        The probe followed by this one is over: its (status, result) is shared, else (None: it was cut by the end of
+        its search) the image is probed in a task of this preview. Then following is done.
+        """
+        if shared is not None or search.finished:
+            status, result = shared if shared is not None else (None, (-1, -1, None))
+            self._end_probe(search, candidate, start, status, result)
+            following.set_result(None)
+            return
+        try:
+            own = self.scheduler.submit(candidate.url, self._end_probe, search, candidate, start, group=self)
+        except RuntimeError:  # scheduler shut down
+            self._end_probe(search, candidate, start, None, (-1, -1, None))
+            following.set_result(None)
+            return
+        own.add_done_callback(lambda _: following.set_result(None))
+
+    def _end_probe(self, search: image_probe.ImageSearch, candidate: image_probe.ImageCandidate, start: float,
+                   status: Optional[int] = None, result: Optional[Tuple[int, int, Optional[str]]] = None):
+        """
+        Give the result of the probe of candidate to search (fetched now if None).
+        """
+        if result is None:
+            status, result = self._fetch_image_size(search, candidate.url)
+        size = image_size.ImageSize(candidate.url, result[0], result[1]) if result[0] != -1 else None
+        instrumentation.report_span(self.observer, "image_probe", candidate.url, start, status=status,
+                                    found=size is not None)
+        instrumentation.report_count(self.observer, "images_probed", self.link_url)
+        search.add_result(candidate, size)
+
+    def _fetch_image_size(self, search: image_probe.ImageSearch, url: str
+                          ) -> Tuple[Optional[int], Tuple[int, int, Optional[str]]]:
+        """
+        Returns:
+            the http status of the probe of url (None if no response), and the width, height and format of the
+            image ((-1, -1, None) if not found). Never raises.
+        """
+        status = None
+        result = (-1, -1, None)
+        truncated = False
+        responses: List[requests.Response] = []
+
+        def fetch_range(first: int, last: int) -> requests.Response:
+            headers = {"Range": f"bytes={first}-{last}"}
+            if search.deadline is None:
+                response = self.session.get(url, stream=True, headers=headers)
+            else:
+                with session_module.single_try():
+                    response = self.session.get(url, stream=True, headers=headers, timeout=search.remaining_time())
+            responses.append(response)
+            search.track(response)
+            return response
+
+        try:
+            response = fetch_range(0, self.image_probe_bytes - 1)
+            status = response.status_code
+            self.scheduler.defer_host_if_throttled(url, response)
+            if status in (200, 206):
+                # a header after the first range (large EXIF / ICC segments) is read with the next ranges
+                reader = image_size.ResponseReader(response, fetch_range=fetch_range)
+                result = image_size.get_size_and_format_from_reader(reader)
+                truncated = reader.truncated
+            self._cache_image_size(search, url, status, result, truncated)
+        except: # pylint: disable=bare-except
             pass
+        finally:
+            for response in responses:
+                search.untrack(response)
+                session_module.release(response)
+        return status, result
@@ -0,0 +1,163 @@
+"""
+Process wide cache of the probed images: url -> (width, height, format), shared by all previews, so an
+image (logo, hero image, sprite...) is probed once for all the pages of a site. Failed probes (404,
+unsupported type) are cached too, for a shorter time. Optionally persisted in a sqlite file.
+
+Exemple:
+    set_default_image_cache(ImageSizeCache(max_entries=100000, path="images.sqlite"))
+    hlp = HyperLinkPreview(url)  # images already probed by another preview are not fetched
+    print(get_default_image_cache().stats())
+"""
+
+import sqlite3
+import time
+from threading import Lock
+from typing import Dict, Optional
+from . import utils
+from .cache import LRUDict
+
+class ImageSizeEntry:
+    """
+    Small POD struct: the size of an image, or a failed probe (width and height -1, format None).
+    """
+    __slots__ = ("width", "height", "format", "stored_at")
+
+    def __init__(self, width: int, height: int, image_format: Optional[str], stored_at: Optional[float] = None):
+        self.width = width
+        self.height = height
+        self.format = image_format
+        self.stored_at = time.time() if stored_at is None else stored_at
+
+    def is_negative(self) -> bool:
+        return self.width == -1
+
+    def __repr__(self):
+        return f"ImageSizeEntry({self.width}x{self.height}, format={self.format}, stored_at={self.stored_at})"
+
+class ImageSizeCache:
+    """
+    LRU cache of image sizes, keyed on normalized url, in memory, and in a sqlite file if path is given
+    (then the entries evicted from memory are still found on disk).
+    """
+    def __init__(self, max_entries: int = 100000, ttl: float = 7 * 24 * 3600, negative_ttl: float = 3600,
+                 path: Optional[str] = None):
+        """
+        Args:
+            max_entries: max number of entries in memory (and on disk).
+            ttl: seconds an image size is valid.
+            negative_ttl: seconds a failed probe is valid.
+            path: the sqlite file to persist the entries. None to keep them in memory only.
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.path = path
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self._entries = LRUDict(max_entries)
+        self._lock = Lock()
+        self._connection = None
+        if path is not None:
+            self._connection = sqlite3.connect(path, check_same_thread=False)
+            with self._lock, self._connection:
+                self._connection.execute("CREATE TABLE IF NOT EXISTS image_sizes (key TEXT PRIMARY KEY, "
+                                         "width INTEGER, height INTEGER, format TEXT, stored_at REAL)")
+                self._connection.execute("CREATE INDEX IF NOT EXISTS image_sizes_stored_at "
+                                         "ON image_sizes (stored_at)")
+
+    def get(self, url: str) -> Optional[ImageSizeEntry]:
+        """
+        Returns:
+            the entry of url if valid (see ImageSizeEntry.is_negative), None if the image must be probed.
+        """
+        key = utils.normalize_url(url)
+        entry = self._entries.get(key)
+        if entry is None and self._connection is not None:
+            entry = self._load(key)
+            if entry is not None:
+                self._entries.set(key, entry)
+        if entry is not None:
+            age = time.time() - entry.stored_at
+            if age > (self.negative_ttl if entry.is_negative() else self.ttl):
+                entry = None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            elif entry.is_negative():
+                self.negative_hits += 1
+            else:
+                self.hits += 1
+        return entry
+
+    def set(self, url: str, width: int, height: int, image_format: Optional[str]):
+        """
+        Args:
+            width, height: the image size, -1 if the probe failed.
+            image_format: see image_size.get_size_and_format_from_reader. None if the probe failed.
+        """
+        key = utils.normalize_url(url)
+        entry = ImageSizeEntry(width, height, image_format)
+        self._entries.set(key, entry)
+        if self._connection is not None:
+            with self._lock, self._connection:
+                self._connection.execute("INSERT OR REPLACE INTO image_sizes (key, width, height, format, stored_at)"
+                                         " VALUES (?, ?, ?, ?, ?)", (key, width, height, image_format, entry.stored_at))
+                self._connection.execute("DELETE FROM image_sizes WHERE key IN (SELECT key FROM image_sizes "
+                                         "ORDER BY stored_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def set_failed(self, url: str):
+        """
+        Cache a failed probe: the image is not found, or its type is not supported.
+        """
+        self.set(url, -1, -1, None)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns:
+            the counters: hits, negative_hits (failed probes), misses, and size (number of entries in memory).
+        """
+        with self._lock:
+            return {"hits": self.hits, "negative_hits": self.negative_hits, "misses": self.misses,
+                    "size": len(self._entries)}
+
+    def clear(self):
+        self._entries.clear()
+        if self._connection is not None:
+            with self._lock, self._connection:
+                self._connection.execute("DELETE FROM image_sizes")
+
+    def close(self):
+        if self._connection is not None:
+            with self._lock:
+                self._connection.close()
+            self._connection = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _load(self, key: str) -> Optional[ImageSizeEntry]:
+        with self._lock:
+            row = self._connection.execute("SELECT width, height, format, stored_at FROM image_sizes WHERE key = ?",
+                                           (key,)).fetchone()
+        return None if row is None else ImageSizeEntry(*row)
+
+_default_image_cache: Optional[ImageSizeCache] = ImageSizeCache()
+_default_image_cache_lock = Lock()
+
+def get_default_image_cache() -> Optional[ImageSizeCache]:
+    """
+    Returns:
+        the cache shared by all previews, None if disabled.
+    """
+    with _default_image_cache_lock:
+        return _default_image_cache
+
+def set_default_image_cache(image_cache: Optional[ImageSizeCache]):
+    """
+    Args:
+        image_cache: the cache shared by all previews. None to disable the cache of images.
+    """
+    global _default_image_cache  # pylint: disable=global-statement
+    with _default_image_cache_lock:
+        _default_image_cache = image_cache
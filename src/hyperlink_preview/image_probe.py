@@ -0,0 +1,278 @@
+"""
+Choice of the images to probe among the <img> of a page, and early end of the probes.
+
+The candidates are ranked with cheap hints (width / height attributes, srcset descriptors, position in the
+page, file name): only the first max_probes are probed. The search ends as soon as a probed image clearly
+beats the candidates left, or when its deadline expires.
+
+Exemple:
+    search = ImageSearch(rank(candidates, max_probes=24), on_finish=lambda images: print(images.get_best_image()))
+    candidate = search.next_candidate()
+    while candidate is not None:
+        search.add_result(candidate, probe(candidate))  # probe returns an ImageSize, or None
+        candidate = search.next_candidate()
+"""
+
+from collections import deque
+import re
+import time
+from threading import Lock
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+from . import image_size
+
+UNKNOWN_AREA = 150 * 150  # area assumed for the ranking of an image without size hints
+_LENGTH = re.compile(r"\s*(\d+)\s*(px)?\s*$", re.IGNORECASE)
+_UNLIKELY_NAMES = re.compile(r"logo|icon|sprite|spacer|pixel|blank|avatar|badge|button|emoji|rating|loader|"
+                             r"spinner|transparent|1x1", re.IGNORECASE)
+_LIKELY_NAMES = re.compile(r"hero|cover|featured|poster|preview|share|og[-_]?image", re.IGNORECASE)
+
+def parse_length(value: Optional[str]) -> Optional[int]:
+    """
+    Returns:
+        the pixels of a width or height attribute ("300", "300px"), None if not in pixels ("50%").
+    """
+    if not value:
+        return None
+    match = _LENGTH.match(value)
+    return int(match.group(1)) if match else None
+
+def parse_srcset_width(srcset: Optional[str]) -> Optional[int]:
+    """
+    Returns:
+        the largest width descriptor of a srcset attribute ("a.jpg 320w, b.jpg 1024w" -> 1024), None if none.
+    """
+    widths = []
+    for item in (srcset or "").split(","):
+        parts = item.split()
+        if len(parts) >= 2 and parts[-1][-1:] in ("w", "W") and parts[-1][:-1].isdigit():
+            widths.append(int(parts[-1][:-1]))
+    return max(widths) if widths else None
+
+class ImageCandidate:
+    """
+    Small POD struct: the url of an <img>, with the hints of its tag.
+    """
+    __slots__ = ("url", "position", "width", "height", "srcset_width")
+
+    def __init__(self, url: str, position: int, width: Optional[int] = None, height: Optional[int] = None,
+                 srcset_width: Optional[int] = None):
+        self.url = url
+        self.position = position  # index of the <img> in the page
+        self.width = width
+        self.height = height
+        self.srcset_width = srcset_width
+
+    @staticmethod
+    def from_tag(url: str, position: int, attributes: Dict[str, str]) -> "ImageCandidate":
+        """
+        Args:
+            attributes: the width, height and srcset attributes of the <img> (if any).
+        """
+        return ImageCandidate(url, position, parse_length(attributes.get("width")),
+                              parse_length(attributes.get("height")), parse_srcset_width(attributes.get("srcset")))
+
+    def hinted_area(self) -> Optional[float]:
+        """
+        Returns:
+            the area of the image according to the hints, None if no hint.
+            With a single side, the image is supposed square.
+        """
+        ratio = self.height / self.width if self.width and self.height else 1
+        width = max(self.width or 0, self.srcset_width or 0)
+        if width:
+            return width * width * ratio
+        if self.height:
+            return self.height * self.height
+        return None
+
+    def is_unlikely(self) -> bool:
+        """
+        Returns:
+            True if the hints tell the image would not be chosen: too small (<= 50px), bad ratio (> 3),
+            or named like a logo, an icon, a spacer...
+        """
+        if (self.width is not None and self.width <= 50) or (self.height is not None and self.height <= 50):
+            return True
+        if self.width and self.height and max(self.width, self.height) / min(self.width, self.height) > 3:
+            return True
+        return bool(_UNLIKELY_NAMES.search(self._file_name()))
+
+    def rank_key(self):
+        area = self.hinted_area()
+        if area is None:
+            area = UNKNOWN_AREA
+        if _LIKELY_NAMES.search(self._file_name()):
+            area *= 2
+        return (self.is_unlikely(), -area, self.position)
+
+    def _file_name(self) -> str:
+        return urlsplit(self.url).path.rsplit("/", 1)[-1]
+
+    def __repr__(self):
+        return f"ImageCandidate({self.url}, position={self.position}, {self.width}x{self.height}, " \
+               f"srcset_width={self.srcset_width})"
+
+def rank(candidates: Iterable[ImageCandidate], max_probes: Optional[int] = None) -> List[ImageCandidate]:
+    """
+    Returns:
+        the candidates (without duplicated urls), most promising first, at most max_probes.
+    """
+    unique: Dict[str, ImageCandidate] = {}
+    for candidate in candidates:
+        unique.setdefault(candidate.url, candidate)
+    ranked = sorted(unique.values(), key=ImageCandidate.rank_key)
+    return ranked if max_probes is None else ranked[:max_probes]
+
+class ImageSearch:
+    """
+    Thread safe bookkeeping of the probes of ranked candidates. The search finishes when all candidates are
+    probed, or when a probed image clearly beats all candidates left (pending or in flight), or when expire()
+    is called (deadline). on_finish is then called once, with the images found: the responses still in flight
+    are closed, to cancel their probes.
+
+    A candidate left is clearly beaten by the best ok image when it is unlikely (see ImageCandidate.is_unlikely),
+    or when its hinted area is at most half of the best one. A candidate without hints is beaten only by
+    a large image (large_area).
+    """
+    clear_winner_factor = 2
+    large_area = 600 * 315
+
+    def __init__(self, candidates: List[ImageCandidate],
+                 on_finish: Callable[[image_size.ImageDataList], None], deadline: Optional[float] = None,
+                 known: Iterable[image_size.ImageSize] = ()):
+        """
+        Args:
+            candidates: ranked candidates (see rank), to probe.
+            on_finish: called once, when the search is finished.
+            deadline: time.monotonic() after which no probe is started.
+            known: the sizes of images that need no probe (cached).
+        """
+        self.images = image_size.ImageDataList()
+        for size in known:
+            self.images.append(size)
+        self.deadline = deadline
+        self.probes = 0  # number of candidates probed
+        self.timed_out = False
+        self.finished = False
+        self._on_finish = on_finish
+        self._pending = deque(candidates)
+        self._in_flight: List[ImageCandidate] = []
+        self._responses = set()
+        self._lock = Lock()
+
+    def next_candidate(self) -> Optional[ImageCandidate]:
+        """
+        Returns:
+            the next candidate to probe (then call add_result), None if no more probe must be started.
+        """
+        with self._lock:
+            if self.finished or not self._pending or self._expired():
+                return None
+            candidate = self._pending.popleft()
+            self._in_flight.append(candidate)
+            return candidate
+
+    def add_result(self, candidate: ImageCandidate, size: Optional[image_size.ImageSize]):
+        """
+        Args:
+            size: the size of the candidate, None if not found.
+        """
+        with self._lock:
+            self._in_flight.remove(candidate)
+            self.probes += 1
+            if size is not None:
+                self.images.append(size)
+            left = self._pending or self._in_flight
+            finish = not self.finished and (self._expired() or not left or self._has_clear_winner())
+            if finish:
+                # the deadline passed before its expire() call (the workers of the scheduler were busy), or
+                # cut this probe
+                self.timed_out = self._expired() and (bool(left) or size is None) and not self._has_clear_winner()
+                self._set_finished()
+        if finish:
+            self._on_finish(self.images)
+
+    def expire(self):
+        """
+        Finish the search now (deadline): the best image found so far is used.
+        """
+        with self._lock:
+            if self.finished:
+                return
+            self.timed_out = True
+            self._set_finished()
+        self._on_finish(self.images)
+
+    def finish_if_done(self):
+        """
+        Finish the search if there is no candidate to probe, or if a known image clearly beats them.
+        """
+        with self._lock:
+            finish = not self.finished and (not (self._pending or self._in_flight) or self._has_clear_winner())
+            if finish:
+                self._set_finished()
+        if finish:
+            self._on_finish(self.images)
+
+    def best_image(self) -> Optional[str]:
+        """
+        Returns:
+            the url of the best image found so far, None if none.
+        """
+        with self._lock:
+            return self.images.get_best_image()
+
+    def remaining_time(self) -> Optional[float]:
+        """
+        Returns:
+            the seconds before the deadline (at least a small positive value), None if no deadline.
+        """
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.001)
+
+    def track(self, response):
+        """
+        Remember a probe response, to close it if the search finishes before the probe.
+        """
+        with self._lock:
+            if not self.finished:
+                self._responses.add(response)
+                return
+        response.close()
+
+    def untrack(self, response):
+        with self._lock:
+            self._responses.discard(response)
+
+    def _expired(self) -> bool:
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def _has_clear_winner(self) -> bool:
+        best = image_size.ImageDataList.get_best_image_in_list(self.images.images_ok)
+        if best is None:
+            return False
+        for candidate in (*self._pending, *self._in_flight):
+            if candidate.is_unlikely():
+                continue
+            area = candidate.hinted_area()
+            if area is None:
+                if best.area_pixels < self.large_area:
+                    return False
+            elif best.area_pixels < self.clear_winner_factor * area:
+                return False
+        return True
+
+    def _set_finished(self):
+        """
+        Must be called with self._lock.
+        """
+        self.finished = True
+        self._pending.clear()
+        for response in self._responses:
+            try:
+                response.close()
+            except Exception:  # pylint: disable=broad-except
+                pass
+        self._responses.clear()
@@ -3,8 +3,9 @@ Get the size of a picture without reading the whole picture.
 """
 
 from operator import attrgetter
+import re
 import struct
-from typing import Optional, Tuple, List
+from typing import Callable, Optional, Tuple, List
 import logging
 from requests import Response
 
@@ -14,6 +15,8 @@ class ImageSize:
     """
     Small POD struct to store image url, and WxH
     """
+    __slots__ = ("url", "width", "height", "area_pixels", "ratio")
+
     def __init__(self, url: str, width: int, height:int):
         self.url = url
         self.width = width
@@ -87,73 +90,324 @@ def get_size(req: Response) -> Tuple[int, int]:
     Returns:
         (width, height). (-1, -1) if not found.
     """
+    return get_size_from_reader(ResponseReader(req))
+
+def get_size_and_format(req: Response) -> Tuple[int, int, Optional[str]]:
+    """
+    Same as get_size, with the image format: see get_size_and_format_from_reader.
+    """
+    return get_size_and_format_from_reader(ResponseReader(req))
+
+async def get_size_async(response) -> Tuple[int, int]:
+    """
+    Awaitable version of get_size, for an aiohttp response.
+    The body is read by growing chunks, until the header gives the size (or the 500KB limit is reached).
+
+    Args:
+        response: an aiohttp.ClientResponse whose body has not been read yet.
+
+    Returns:
+        (width, height). (-1, -1) if not found.
+    """
+    width, height, _ = await get_size_and_format_async(response)
+    return (width, height)
+
+async def get_size_and_format_async(response, first_bytes: bytes = b'') -> Tuple[int, int, Optional[str]]:
+    """
+    Same as get_size_async, with the image format: see get_size_and_format_from_reader.
+
+    Args:
+        first_bytes: the start of the body, already read from response.
+    """
+    data = BytesReader(first_bytes)
+    needed = 0
+    chunk_size = 1024
+    while True:
+        chunk = await response.content.read(chunk_size)
+        if not chunk:
+            data.complete = True
+            return get_size_and_format_from_reader(data)
+        data.feed(chunk)
+        chunk_size = min(chunk_size * 2, 64 * 1024)
+        if len(data.data) < needed:
+            continue  # the parse would stop at the same place
+        try:
+            return get_size_and_format_from_reader(data)
+        except NeedMoreData as ex:
+            if len(data.data) > 500 * 1024 + 64:
+                data.complete = True
+                return get_size_and_format_from_reader(data)
+            needed = ex.size
+
+PNG_SIGNATURE = b'\211PNG\r\n\032\n'
+MAX_HEADER_BYTES = 500 * 1024  # let's read only 500KB
+# start of frame markers of baseline, extended, progressive, lossless, (differential) huffman or arithmetic jpegs:
+JPEG_SOF_MARKERS = {0xc0, 0xc1, 0xc2, 0xc3, 0xc5, 0xc6, 0xc7, 0xc9, 0xca, 0xcb, 0xcd, 0xce, 0xcf}
+HEIF_BRANDS = {b'avif', b'avis', b'heic', b'heix', b'hevc', b'hevx', b'heim', b'heis', b'mif1', b'msf1'}
+
+def get_size_from_reader(data) -> Tuple[int, int]:
+    """
+    Args:
+        data: a ResponseReader or a BytesReader: the start of the image.
+
+    Returns:
+        (width, height). (-1, -1) if not found.
+
+    Raises:
+        NeedMoreData: if data is an incomplete BytesReader that does not hold enough bytes.
+    """
+    width, height, _ = get_size_and_format_from_reader(data)
+    return (width, height)
+
+def get_size_and_format_from_reader(data) -> Tuple[int, int, Optional[str]]:
+    """
+    Read only the header of the image: GIF, PNG, JPEG, WebP, AVIF / HEIF, BMP, ICO, TIFF or SVG.
+
+    Args:
+        data: a ResponseReader or a BytesReader: the start of the image.
+
+    Returns:
+        (width, height, format), format being "gif", "png", "jpeg", "webp", "avif", "heif", "bmp", "ico",
+        "tiff" or "svg". (-1, -1, None) if not found.
+
+    Raises:
+        NeedMoreData: if data is an incomplete BytesReader that does not hold enough bytes.
+    """
     try:
-        data = ResponseReader(req)
-        if data[0:len(b'GIF89a')] in (b'GIF87a', b'GIF89a'):
-            # GIFs
-            w, h = struct.unpack("<HH", data[6:10])
-            logger.debug(f"GIF size: {w}x{h}")
-            return (int(w), int(h))
-
-        if data[0:len(b'\211PNG\r\n\032\n')] == b'\211PNG\r\n\032\n' and data[12:16] == b'IHDR':
-            # PNGs
-            w, h = struct.unpack(">LL", data[16:24])
-            logger.debug(f"PNG size: {w}x{h}")
-            return (int(w), int(h))
-
-        if data[0:len(b'\211PNG\r\n\032\n')] == b'\211PNG\r\n\032\n':
-            # older PNGs?
-            w, h = struct.unpack(">LL", data[8:16])
-            logger.debug(f"old PNG size: {w}x{h}")
-            return (int(w), int(h))
-
-        if data[0:len(b'\377\330')] == b'\377\330':
-            # JPEG
-            off = 0
-            while off < 500 * 1024: # let's read only 500KB
-                while data[off] == 0xff:
-                    off = off + 1
-                mrkr = data[off]
-                off = off + 1
-                if mrkr == 0xd8:
-                    continue # SOI
-                if mrkr == 0xd9:
-                    break # EOI
-                if 0xd0 <= mrkr <= 0xd7:
-                    continue
-                if mrkr == 0x01:
-                    continue # TEM
-
-                length = data[off] << 8 | data[off+1]
-                off = off + 2
-
-                if mrkr == 0xc0:
-                    w = (data[off+3]<<8) | data[off+4]
-                    h = (data[off+1]<<8) | data[off+2]
-                    logger.debug(f"JPG size: {w}x{h}")
-                    return (int(w), int(h))
-                off = off + length - 2
+        image_format = None
+        if data.startswith(b'GIF87a') or data.startswith(b'GIF89a'):
+            image_format = "gif"
+            w, h = data.unpack_from("<HH", 6)
+        elif data.startswith(PNG_SIGNATURE):
+            image_format = "png"
+            if data.startswith(b'IHDR', 12):
+                w, h = data.unpack_from(">LL", 16)
+            else:
+                # older PNGs?
+                w, h = data.unpack_from(">LL", 8)
+        elif data.startswith(b'\377\330'):
+            image_format = "jpeg"
+            w, h = _jpeg_size(data)
+        elif data.startswith(b'RIFF') and data.startswith(b'WEBP', 8):
+            image_format = "webp"
+            w, h = _webp_size(data)
+        elif data.startswith(b'ftyp', 4):
+            image_format = _heif_format(data)
+            w, h = _heif_size(data) if image_format else (-1, -1)
+        elif data.startswith(b'BM'):
+            image_format = "bmp"
+            w, h = _bmp_size(data)
+        elif data.startswith(b'\0\0\1\0'):
+            image_format = "ico"
+            w, h = _ico_size(data)
+        elif data.startswith(b'II*\0') or data.startswith(b'MM\0*'):
+            image_format = "tiff"
+            w, h = _tiff_size(data)
+        else:
+            image_format = "svg"
+            w, h = _svg_size(data)
+        if w > 0 and h > 0:
+            logger.debug(f"{image_format} size: {w}x{h}")
+            return (int(w), int(h), image_format)
 
     except StopIteration:
         pass
     logger.error("Image type not supported")
+    return (-1, -1, None)
+
+def _jpeg_size(data) -> Tuple[int, int]:
+    off = 0
+    while off < MAX_HEADER_BYTES:
+        while data[off] == 0xff:
+            off = off + 1
+        mrkr = data[off]
+        off = off + 1
+        if mrkr == 0xd8:
+            continue # SOI
+        if mrkr == 0xd9:
+            break # EOI
+        if 0xd0 <= mrkr <= 0xd7:
+            continue
+        if mrkr == 0x01:
+            continue # TEM
+
+        length, = data.unpack_from(">H", off)
+        off = off + 2
+
+        if mrkr in JPEG_SOF_MARKERS:
+            h, w = data.unpack_from(">HH", off + 1)
+            return (w, h)
+        off = off + length - 2
+    return (-1, -1)
+
+def _webp_size(data) -> Tuple[int, int]:
+    if data.startswith(b'VP8 ', 12):
+        # lossy: frame tag (3 bytes), start code (3 bytes), then 14 bits width and height
+        w, h = data.unpack_from("<HH", 26)
+        return (w & 0x3fff, h & 0x3fff)
+    if data.startswith(b'VP8L', 12):
+        # lossless: signature byte, then 14 bits width - 1 and height - 1
+        bits, = data.unpack_from("<L", 21)
+        return ((bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1)
+    if data.startswith(b'VP8X', 12):
+        # extended: flags (4 bytes), then 24 bits canvas width - 1 and height - 1
+        w = data[24] | data[25] << 8 | data[26] << 16
+        h = data[27] | data[28] << 8 | data[29] << 16
+        return (w + 1, h + 1)
     return (-1, -1)
 
-class ResponseReader:
+def _heif_format(data) -> Optional[str]:
     """
-    Class to access byte(s) in a response of a requests.get(stream=True).
-    Bytes are read when need by chunk of 32 bytes.
+    Returns:
+        "avif" or "heif" according to the brands of the ftyp box (major, then compatibles), None if it's not
+        an image (a video for instance).
+    """
+    size, = data.unpack_from(">L", 0)
+    for off in [8] + list(range(16, min(size, 256), 4)):
+        brand = data[off:off + 4]
+        if brand in HEIF_BRANDS:
+            return "avif" if brand.startswith(b'avi') else "heif"
+    return None
 
-    Exemple:
-        r = requests.get(url, stream=True)
-        data = ResponseReader(r)
-        data[12]
-        data[0:12]
+def _heif_size(data) -> Tuple[int, int]:
     """
-    def __init__(self, req: Response):
-        self.req = req
-        self.read_count = 0 # number of bytes read
-        self.data = b''
+    The size is in the "ispe" property of the primary item: meta > iprp > ipco > ispe.
+    When there are several (thumbnails, alpha...), the largest one is taken.
+    """
+    sizes = []
+    # stack of (offset of the next box, end of its parent box)
+    boxes = [(0, MAX_HEADER_BYTES)]
+    while boxes:
+        off, end = boxes.pop()
+        if off + 8 > end:
+            continue
+        size, box_type = data.unpack_from(">L4s", off)
+        header = 8
+        if size == 1:
+            size, = data.unpack_from(">Q", off + 8)
+            header = 16
+        elif size == 0:
+            size = end - off
+        if size < header:
+            break
+        if off + size < end:
+            boxes.append((off + size, end))  # next sibling, after the children
+        if box_type == b'meta':
+            boxes.append((off + header + 4, min(off + size, end)))  # full box: version and flags
+        elif box_type in (b'iprp', b'ipco'):
+            boxes.append((off + header, min(off + size, end)))
+        elif box_type == b'ispe':
+            sizes.append(data.unpack_from(">LL", off + header + 4))
+        elif box_type == b'mdat' and sizes:
+            break
+    return max(sizes, key=lambda size: size[0] * size[1], default=(-1, -1))
+
+def _bmp_size(data) -> Tuple[int, int]:
+    header_size, = data.unpack_from("<L", 14)
+    if header_size == 12:
+        return data.unpack_from("<HH", 18)  # OS/2 BITMAPCOREHEADER
+    w, h = data.unpack_from("<ll", 18)
+    return (w, abs(h))  # the height is negative for top-down bitmaps
+
+def _ico_size(data) -> Tuple[int, int]:
+    count, = data.unpack_from("<H", 4)
+    best = (-1, -1)
+    for index in range(min(count, 64)):
+        w, h = data.unpack_from("<BB", 6 + 16 * index)
+        w, h = w or 256, h or 256  # 0 means 256
+        if w * h > best[0] * best[1]:
+            best = (w, h)
+    return best
+
+def _tiff_size(data) -> Tuple[int, int]:
+    endian = "<" if data.startswith(b'II') else ">"
+    ifd, = data.unpack_from(endian + "L", 4)
+    if ifd > MAX_HEADER_BYTES:
+        return (-1, -1)
+    count, = data.unpack_from(endian + "H", ifd)
+    values = {}
+    for index in range(count):
+        tag, value_type = data.unpack_from(endian + "HH", ifd + 2 + 12 * index)
+        if tag in (256, 257):  # ImageWidth, ImageLength: SHORT or LONG
+            values[tag], = data.unpack_from(endian + ("H" if value_type == 3 else "L"), ifd + 2 + 12 * index + 8)
+            if len(values) == 2:
+                return (values[256], values[257])
+    return (-1, -1)
+
+_SVG_MARKUP = re.compile(br'\s*<')
+_SVG_START = re.compile(br'\s*(<\?xml[^>]*>\s*)?(<!--.*?-->\s*|<!DOCTYPE[^>]*>\s*)*<svg\b([^>]*)>', re.DOTALL)
+_SVG_ATTRIBUTE = re.compile(r'([\w:-]+)\s*=\s*("[^"]*"|\'[^\']*\')')
+_SVG_LENGTH = re.compile(r'\s*([0-9]*\.?[0-9]+)\s*(px|pt|pc|in|cm|mm)?\s*$')
+_SVG_UNITS = {None: 1, "px": 1, "pt": 4 / 3, "pc": 16, "in": 96, "cm": 96 / 2.54, "mm": 96 / 25.4}  # in px
+
+def _svg_size(data) -> Tuple[float, float]:
+    """
+    The size is in the width and height attributes of the <svg> tag (absolute units), or in its viewBox.
+    The bytes are read by growing steps, until the <svg> tag is complete.
+    """
+    start = 3 if data.startswith(b'\xef\xbb\xbf') else 0  # utf-8 BOM
+    match = None
+    for size in (1024, 8 * 1024, 64 * 1024):
+        available = data.available(start + size)
+        if not _SVG_MARKUP.match(data.data, start, available):
+            break  # not a markup
+        tag = data.data.find(b'<svg', start, available)
+        if tag != -1 and data.data.find(b'>', tag, available) != -1:
+            match = _SVG_START.match(data.data, start, available)
+            break
+        if available < start + size:
+            break  # end of content
+    if match is None:
+        return (-1, -1)
+    attributes = {name: value[1:-1] for name, value in
+                  _SVG_ATTRIBUTE.findall(match.group(3).decode("utf-8", errors="replace"))}
+
+    def length(name):
+        value = _SVG_LENGTH.match(attributes.get(name, ""))
+        return float(value.group(1)) * _SVG_UNITS[value.group(2)] if value else None
+
+    w, h = length("width"), length("height")
+    view_box = attributes.get("viewBox", "").replace(",", " ").split()
+    if len(view_box) == 4:
+        try:
+            box_w, box_h = float(view_box[2]), float(view_box[3])
+        except ValueError:
+            box_w = box_h = 0
+        if box_w > 0 and box_h > 0:
+            if w is None and h is None:
+                w, h = box_w, box_h
+            elif h is None:
+                h = w * box_h / box_w
+            elif w is None:
+                w = h * box_w / box_h
+    if w is None or h is None:
+        return (-1, -1)
+    return (round(w), round(h))
+
+class NeedMoreData(Exception):
+    """
+    Raised by an incomplete BytesReader when the requested bytes are not received yet.
+    """
+    def __init__(self, size: int = 0):
+        super().__init__(f"{size} bytes needed")
+        self.size = size  # number of bytes needed from the start
+
+class _BufferReader:
+    """
+    Base of the readers: the bytes received so far are in a growable buffer (bytearray), and the parsers
+    read them in place (struct.unpack_from), without copy. Subclasses implement _fill.
+    No memoryview of the buffer is kept: a bytearray with exported views cannot grow.
+    """
+    def __init__(self, data: bytes = b''):
+        self.data = bytearray(data)
+
+    @property
+    def read_count(self) -> int:
+        """
+        Returns:
+            the number of bytes received.
+        """
+        return len(self.data)
 
     def __getitem__(self, key):
         """
@@ -161,17 +415,164 @@ class ResponseReader:
             key: supported types: int: index, and slice with start and stop
         """
         if isinstance(key, int):
-            index = key
-        elif isinstance(key, slice):
+            if key < len(self.data):
+                return self.data[key]
+            self.ensure(key + 1)
+            return self.data[key]
+        if isinstance(key, slice):
             if key.start is None or key.stop is None:
                 raise IndexError("Key slice start or stop are None")
             if key.start > key.stop:
                 raise IndexError("Key slice start > stop")
-            index = key.stop
-        else:
-            raise IndexError(f"key type is [{type(key)}]. Only int and slice are supported")
+            self.ensure(key.stop)
+            return bytes(self.data[key])
+        raise IndexError(f"key type is [{type(key)}]. Only int and slice are supported")
+
+    def ensure(self, size: int):
+        """
+        Receive bytes until the buffer holds at least size bytes.
+
+        Raises:
+            StopIteration: if the content is shorter.
+            NeedMoreData: if the bytes are not received yet (BytesReader).
+        """
+        if size > len(self.data):
+            self._fill(size)
+
+    def startswith(self, prefix: bytes, offset: int = 0) -> bool:
+        """
+        Returns:
+            True if the bytes at offset are prefix. False if they are different, or if the content is shorter.
+        """
+        try:
+            self.ensure(offset + len(prefix))
+        except StopIteration:
+            return False
+        return self.data.startswith(prefix, offset)
+
+    def available(self, size: int) -> int:
+        """
+        Receive bytes until the buffer holds size bytes, or the end of the content.
+
+        Returns:
+            the number of bytes in the buffer (< size if the content is shorter).
+        """
+        try:
+            self.ensure(size)
+        except StopIteration:
+            pass
+        return len(self.data)
+
+    def unpack_from(self, fmt: str, offset: int = 0) -> tuple:
+        self.ensure(offset + struct.calcsize(fmt))
+        return struct.unpack_from(fmt, self.data, offset)
+
+    def _fill(self, size: int):
+        raise NotImplementedError
+
+_CONTENT_RANGE = re.compile(r"\s*bytes\s+(\d+)-(\d+)/(\d+|\*)\s*$", re.IGNORECASE)
+
+def parse_content_range(value: Optional[str]) -> Optional[Tuple[int, int, Optional[int]]]:
+    """
+    Args:
+        value: a Content-Range header ("bytes 0-65535/200000").
+
+    Returns:
+        (first byte, last byte, total length, None if unknown), None if no or invalid value.
+    """
+    match = _CONTENT_RANGE.match(value or "")
+    if match is None:
+        return None
+    return (int(match.group(1)), int(match.group(2)), None if match.group(3) == "*" else int(match.group(3)))
+
+class ResponseReader(_BufferReader):
+    """
+    Class to access byte(s) in a response of a requests.get(stream=True).
+    Bytes are read when needed, by chunks growing from first_chunk_size to max_chunk_size.
+    When the response is a range (206) that ends before the header of the image, the next range is requested
+    with fetch_range, up to MAX_HEADER_BYTES.
+
+    Exemple:
+        r = requests.get(url, stream=True)
+        data = ResponseReader(r)
+        data[12]
+        data[0:12]
+        data.unpack_from(">LL", 16)
+    """
+    def __init__(self, req: Response, first_chunk_size: int = 1024, max_chunk_size: int = 64 * 1024,
+                 fetch_range: Optional[Callable[[int, int], Optional[Response]]] = None):
+        """
+        Args:
+            fetch_range: returns the response (stream mode) of a request of the bytes first to last (included)
+                         of the same url. The caller closes it. If None, the image is read up to the end of req.
+        """
+        super().__init__()
+        self.req = req
+        self.max_chunk_size = max_chunk_size
+        self.fetch_range = fetch_range
+        self.truncated = False  # True if the range read ended before the image header, and before MAX_HEADER_BYTES
+        self._chunk_size = first_chunk_size
+
+    def _fill(self, size: int):
+        while len(self.data) < size:
+            chunk = self.req.raw.read(max(self._chunk_size, size - len(self.data)), decode_content=True)
+            if not chunk:
+                if not self._next_range():
+                    raise StopIteration
+                continue
+            self.data += chunk
+            self._chunk_size = min(self._chunk_size * 2, self.max_chunk_size)
+
+    def _next_range(self) -> bool:
+        """
+        The body of req ended. When it is a range that ends before the image (and before MAX_HEADER_BYTES),
+        the next range is requested: twice the bytes received.
+
+        Returns:
+            True if req is now the response of the next range.
+        """
+        received = len(self.data)
+        content_range = None
+        if self.req.status_code == 206:
+            content_range = parse_content_range(self.req.headers.get("Content-Range"))
+        if content_range is None or received >= MAX_HEADER_BYTES \
+                or (content_range[2] is not None and received >= content_range[2]):
+            return False  # the whole image, or the limit of the header
+        response = None
+        if self.fetch_range is not None:
+            response = self.fetch_range(received, min(2 * received, MAX_HEADER_BYTES) - 1)
+        next_range = None
+        if response is not None and response.status_code == 206:
+            next_range = parse_content_range(response.headers.get("Content-Range"))
+        if next_range is None or next_range[0] != received:
+            self.truncated = True
+            return False
+        self.req = response
+        return True
+
+class BytesReader(_BufferReader):
+    """
+    Same access as ResponseReader, but on bytes already received (for instance by an async client).
+
+    Exemple:
+        data = BytesReader(first_bytes)
+        data[12]  # raises NeedMoreData if len(first_bytes) < 13
+        data.feed(next_bytes)
+    """
+    def __init__(self, data: bytes, complete: bool = False):
+        """
+        Args:
+            data: the bytes received so far.
+            complete: True if data is the whole content: reading after the end then raises StopIteration
+                      (as ResponseReader does), instead of NeedMoreData.
+        """
+        super().__init__(data)
+        self.complete = complete
+
+    def feed(self, chunk: bytes):
+        self.data += chunk
 
-        while (index + 1) > self.read_count:
-            self.data = self.data + next(self.req.iter_content(32))
-            self.read_count = self.read_count + 32
-        return self.data[key]
+    def _fill(self, size: int):
+        if self.complete:
+            raise StopIteration
+        raise NeedMoreData(size)
@@ -0,0 +1,197 @@
+"""
+Instrumentation of the previews: an observer receives the spans (timed steps) and the counters of each preview.
+Without observer (the default), nothing is measured.
+
+Spans: "fetch" (page download), "parse" (html parse), "parse.<step>" (each _parse_deeper_* step: url, domain,
+site_name, title, description, image), "images" (search of the image among the <img>), "image_probe" (each image
+probed), "preview" (the whole preview).
+Counters: "page_bytes", "images_probed", "cache_hits" (preview cache), "not_modified" (304 revalidations),
+"image_cache_hits", "timeouts" (attribute phase: fetch, parse or images), "coalesced" (previews sharing
+the result of a concurrent one, see HyperLinkPreview coalesce).
+
+Adapters are given for OpenTelemetry (pip install hyperlink_preview[opentelemetry]) and Prometheus
+(pip install hyperlink_preview[prometheus]).
+
+Exemple:
+    instrumentation.set_default_observer(instrumentation.PrometheusObserver())
+    stats = instrumentation.StatsObserver()
+    hlp = HyperLinkPreview(url, observer=stats)
+    print(stats.stats())
+"""
+
+import logging
+import time
+from threading import Lock
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger('hyperlinkpreview')
+
+class PreviewObserver:
+    """
+    Receives the spans and counters of the previews (see the module doc). The methods do nothing: override
+    the ones needed. They are called by the threads of the previews and of the images probes: they must be
+    thread safe, and fast. An exception they raise is logged, and ignored.
+    """
+    def span(self, name: str, url: str, start: float, duration: float, attributes: Dict[str, Any]):
+        """
+        Args:
+            name: of the step (see the module doc).
+            url: the link previewed (for image_probe: the image probed).
+            start: time.monotonic() of the start of the step.
+            duration: seconds of the step.
+            attributes: details of the step, such as status and found for image_probe.
+        """
+
+    def count(self, name: str, value: int, url: str, attributes: Dict[str, Any]):
+        """
+        Args:
+            name: of the counter (see the module doc).
+            value: to add to the counter.
+            url: the link previewed.
+        """
+
+class StatsObserver(PreviewObserver):
+    """
+    Totals of the spans and counters, in memory: a simple observer to look at a batch of previews.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self.counters: Dict[str, int] = {}
+        self.spans: Dict[str, Dict[str, float]] = {}  # name -> count, total and max seconds
+
+    def span(self, name: str, url: str, start: float, duration: float, attributes: Dict[str, Any]):
+        with self._lock:
+            totals = self.spans.setdefault(name, {"count": 0, "total": 0.0, "max": 0.0})
+            totals["count"] += 1
+            totals["total"] += duration
+            totals["max"] = max(totals["max"], duration)
+
+    def count(self, name: str, value: int, url: str, attributes: Dict[str, Any]):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns:
+            a copy of the counters, and of the spans totals: {"counters": {...}, "spans": {...}}.
+        """
+        with self._lock:
+            return {"counters": dict(self.counters),
+                    "spans": {name: dict(totals) for name, totals in self.spans.items()}}
+
+class OpenTelemetryObserver(PreviewObserver):
+    """
+    Reports the spans as OpenTelemetry spans named "hyperlink_preview.<name>" (attribute url.full), and the
+    counters as OpenTelemetry counters named "hyperlink_preview.<name>".
+    """
+    def __init__(self, tracer_provider=None, meter_provider=None):
+        """
+        Args:
+            tracer_provider, meter_provider: if None, the global ones of opentelemetry are used.
+
+        Raises:
+            ImportError: if opentelemetry-api is not installed.
+        """
+        try:
+            from opentelemetry import metrics, trace  # pylint: disable=import-outside-toplevel
+        except ImportError as ex:
+            raise ImportError("opentelemetry-api is required for OpenTelemetryObserver: "
+                              "pip install hyperlink_preview[opentelemetry]") from ex
+        self.tracer = trace.get_tracer("hyperlink_preview", tracer_provider=tracer_provider)
+        self.meter = metrics.get_meter("hyperlink_preview", meter_provider=meter_provider)
+        self._counters: Dict[str, Any] = {}
+        self._lock = Lock()
+
+    def span(self, name: str, url: str, start: float, duration: float, attributes: Dict[str, Any]):
+        start_ns = int((time.time() - (time.monotonic() - start)) * 1e9)
+        span = self.tracer.start_span(f"hyperlink_preview.{name}", start_time=start_ns,
+                                      attributes=dict(_otel_attributes(attributes), **{"url.full": url}))
+        span.end(end_time=start_ns + int(duration * 1e9))
+
+    def count(self, name: str, value: int, url: str, attributes: Dict[str, Any]):
+        with self._lock:
+            counter = self._counters.get(name)
+            if counter is None:
+                counter = self.meter.create_counter(f"hyperlink_preview.{name}",
+                                                    unit="By" if name.endswith("bytes") else "1")
+                self._counters[name] = counter
+        counter.add(value, _otel_attributes(attributes))
+
+def _otel_attributes(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Returns:
+        the attributes that OpenTelemetry accepts (None values removed).
+    """
+    return {f"hyperlink_preview.{key}": value for key, value in attributes.items() if value is not None}
+
+class PrometheusObserver(PreviewObserver):
+    """
+    Reports the spans in the histogram <namespace>_span_seconds{span=name}, and the counters in
+    <namespace>_events_total{counter=name}. The url is not a label (unbounded number of values).
+    """
+    def __init__(self, registry=None, namespace: str = "hyperlink_preview"):
+        """
+        Args:
+            registry: the prometheus_client registry of the metrics. If None, the default one.
+
+        Raises:
+            ImportError: if prometheus_client is not installed.
+        """
+        try:
+            import prometheus_client  # pylint: disable=import-outside-toplevel
+        except ImportError as ex:
+            raise ImportError("prometheus_client is required for PrometheusObserver: "
+                              "pip install hyperlink_preview[prometheus]") from ex
+        kwargs = {} if registry is None else {"registry": registry}
+        self.durations = prometheus_client.Histogram(f"{namespace}_span_seconds", "Duration of the preview steps",
+                                                     ["span"], **kwargs)
+        self.events = prometheus_client.Counter(f"{namespace}_events", "Counters of the previews", ["counter"],
+                                                **kwargs)
+
+    def span(self, name: str, url: str, start: float, duration: float, attributes: Dict[str, Any]):
+        self.durations.labels(name).observe(duration)
+
+    def count(self, name: str, value: int, url: str, attributes: Dict[str, Any]):
+        self.events.labels(name).inc(value)
+
+def report_span(observer: Optional[PreviewObserver], name: str, url: str, start: float, **attributes):
+    """
+    Give the span of a step, from start (time.monotonic()) to now, to observer (if not None).
+    """
+    if observer is None:
+        return
+    try:
+        observer.span(name, url, start, time.monotonic() - start, attributes)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Error in preview observer")
+
+def report_count(observer: Optional[PreviewObserver], name: str, url: str, value: int = 1, **attributes):
+    """
+    Add value to the counter name of observer (if not None).
+    """
+    if observer is None or not value:
+        return
+    try:
+        observer.count(name, value, url, attributes)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("Error in preview observer")
+
+_default_observer: Optional[PreviewObserver] = None
+_default_observer_lock = Lock()
+
+def get_default_observer() -> Optional[PreviewObserver]:
+    """
+    Returns:
+        the observer of the previews that are not given one, None if none.
+    """
+    with _default_observer_lock:
+        return _default_observer
+
+def set_default_observer(observer: Optional[PreviewObserver]):
+    """
+    Args:
+        observer: the observer of the previews that are not given one. None to not instrument them.
+    """
+    global _default_observer  # pylint: disable=global-statement
+    with _default_observer_lock:
+        _default_observer = observer
@@ -0,0 +1,120 @@
+"""
+Normalization of the urls: the same page linked as http:// or https://, with or without www., with tracking
+parameters (utm_source...) or a fragment, gives the same cache key. The parameters stripped are configurable.
+
+Exemple:
+    normalizer = UrlNormalizer(strip_params=TRACKING_PARAMS | {"ref"})
+    normalizer.key("http://www.Example.com/post?utm_source=x&b=2&a=1#top")  # "https://example.com/post?a=1&b=2"
+    normalizer.clean("https://example.com/post?utm_source=x&id=3")  # "https://example.com/post?id=3"
+"""
+
+from threading import Lock
+from typing import Iterable, List, Optional
+from urllib.parse import unquote_plus, urlsplit, urlunsplit
+from . import utils
+
+# query parameters added by the sharing and ads platforms: they don't change the page
+TRACKING_PARAMS = frozenset({"fbclid", "gclid", "dclid", "gbraid", "wbraid", "msclkid", "yclid", "twclid", "igshid",
+                             "mc_cid", "mc_eid", "_ga", "_gl", "_hsenc", "_hsmi", "ref_src", "ref_url", "spm", "si"})
+TRACKING_PREFIXES = ("utm_", "pk_", "mtm_", "hsa_")
+
+class UrlNormalizer:
+    """
+    Canonical form of the urls (see the module doc), as utils.normalize_url plus:
+      - the tracking parameters are removed (clean and key),
+      - http and https, with or without www., give the same key (unless disabled),
+      - the order of the query parameters doesn't change the key.
+    """
+    def __init__(self, strip_params: Iterable[str] = TRACKING_PARAMS, strip_prefixes: Iterable[str] = TRACKING_PREFIXES,
+                 merge_schemes: bool = True, merge_www: bool = True):
+        """
+        Args:
+            strip_params: the query parameters removed (case insensitive).
+            strip_prefixes: the query parameters starting with one of them are removed too.
+            merge_schemes: if True, http:// and https:// urls have the same key.
+            merge_www: if True, the urls with and without "www." have the same key.
+        """
+        self.strip_params = frozenset(param.lower() for param in strip_params)
+        self.strip_prefixes = tuple(prefix.lower() for prefix in strip_prefixes)
+        self.merge_schemes = merge_schemes
+        self.merge_www = merge_www
+
+    def clean(self, url: str) -> str:
+        """
+        Returns:
+            url normalized (see utils.normalize_url), without the tracking parameters: the same page.
+        """
+        return self._rebuild(url, sort_query=False, merge=False)
+
+    def key(self, url: str) -> str:
+        """
+        Returns:
+            the canonical form of url: the same string for all the variants of an url. key(key(url)) == key(url).
+        """
+        return self._rebuild(url, sort_query=True, merge=True)
+
+    def same_site(self, url: str, other_url: str) -> bool:
+        """
+        Returns:
+            True if the urls have the same host (with or without www. if merge_www).
+        """
+        return self._host(url) == self._host(other_url) != ""
+
+    def _host(self, url: str) -> str:
+        try:
+            host = (urlsplit(url.strip()).hostname or "").lower()
+        except ValueError:
+            return ""
+        return host[len("www."):] if self.merge_www and host.startswith("www.") else host
+
+    def _rebuild(self, url: str, sort_query: bool, merge: bool) -> str:
+        url = utils.normalize_url(url)
+        try:
+            parts = urlsplit(url)
+        except ValueError:
+            return url
+        scheme, netloc = parts.scheme, parts.netloc
+        if merge and self.merge_schemes and scheme == "http":
+            scheme = "https"
+        if merge and self.merge_www and netloc.startswith("www."):
+            netloc = netloc[len("www."):]
+        params = self._kept_params(parts.query)
+        if sort_query:
+            params.sort()
+        return urlunsplit((scheme, netloc, parts.path, "&".join(params), ""))
+
+    def _kept_params(self, query: str) -> List[str]:
+        """
+        Returns:
+            the parameters of query ("name=value", as is) that are not tracking ones.
+        """
+        params = []
+        for param in query.split("&"):
+            if not param:
+                continue
+            name = unquote_plus(param.split("=", 1)[0]).lower()
+            if name in self.strip_params or name.startswith(self.strip_prefixes):
+                continue
+            params.append(param)
+        return params
+
+_default_normalizer = UrlNormalizer()
+_default_normalizer_lock = Lock()
+
+def get_default_normalizer() -> UrlNormalizer:
+    """
+    Returns:
+        the normalizer of the caches that are not given one, and of the previews coalescing (see HyperLinkPreview).
+    """
+    with _default_normalizer_lock:
+        return _default_normalizer
+
+def set_default_normalizer(normalizer: Optional[UrlNormalizer]):
+    """
+    Args:
+        normalizer: the normalizer of the caches created from now on that are not given one. None for the
+                    default one (UrlNormalizer()).
+    """
+    global _default_normalizer  # pylint: disable=global-statement
+    with _default_normalizer_lock:
+        _default_normalizer = normalizer if normalizer is not None else UrlNormalizer()
@@ -0,0 +1,113 @@
+"""
+Pool of processes parsing the pages: the html parse (see extractor.extract) is the cpu-bound part of a preview,
+serialized by the GIL when many previews run in threads. With a ParsePool, a page is sent to a worker process,
+which returns the small PageData: the fetches and images probes stay in the threads of the process.
+
+The pool is not used by default (a small page is parsed faster than sent to a process).
+
+Exemple:
+    parse_pool.set_default_parse_pool(parse_pool.ParsePool(processes=4))  # all previews
+    hlp = HyperLinkPreview(url, parse_pool=ParsePool())  # this preview
+"""
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import multiprocessing
+import sys
+from threading import Lock
+from typing import Optional
+from . import extractor
+
+logger = logging.getLogger('hyperlinkpreview')
+
+class ParsePool:
+    """
+    Parses the pages in worker processes (started on first use). Thread safe.
+    """
+    def __init__(self, processes: Optional[int] = None, min_chars: int = 32 * 1024, start_method: str = "spawn"):
+        """
+        Args:
+            processes: number of worker processes. If None, the number of cpus.
+            min_chars: the pages shorter than that are parsed in the calling thread (faster than sent to a worker).
+            start_method: of the worker processes (see multiprocessing.get_context). "spawn" by default: a forked
+                          process could inherit locks held by the threads of the previews. Ignored with python 3.6
+                          (the default one of the platform is used).
+        """
+        self.processes = processes
+        self.min_chars = min_chars
+        if sys.version_info >= (3, 7):
+            self._executor = ProcessPoolExecutor(max_workers=processes,
+                                                 mp_context=multiprocessing.get_context(start_method))
+        else:  # no mp_context before python 3.7
+            self._executor = ProcessPoolExecutor(max_workers=processes)
+        self._lock = Lock()
+        self._broken = False
+
+    def extract(self, html_text: str, parser: Optional[str] = None,
+                deadline: Optional[float] = None) -> extractor.PageData:
+        """
+        Same as extractor.extract, in a worker process when the page is long enough. If the pool is broken
+        (a worker died), the pages are parsed in the calling thread.
+        """
+        parser = parser or extractor.default_parser  # as set in this process
+        if len(html_text) < self.min_chars or self._broken:
+            return extractor.extract(html_text, parser, deadline)
+        try:
+            return self._executor.submit(extractor.extract, html_text, parser, deadline).result()
+        except (BrokenProcessPool, RuntimeError) as ex:  # RuntimeError: submit after shutdown
+            self._set_broken(ex)
+            return extractor.extract(html_text, parser, deadline)
+
+    async def extract_async(self, html_text: str, parser: Optional[str] = None,
+                            deadline: Optional[float] = None) -> extractor.PageData:
+        """
+        Same as extract, awaiting the worker process: the event loop runs during the parse.
+        """
+        parser = parser or extractor.default_parser  # as set in this process
+        if len(html_text) < self.min_chars or self._broken:
+            return extractor.extract(html_text, parser, deadline)
+        try:
+            return await asyncio.wrap_future(self._executor.submit(extractor.extract, html_text, parser, deadline))
+        except (BrokenProcessPool, RuntimeError) as ex:  # RuntimeError: submit after shutdown
+            self._set_broken(ex)
+            return extractor.extract(html_text, parser, deadline)
+
+    def _set_broken(self, ex: Exception):
+        with self._lock:
+            if not self._broken:
+                logger.warning("Parse pool unusable, pages are parsed in threads: [%s]", ex)
+            self._broken = True
+
+    def close(self):
+        """
+        Stop the worker processes.
+        """
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+_default_parse_pool: Optional[ParsePool] = None
+_default_parse_pool_lock = Lock()
+
+def get_default_parse_pool() -> Optional[ParsePool]:
+    """
+    Returns:
+        the parse pool of the previews that are not given one, None if the pages are parsed in their threads.
+    """
+    with _default_parse_pool_lock:
+        return _default_parse_pool
+
+def set_default_parse_pool(pool: Optional[ParsePool]):
+    """
+    Args:
+        pool: the parse pool of the previews that are not given one. None to parse the pages in their threads.
+    """
+    global _default_parse_pool  # pylint: disable=global-statement
+    with _default_parse_pool_lock:
+        _default_parse_pool = pool
@@ -0,0 +1,68 @@
+"""
+The data of a preview, as returned by HyperLinkPreview.get_data and kept by the caches: a frozen read-only
+mapping, with a slot per field (no dict per instance). is_partial tells a deadline cut the data.
+
+Exemple:
+    data = hlp.get_data()
+    print(data["title"], data.image, data.is_partial)
+    json.dumps(data.to_dict())
+"""
+
+from collections.abc import Mapping
+from typing import Dict, Iterator, Optional, Tuple
+
+FIELDS = ('title', 'type', 'image', 'url', 'description', 'site_name', 'domain')
+
+class PreviewResult(Mapping):
+    """
+    Frozen mapping field -> value (str, or None if not found), of the fields it was built with (see FIELDS),
+    in the order of FIELDS. Compares equal to a dict of the same items (is_partial is not an item).
+    """
+    __slots__ = FIELDS + ('_keys', 'is_partial')
+
+    def __init__(self, datas: Optional[Dict[str, Optional[str]]] = None, is_partial: bool = False,
+                 **fields: Optional[str]):
+        """
+        Args:
+            datas, fields: the values of the fields. The keys that are not in FIELDS are ignored.
+            is_partial: True if a deadline cut the data (see HyperLinkPreview.get_data).
+        """
+        object.__setattr__(self, "is_partial", is_partial)
+        if datas is not None:
+            fields = dict(datas, **fields)
+        keys = tuple(key for key in FIELDS if key in fields)
+        object.__setattr__(self, "_keys", FIELDS if keys == FIELDS else keys)
+        for key in FIELDS:
+            object.__setattr__(self, key, fields.get(key))
+
+    def __getitem__(self, key: str) -> Optional[str]:
+        if key not in self._keys:  # pylint: disable=unsupported-membership-test
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._keys)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"PreviewResult is frozen: cannot set [{name}]")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"PreviewResult is frozen: cannot delete [{name}]")
+
+    def __reduce__(self) -> Tuple:
+        return (PreviewResult, (self.to_dict(), self.is_partial))
+
+    def to_dict(self) -> Dict[str, Optional[str]]:
+        """
+        Returns:
+            a dict of the fields (to serialize in json, or to modify).
+        """
+        return {key: getattr(self, key) for key in self._keys}  # pylint: disable=not-an-iterable
+
+    def __repr__(self):
+        if self.is_partial:
+            return f"PreviewResult({self.to_dict()}, is_partial=True)"
+        return f"PreviewResult({self.to_dict()})"
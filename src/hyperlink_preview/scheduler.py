@@ -0,0 +1,312 @@
+"""
+Scheduler running the fetches (pages and images) on a fixed number of threads,
+with a limit of simultaneous fetches per host, a pause of the hosts that ask for it (Retry-After),
+and a fair share of the workers between the previews.
+"""
+
+from collections import deque, OrderedDict
+from concurrent.futures import Future
+from email.utils import parsedate_to_datetime
+import heapq
+import itertools
+import logging
+from threading import Condition, Lock, Thread
+import time
+from typing import Callable, Deque, Dict, Hashable, List, Optional, Tuple
+from urllib.parse import urlparse
+
+logger = logging.getLogger('hyperlinkpreview')
+
+Task = Tuple[str, Callable, tuple, dict, Future]
+Delayed = Tuple[float, int, Callable, tuple, Future]  # time.monotonic() when due, sequence, fn, args, future
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Args:
+        value: a Retry-After header: seconds ("120"), or an http date ("Wed, 21 Oct 2015 07:28:00 GMT").
+
+    Returns:
+        the seconds to wait (>= 0), None if no or invalid value.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        date = parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+    if date is None:
+        return None
+    return max(date.timestamp() - time.time(), 0.0)
+
+class FetchScheduler:
+    """
+    Fixed pool of worker threads running fetch tasks.
+    At most max_concurrency tasks run at the same time, and at most per_host_limit for a given host:
+    tasks for a busy host wait in the queue, without blocking a worker. A host that answered 429 or 503
+    is paused (see defer_host): its tasks wait until the end of the pause.
+
+    The tasks are queued by group (a preview submits its images probes in its own group): the workers take
+    the tasks of the groups in turn, so a page with hundreds of images doesn't delay the other previews.
+
+    Short calls can be delayed (call_later, for the deadlines of the previews): the workers run them when due,
+    without a thread per call.
+
+    Exemple:
+        scheduler = FetchScheduler(max_concurrency=32, per_host_limit=4)
+        future = scheduler.submit(url, requests.get, url)
+        future.result()
+    """
+    default_retry_after = 1.0  # pause of a host answering 429 without Retry-After
+
+    def __init__(self, max_concurrency: int = 16, per_host_limit: int = 4, max_retry_after: float = 120,
+                 thread_name_prefix: str = "hlp-fetch"):
+        """
+        Args:
+            max_concurrency: max number of tasks running at the same time (number of worker threads).
+            per_host_limit: max number of tasks running at the same time for a given host.
+            max_retry_after: max seconds a host is paused, whatever its Retry-After.
+            thread_name_prefix: name of the worker threads, followed by their index.
+        """
+        if max_concurrency < 1 or per_host_limit < 1:
+            raise ValueError("max_concurrency and per_host_limit must be >= 1")
+        self.max_concurrency = max_concurrency
+        self.per_host_limit = per_host_limit
+        self.max_retry_after = max_retry_after
+        self.thread_name_prefix = thread_name_prefix
+        self._condition = Condition()
+        self._groups: "OrderedDict[Hashable, Deque[Task]]" = OrderedDict()  # in turn order
+        self._active_per_host: Dict[str, int] = {}
+        self._paused_until: Dict[str, float] = {}  # host -> time.monotonic() of the end of its pause
+        self._delayed: List[Delayed] = []  # heap of the calls of call_later, by due time
+        self._sequence = itertools.count()
+        self._workers: List[Thread] = []
+        self._idle_workers = 0
+        self._shutdown = False
+
+    def submit(self, url: str, fn: Callable, *args, group: Hashable = None, **kwargs) -> Future:
+        """
+        Schedule fn(*args, **kwargs), as a fetch to url.
+
+        Args:
+            group: the tasks of a group are run in submission order (for a given host), and the groups
+                   share the workers in turn. The tasks without group are in the same group.
+
+        Returns:
+            a concurrent.futures.Future of the fn result.
+
+        Raises:
+            RuntimeError: if the scheduler is shut down.
+        """
+        future: Future = Future()
+        host = urlparse(url).netloc if url else ""
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new fetches after shutdown")
+            tasks = self._groups.get(group)
+            if tasks is None:
+                tasks = self._groups[group] = deque()
+            tasks.append((host, fn, args, kwargs, future))
+            self._start_worker_if_needed()
+            self._condition.notify()
+        return future
+
+    def call_later(self, delay: float, fn: Callable, *args) -> Future:
+        """
+        Call fn(*args) in a worker, after delay seconds (later if all the workers are busy until then).
+        fn must be short: it holds a worker.
+
+        Returns:
+            a concurrent.futures.Future of the fn result: cancel() it to not call fn.
+
+        Raises:
+            RuntimeError: if the scheduler is shut down.
+        """
+        future: Future = Future()
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new calls after shutdown")
+            heapq.heappush(self._delayed, (time.monotonic() + max(delay, 0.0), next(self._sequence), fn, args, future))
+            self._start_worker_if_needed()
+            self._condition.notify()
+        return future
+
+    def defer_host(self, url: str, delay: float):
+        """
+        Pause the host of url: its queued tasks start after delay seconds (at most max_retry_after).
+        A longer pause already set is kept.
+        """
+        host = urlparse(url).netloc
+        delay = min(max(delay, 0.0), self.max_retry_after)
+        logger.info("Pause fetches to [%s] for %.1f s", host, delay)
+        with self._condition:
+            until = time.monotonic() + delay
+            if until > self._paused_until.get(host, 0):
+                self._paused_until[host] = until
+
+    def defer_host_if_throttled(self, url: str, response) -> bool:
+        """
+        Pause the host of url if response asks for it: a 429, or a 503 with Retry-After.
+
+        Args:
+            response: a requests.Response (or any object with status_code and headers).
+
+        Returns:
+            True if the host is paused.
+        """
+        if response.status_code not in (429, 503):
+            return False
+        delay = parse_retry_after(response.headers.get("Retry-After"))
+        if delay is None:
+            if response.status_code == 503:
+                return False
+            delay = self.default_retry_after
+        self.defer_host(url, delay)
+        return True
+
+    def shutdown(self, wait: bool = True):
+        """
+        Cancel the queued tasks and stop the workers once the running tasks are done.
+
+        Args:
+            wait: if True, waits for the running tasks.
+        """
+        with self._condition:
+            self._shutdown = True
+            for tasks in self._groups.values():
+                for task in tasks:
+                    task[4].cancel()
+            self._groups.clear()
+            for delayed in self._delayed:
+                delayed[4].cancel()
+            self._delayed.clear()
+            self._condition.notify_all()
+            workers = list(self._workers)
+        if wait:
+            for worker in workers:
+                worker.join()
+
+    def _start_worker_if_needed(self):
+        """
+        Must be called with self._condition acquired.
+        """
+        if self._idle_workers == 0 and len(self._workers) < self.max_concurrency:
+            worker = Thread(target=self._work, name=f"{self.thread_name_prefix}-{len(self._workers)}", daemon=True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _pop_delayed(self) -> Tuple[Optional[Delayed], Optional[float]]:
+        """
+        Must be called with self._condition acquired.
+
+        Returns:
+            (call, None): the first delayed call that is due.
+            (None, wait): no call is due. wait is the seconds before the next one (None if none).
+        """
+        while self._delayed and self._delayed[0][4].cancelled():
+            heapq.heappop(self._delayed)
+        if not self._delayed:
+            return None, None
+        wait = self._delayed[0][0] - time.monotonic()
+        if wait > 0:
+            return None, wait
+        return heapq.heappop(self._delayed), None
+
+    def _pop_task(self) -> Tuple[Optional[Task], Optional[float]]:
+        """
+        Must be called with self._condition acquired.
+
+        Returns:
+            (task, None): the first task of the next group in turn whose host is below per_host_limit and
+                          not paused. The group goes at the end of the turn.
+            (None, wait): no task can run. wait is the seconds before the end of the first pause of a host
+                          with queued tasks (None if no such pause).
+        """
+        now = time.monotonic()
+        for host, until in list(self._paused_until.items()):
+            if until <= now:
+                del self._paused_until[host]
+        for group, tasks in self._groups.items():
+            for index, task in enumerate(tasks):
+                host = task[0]
+                if self._active_per_host.get(host, 0) < self.per_host_limit and host not in self._paused_until:
+                    del tasks[index]
+                    if tasks:
+                        self._groups.move_to_end(group)
+                    else:
+                        del self._groups[group]
+                    self._active_per_host[host] = self._active_per_host.get(host, 0) + 1
+                    return task, None
+        waiting_hosts = {task[0] for tasks in self._groups.values() for task in tasks}
+        ends = [until for host, until in self._paused_until.items() if host in waiting_hosts]
+        return None, (min(ends) - now if ends else None)
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while True:
+                    delayed, delayed_wait = self._pop_delayed()
+                    if delayed is not None:
+                        break
+                    task, wait = self._pop_task()
+                    if task is not None:
+                        break
+                    if self._shutdown:
+                        return
+                    waits = [seconds for seconds in (wait, delayed_wait) if seconds is not None]
+                    self._idle_workers += 1
+                    self._condition.wait(min(waits) if waits else None)
+                    self._idle_workers -= 1
+            if delayed is not None:
+                self._run_delayed(delayed)
+                continue
+            host, fn, args, kwargs, future = task
+            try:
+                if future.set_running_or_notify_cancel():
+                    try:
+                        future.set_result(fn(*args, **kwargs))
+                    except BaseException as ex:  # pylint: disable=broad-except
+                        future.set_exception(ex)
+            finally:
+                with self._condition:
+                    self._active_per_host[host] -= 1
+                    if not self._active_per_host[host]:
+                        del self._active_per_host[host]
+                    self._condition.notify_all()
+
+    @staticmethod
+    def _run_delayed(delayed: Delayed):
+        _, _, fn, args, future = delayed
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(fn(*args))
+            except BaseException as ex:  # pylint: disable=broad-except
+                future.set_exception(ex)
+
+_default_scheduler: Optional[FetchScheduler] = None
+_default_scheduler_lock = Lock()
+
+def get_default_scheduler() -> FetchScheduler:
+    """
+    Returns:
+        the scheduler shared by all previews that are not given one (created on first call): it bounds the
+        images probes of all these previews together.
+    """
+    global _default_scheduler  # pylint: disable=global-statement
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = FetchScheduler(max_concurrency=32, per_host_limit=6,
+                                                thread_name_prefix="hlp-shared")
+        return _default_scheduler
+
+def set_default_scheduler(scheduler: Optional[FetchScheduler]):
+    """
+    Args:
+        scheduler: the scheduler shared by all previews that are not given one.
+                   None to create a default one on next use.
+    """
+    global _default_scheduler  # pylint: disable=global-statement
+    with _default_scheduler_lock:
+        _default_scheduler = scheduler
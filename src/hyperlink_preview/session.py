@@ -0,0 +1,139 @@
+"""
+Shared requests.Session with connection pooling (keep-alive), retries and default timeouts.
+"""
+
+from contextlib import contextmanager
+import socket
+from threading import Lock, local
+from typing import Optional, Tuple, Union
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+Timeout = Union[float, Tuple[float, float]]
+
+_single_try = local()
+
+@contextmanager
+def single_try():
+    """
+    The requests sent in this context, by this thread, are not retried by the TimeoutHTTPAdapter:
+    for a request with a deadline, that the retries (and their backoff) would exceed.
+    """
+    previous = getattr(_single_try, "active", False)
+    _single_try.active = True
+    try:
+        yield
+    finally:
+        _single_try.active = previous
+
+class ThrottleRetry(Retry):
+    """
+    Retry that doesn't retry a 429 or 503 with a Retry-After, nor sleeps its delay in the thread of the request:
+    the response is returned, and the scheduler pauses its host (see FetchScheduler.defer_host_if_throttled).
+    """
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if has_retry_after and status_code in (429, 503):
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter with a default timeout, used when the request doesn't give one.
+    """
+    def __init__(self, *args, timeout: Optional[Timeout] = None, **kwargs):
+        self.timeout = timeout
+        self._max_retries = None
+        super().__init__(*args, **kwargs)
+
+    @property
+    def max_retries(self) -> Retry:
+        if getattr(_single_try, "active", False):
+            return Retry(0, read=False)
+        return self._max_retries
+
+    @max_retries.setter
+    def max_retries(self, retries: Retry):
+        self._max_retries = retries
+
+    def send(self, request, **kwargs):  # pylint: disable=arguments-differ
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().send(request, **kwargs)
+
+def create_session(pool_connections: int = 32, pool_maxsize: int = 16, retries: int = 2,
+                   timeout: Optional[Timeout] = (5, 30)) -> requests.Session:
+    """
+    Args:
+        pool_connections: number of hosts whose connections are kept.
+        pool_maxsize: number of connections kept for a host. Should be >= the number of simultaneous
+                      requests to a host (images probes), or connections are discarded.
+        retries: retries on connection errors and on 502, 503, 504 statuses (not a 503 with Retry-After: see
+                 ThrottleRetry).
+        timeout: default (connect, read) timeout in seconds. None to wait forever.
+
+    Returns:
+        a session to give to HyperLinkPreview(session=...), or to set_default_session.
+    """
+    session = requests.Session()
+    retry = ThrottleRetry(total=retries, backoff_factor=0.3, status_forcelist=(502, 503, 504), raise_on_status=False,
+                          respect_retry_after_header=False)
+    adapter = TimeoutHTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                 max_retries=retry, timeout=timeout)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+_default_session: Optional[requests.Session] = None
+_default_session_lock = Lock()
+
+def get_default_session() -> requests.Session:
+    """
+    Returns:
+        the session shared by all previews that are not given one (created on first call).
+    """
+    global _default_session  # pylint: disable=global-statement
+    with _default_session_lock:
+        if _default_session is None:
+            _default_session = create_session()
+        return _default_session
+
+def set_default_session(session: Optional[requests.Session]):
+    """
+    Args:
+        session: the session shared by all previews that are not given one.
+                 None to create a default one on next use.
+    """
+    global _default_session  # pylint: disable=global-statement
+    with _default_session_lock:
+        _default_session = session
+
+def release(response: requests.Response, max_drain: int = 64 * 1024):
+    """
+    Close a response opened in stream mode, keeping its connection in the pool when possible:
+    closing a partially read response closes its connection, so a small remaining body is read first.
+
+    Args:
+        max_drain: max number of bytes to read to keep the connection.
+    """
+    try:
+        remaining = int(response.headers.get("Content-Length", -1)) - response.raw.tell()
+        if 0 <= remaining <= max_drain:
+            for _ in response.iter_content(16 * 1024):
+                pass
+    except Exception:  # pylint: disable=broad-except
+        pass
+    response.close()
+
+def cut(response: requests.Response):
+    """
+    Shut the connection of a response opened in stream mode down, from any thread: the read in progress
+    ends (the socket timeout bounds each read, not a slow body), and the next ones raise.
+    """
+    connection = getattr(response.raw, "connection", None)  # None once released
+    sock = getattr(connection, "sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass  # already closed
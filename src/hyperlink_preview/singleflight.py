@@ -0,0 +1,71 @@
+"""
+Deduplication of concurrent work on the same key (single flight): the first caller (the leader) does the work,
+the callers arriving while it is in flight wait for its result and share it.
+
+Exemple:
+    flights = SingleFlight()
+    future, leader = flights.begin(url)
+    if leader:
+        try:
+            flights.succeed(url, future, fetch(url))
+        except Exception as ex:
+            flights.fail(url, future, ex)
+    result = future.result()
+"""
+
+from concurrent.futures import Future
+from threading import Lock
+from typing import Any, Dict, Hashable, Tuple
+
+class SingleFlight:
+    """
+    Thread safe registry of the work in flight, by key. The result of the work can be given to the waiting callers
+    (succeed) before the work is over for the registry (forget): the callers arriving in between share it too.
+    """
+    def __init__(self):
+        self._lock = Lock()
+        self._flights: Dict[Hashable, Future] = {}
+
+    def begin(self, key: Hashable) -> Tuple[Future, bool]:
+        """
+        Returns:
+            the future of the work in flight for key, and True if the caller is the leader: the one that must do the
+            work, then call succeed or fail.
+        """
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._flights[key] = future
+            return future, True
+
+    def succeed(self, key: Hashable, future: Future, result: Any, forget: bool = True):
+        """
+        Give the result to the waiting callers.
+
+        Args:
+            forget: if False, the callers arriving later still share the result, until forget(key, future).
+        """
+        future.set_result(result)
+        if forget:
+            self.forget(key, future)
+
+    def fail(self, key: Hashable, future: Future, exception: BaseException):
+        """
+        Raise exception to the waiting callers, and forget the work.
+        """
+        future.set_exception(exception)
+        self.forget(key, future)
+
+    def forget(self, key: Hashable, future: Future):
+        """
+        The callers arriving from now on do the work again.
+        """
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._flights)
@@ -0,0 +1,77 @@
+"""
+Tell what a response is before reading its body: an html page, an image, or something else (pdf, video,
+archive...) whose body must not be downloaded. The Content-Type header is trusted, except the generic
+ones (none, text/plain, application/octet-stream...): then the first bytes tell.
+
+Exemple:
+    kind = kind_from_headers(media_type(response.headers.get("Content-Type")),
+                             response.headers.get("Content-Length"), max_bytes=10 * 1024 * 1024)
+    if kind is None:
+        kind = sniff(first_bytes)
+"""
+
+import re
+from typing import Optional
+
+HTML = "html"
+IMAGE = "image"
+OTHER = "other"
+
+HTML_MEDIA_TYPES = {"text/html", "application/xhtml+xml"}
+# sent by servers for anything: the first bytes tell.
+GENERIC_MEDIA_TYPES = {"", "text/plain", "application/octet-stream", "binary/octet-stream", "application/unknown",
+                       "unknown/unknown", "application/x-unknown-content-type"}
+SNIFF_BYTES = 1024  # bytes read to sniff a response with a generic type
+
+_IMAGE_SIGNATURES = (b'GIF87a', b'GIF89a', b'\211PNG\r\n\032\n', b'\377\330\377', b'II*\0', b'MM\0*')
+_HEIF_BRAND = re.compile(br'....ftyp(avif|avis|heic|heix|hevc|hevx|heim|heis|mif1|msf1)', re.DOTALL)
+_LEADING = re.compile(br'(\xef\xbb\xbf|\xff\xfe|\xfe\xff)?[\s\0]*')  # BOM and spaces
+_SVG_START = re.compile(br'(<\?xml[^>]*>\s*)?(<!--.*?-->\s*|<!DOCTYPE[^>]*>\s*)*<svg\b', re.DOTALL | re.IGNORECASE)
+
+def media_type(content_type: Optional[str]) -> str:
+    """
+    Returns:
+        the media type of a Content-Type header, lower case, without parameters ("" if none).
+    """
+    return (content_type or "").split(";", 1)[0].strip().lower()
+
+def kind_from_headers(media: str, content_length: Optional[str], max_bytes: int) -> Optional[str]:
+    """
+    Args:
+        media: see media_type.
+        content_length: the Content-Length header, if any.
+        max_bytes: the max size of a page: a bigger response with a generic type is not a page.
+
+    Returns:
+        HTML, IMAGE or OTHER. None if the first bytes must be sniffed (see sniff).
+    """
+    if media in HTML_MEDIA_TYPES:
+        return HTML
+    if media.startswith("image/"):
+        return IMAGE
+    if media in GENERIC_MEDIA_TYPES:
+        try:
+            if content_length is not None and int(content_length) > max_bytes:
+                return OTHER
+        except ValueError:
+            pass
+        return None
+    return OTHER
+
+def sniff(first_bytes: bytes) -> str:
+    """
+    Args:
+        first_bytes: the first bytes of the body (SNIFF_BYTES, or less if the body is shorter).
+
+    Returns:
+        IMAGE if the bytes start like an image (svg included), HTML if like a markup, OTHER otherwise.
+    """
+    if first_bytes.startswith(_IMAGE_SIGNATURES) or _HEIF_BRAND.match(first_bytes) \
+            or (first_bytes.startswith(b'RIFF') and first_bytes[8:12] == b'WEBP'):
+        return IMAGE
+    start = _LEADING.match(first_bytes).end()
+    if _SVG_START.match(first_bytes, start):
+        return IMAGE
+    if first_bytes.startswith(b'<', start):
+        return HTML
+    return OTHER
@@ -0,0 +1,331 @@
+"""
+Persistent store of previews, to pre-warm a node: previews computed offline are exported, imported in a
+store file, and served without fetch (the store is a PreviewCache, given to HyperLinkPreview(cache=...)).
+
+The store is an append-only file of versioned records (a new record of an url replaces the previous one,
+a record without payload deletes it), read through a memory map. The index (64 bits hash of the
+normalized url -> offset of its last record) is kept in two sorted arrays, saved next to the file on close:
+a store opened again loads it, and scans only the records appended after it.
+
+Exemple:
+    store = PreviewStore("previews.hlp", ttl=30 * 24 * 3600)
+    store.import_jsonl("previews.jsonl")  # exported by another store: store.export_jsonl(path)
+    hlp = HyperLinkPreview(url, cache=store)  # no fetch if url is in the store
+    store.close()
+"""
+
+from array import array
+from bisect import bisect_left
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+from threading import RLock
+from typing import Dict, Iterator, Optional, Tuple
+import zlib
+from .cache import CacheEntry, PreviewCache
+from .normalization import UrlNormalizer
+
+logger = logging.getLogger('hyperlinkpreview')
+
+FORMAT_VERSION = 1  # of the files: a store file of another version is not read
+RECORD_VERSION = 1  # of the records: zlib compressed json of the normalized url, new line, CacheEntry json
+_FILE_HEADER = struct.Struct("<4sH")  # magic, format version
+_RECORD_HEADER = struct.Struct("<QHI")  # url hash, record version, payload length (0: deleted)
+_INDEX_HEADER = struct.Struct("<4sHQQ")  # magic, format version, length of the store file indexed, entries
+_STORE_MAGIC = b"HLPS"
+_INDEX_MAGIC = b"HLPI"
+
+def url_hash(key: str) -> int:
+    """
+    Returns:
+        the 64 bits hash of a cache key (see PreviewCache.key).
+    """
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+class PreviewStore(PreviewCache):
+    """
+    Thread safe persistent cache in an append-only file (see the module doc). compact() rewrites the file
+    without the replaced and deleted records. The aliases (see PreviewCache) are kept in memory only.
+    """
+    def __init__(self, path: str, ttl: float = 3600, stale_while_revalidate: float = 0,
+                 normalizer: Optional[UrlNormalizer] = None):
+        """
+        Args:
+            path: the store file, created if needed. The index is saved in path + ".idx".
+
+        Raises:
+            ValueError: if path is not a store file, or of another format version.
+        """
+        super().__init__(ttl=ttl, stale_while_revalidate=stale_while_revalidate, normalizer=normalizer)
+        self.path = path
+        self.index_path = path + ".idx"
+        self._lock = RLock()
+        self._hashes = array("Q")  # sorted: the index saved
+        self._offsets = array("Q")
+        self._recent: Dict[int, int] = {}  # hash -> offset of the records appended since, -1 if deleted
+        self._count = 0
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, "wb") as file:
+                file.write(_FILE_HEADER.pack(_STORE_MAGIC, FORMAT_VERSION))
+        self._file = open(path, "r+b")  # pylint: disable=consider-using-with
+        magic, version = _FILE_HEADER.unpack(self._file.read(_FILE_HEADER.size))
+        if magic != _STORE_MAGIC or version != FORMAT_VERSION:
+            self._file.close()
+            raise ValueError(f"[{path}] is not a preview store of version {FORMAT_VERSION}")
+        self._map: Optional[mmap.mmap] = None
+        self._remap()
+        self._scan(self._load_index())
+
+    def _load(self, key: str) -> Optional[CacheEntry]:
+        record = self._read(url_hash(key))
+        if record is None or record[0] != key:
+            return None  # not found, or another url with the same hash
+        return record[1]
+
+    def _store(self, key: str, entry: CacheEntry):
+        with self._lock:
+            self._append(key, entry)
+            self._file.flush()
+
+    def delete(self, url: str):
+        with self._lock:
+            self._append(self.key(url), None)
+            self._file.flush()
+
+    def clear(self):
+        with self._lock:
+            self._close_map()
+            self._file.truncate(_FILE_HEADER.size)
+            self._file.flush()
+            self._hashes, self._offsets, self._recent, self._count = array("Q"), array("Q"), {}, 0
+            self._remap()
+            self._clear_aliases()
+            if os.path.exists(self.index_path):
+                os.remove(self.index_path)
+
+    def close(self):
+        """
+        Save the index, and close the file.
+        """
+        with self._lock:
+            if self._file.closed:
+                return
+            self._save_index()
+            self._close_map()
+            self._file.close()
+
+    def __len__(self):
+        return self._count
+
+    def items(self) -> Iterator[Tuple[str, CacheEntry]]:
+        """
+        Returns:
+            an iterator of the (key, entry) in the store, in no particular order.
+        """
+        with self._lock:
+            hashes = list(self._merged_index())
+        for hash_value in hashes:
+            record = self._read(hash_value)
+            if record is not None:
+                yield record
+
+    def export_jsonl(self, path: str) -> int:
+        """
+        Write all entries in a JSON Lines file: one {"url": key, "entry": CacheEntry json} per line.
+
+        Returns:
+            the number of entries written.
+        """
+        count = 0
+        with open(path, "w", encoding="utf-8") as file:
+            for key, entry in self.items():
+                file.write(json.dumps({"url": key, "entry": json.loads(entry.to_json())}) + "\n")
+                count += 1
+        return count
+
+    def import_jsonl(self, path: str) -> int:
+        """
+        Add the entries of a JSON Lines file written by export_jsonl (they replace the entries of the same url).
+        The invalid lines are skipped.
+
+        Returns:
+            the number of entries imported.
+        """
+        count = 0
+        with open(path, encoding="utf-8") as file, self._lock:
+            for line_number, line in enumerate(file, 1):
+                if not line.strip():
+                    continue
+                try:
+                    values = json.loads(line)
+                    entry = CacheEntry.from_json(json.dumps(values["entry"]))
+                    key = self.key(values["url"])
+                except (ValueError, KeyError, TypeError) as ex:
+                    logger.warning("Invalid preview in [%s] line %d: [%s]", path, line_number, ex)
+                    continue
+                self._append(key, entry)
+                count += 1
+            self._file.flush()
+        return count
+
+    def compact(self):
+        """
+        Rewrite the file with only the last record of each url, then save the index.
+        """
+        with self._lock:
+            records = list(self.items())
+            self._close_map()
+            self._file.truncate(_FILE_HEADER.size)
+            self._file.seek(_FILE_HEADER.size)
+            self._hashes, self._offsets, self._recent, self._count = array("Q"), array("Q"), {}, 0
+            for key, entry in records:
+                self._append(key, entry)
+            self._file.flush()
+            self._remap()
+            self._save_index()
+
+    def _append(self, key: str, entry: Optional[CacheEntry]):
+        """
+        Must be called with self._lock. The caller flushes the file.
+        """
+        hash_value = url_hash(key)
+        payload = b'' if entry is None else \
+            zlib.compress((json.dumps(key) + "\n" + entry.to_json()).encode("utf-8"))
+        self._file.seek(0, os.SEEK_END)
+        offset = self._file.tell()
+        self._file.write(_RECORD_HEADER.pack(hash_value, RECORD_VERSION, len(payload)) + payload)
+        self._index(hash_value, offset if payload else -1)
+
+    def _index(self, hash_value: int, offset: int):
+        """
+        Must be called with self._lock.
+
+        Args:
+            offset: of the last record of hash_value, -1 if deleted.
+        """
+        present = self._find(hash_value) is not None
+        self._recent[hash_value] = offset
+        self._count += (offset != -1) - present
+
+    def _find(self, hash_value: int) -> Optional[int]:
+        """
+        Returns:
+            the offset of the last record of hash_value, None if not in the store.
+        """
+        offset = self._recent.get(hash_value)
+        if offset is None:
+            index = bisect_left(self._hashes, hash_value)
+            if index < len(self._hashes) and self._hashes[index] == hash_value:
+                offset = self._offsets[index]
+        return None if offset is None or offset == -1 else offset
+
+    def _read(self, hash_value: int) -> Optional[Tuple[str, CacheEntry]]:
+        """
+        Returns:
+            the (key, entry) of the last record of hash_value, None if not found or unreadable.
+        """
+        with self._lock:
+            offset = self._find(hash_value)
+            if offset is None:
+                return None
+            if offset + _RECORD_HEADER.size > len(self._map):
+                self._remap()
+            _, version, length = _RECORD_HEADER.unpack_from(self._map, offset)
+            if offset + _RECORD_HEADER.size + length > len(self._map):
+                self._remap()
+            start = offset + _RECORD_HEADER.size
+            payload = self._map[start:start + length]
+        if version != RECORD_VERSION:
+            logger.warning("Preview record of version %d ignored in [%s]", version, self.path)
+            return None
+        try:
+            key, entry = zlib.decompress(payload).decode("utf-8").split("\n", 1)
+            return (json.loads(key), CacheEntry.from_json(entry))
+        except (ValueError, KeyError, zlib.error) as ex:
+            logger.warning("Invalid preview record in [%s] at %d: [%s]", self.path, offset, ex)
+            return None
+
+    def _scan(self, start: int):
+        """
+        Index the records from start to the end of the file. An incomplete last record (interrupted write)
+        is removed.
+        """
+        offset = start
+        size = len(self._map)
+        while offset + _RECORD_HEADER.size <= size:
+            hash_value, _, length = _RECORD_HEADER.unpack_from(self._map, offset)
+            if offset + _RECORD_HEADER.size + length > size:
+                break
+            self._index(hash_value, offset if length else -1)
+            offset += _RECORD_HEADER.size + length
+        if offset < size:
+            logger.warning("Incomplete record removed at the end of [%s]", self.path)
+            self._close_map()
+            self._file.truncate(offset)
+            self._remap()
+
+    def _load_index(self) -> int:
+        """
+        Load the saved index, if it matches the file.
+
+        Returns:
+            the offset of the first record not indexed.
+        """
+        try:
+            with open(self.index_path, "rb") as file:
+                magic, version, indexed_length, count = _INDEX_HEADER.unpack(file.read(_INDEX_HEADER.size))
+                if magic == _INDEX_MAGIC and version == FORMAT_VERSION and indexed_length <= len(self._map):
+                    hashes, offsets = array("Q"), array("Q")
+                    hashes.fromfile(file, count)
+                    offsets.fromfile(file, count)
+                    self._hashes, self._offsets, self._count = hashes, offsets, count
+                    return indexed_length
+        except (OSError, EOFError, struct.error) as ex:
+            if not isinstance(ex, FileNotFoundError):
+                logger.warning("Cannot load the index of [%s]: [%s]", self.path, ex)
+        return _FILE_HEADER.size
+
+    def _merged_index(self) -> Dict[int, int]:
+        """
+        Must be called with self._lock.
+
+        Returns:
+            hash -> offset of all the urls in the store.
+        """
+        merged = dict(zip(self._hashes, self._offsets))
+        for hash_value, offset in self._recent.items():
+            if offset == -1:
+                merged.pop(hash_value, None)
+            else:
+                merged[hash_value] = offset
+        return merged
+
+    def _save_index(self):
+        """
+        Must be called with self._lock.
+        """
+        merged = self._merged_index()
+        hashes = array("Q", sorted(merged))
+        offsets = array("Q", (merged[hash_value] for hash_value in hashes))
+        self._file.flush()
+        indexed_length = os.path.getsize(self.path)
+        temporary_path = self.index_path + ".tmp"
+        with open(temporary_path, "wb") as file:
+            file.write(_INDEX_HEADER.pack(_INDEX_MAGIC, FORMAT_VERSION, indexed_length, len(hashes)))
+            hashes.tofile(file)
+            offsets.tofile(file)
+        os.replace(temporary_path, self.index_path)
+        self._hashes, self._offsets, self._recent = hashes, offsets, {}
+
+    def _remap(self):
+        self._close_map()
+        self._file.flush()
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _close_map(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
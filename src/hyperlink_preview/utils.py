@@ -2,7 +2,7 @@
 Some utils functions for hyperlink preview
 """
 
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlsplit, urlunsplit
 from bs4.element import Comment
 
 def has_og_property(meta_tag, properties):
@@ -36,6 +36,24 @@ def tag_visible(element) -> bool:
         return False
     return True
 
+HIDDEN_TAGS = ('noscript', 'template')
+
+def is_hidden(name: str, attributes) -> bool:
+    """
+    check if an element hides its content, by its name (<noscript>, <template>) or by its attributes:
+    hidden, aria-hidden="true", style="display: none".
+
+    Args:
+        name: the tag name.
+        attributes: the attributes of the tag (a dict, or anything with "in" and get()).
+    """
+    if name in HIDDEN_TAGS or "hidden" in attributes:
+        return True
+    if (attributes.get("aria-hidden") or "").strip().lower() == "true":
+        return True
+    style = attributes.get("style")
+    return isinstance(style, str) and "display:none" in "".join(style.split()).lower()
+
 def get_base_url(full_url):
     """
     Returns:
@@ -46,6 +64,23 @@ def get_base_url(full_url):
     return url_base
 
 
+def normalize_url(url):
+    """
+    Returns:
+        the url with lower case scheme and host, without default port nor fragment,
+        and with "/" as path if empty: two urls to the same page give the same string.
+    """
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    netloc = parts.netloc.lower()
+    if (scheme, netloc.rsplit(":", 1)[-1]) in (("http", "80"), ("https", "443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    return urlunsplit((scheme, netloc, parts.path or "/", parts.query, ""))
+
+
 def get_img_url(img_src, url_base):
     """
     Get an image url from the src attribute af an image, and the page base url
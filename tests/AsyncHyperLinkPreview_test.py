@@ -0,0 +1,110 @@
+import asyncio
+import time
+import unittest
+import src.hyperlink_preview as HP
+from src.hyperlink_preview import parse_pool
+from local_server import LocalServer, png
+
+PAGE = b"""<html><head><title>No og</title></head>
+<body><p>Some text.</p><img src="/small.png"><img src="/big.png"><img src="/missing.png"></body></html>"""
+
+ROUTES = {
+    "/page": (200, {"Content-Type": "text/html; charset=utf-8"}, PAGE),
+    "/og": (200, {"Content-Type": "text/html"},
+            b'<html><head><meta property="og:title" content="OG title"><meta property="og:image" content="i.png">'
+            b'</head></html>'),
+    "/small.png": (200, {"Content-Type": "image/png"}, png(20, 20)),
+    "/big.png": (200, {"Content-Type": "image/png"}, png(400, 300)),
+    "/doc.pdf": (200, {"Content-Type": "application/pdf"}, b'%PDF-1.4' + b'\0' * 200000),
+    "/untyped.png": (200, {}, png(320, 200)),
+    "/long": (200, {"Content-Type": "text/html"}, b'<html><head><title>Long</title></head><body>' + b'x' * 5000),
+    "/big": (200, {"Content-Type": "text/html"},
+             b'<html><head><title>Big</title></head><body>' + b'<p>Some <b>text</b>.</p>' * 100000 + b'</body></html>'),
+}
+
+class SmallPagesPreview(HP.AsyncHyperLinkPreview):
+    max_page_bytes = 1000
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        # the connections closed before the end of their body finish closing
+        loop.run_until_complete(asyncio.sleep(0.01))
+        loop.close()
+
+class TestAsync(unittest.TestCase):
+    def test_images_probed_on_loop(self):
+        async def preview(url):
+            hlp = await HP.AsyncHyperLinkPreview.create(url)
+            first = hlp.get_data()
+            return hlp, first, await hlp.get_data_full()
+
+        with LocalServer(ROUTES) as server:
+            hlp, first, full = run(preview(server.url("/page")))
+        self.assertTrue(hlp.is_valid)
+        self.assertEqual(first["title"], "No og")
+        self.assertEqual(full["image"], server.url("/big.png"))
+        self.assertTrue(hlp.full_parsed.is_set())
+
+    def test_og_image(self):
+        async def preview(url):
+            hlp = await HP.AsyncHyperLinkPreview.create(url)
+            return hlp.get_data(), await hlp.get_data_full()
+
+        with LocalServer(ROUTES) as server:
+            first, full = run(preview(server.url("/og")))
+        self.assertEqual(first, full)
+        self.assertEqual(full["title"], "OG title")
+        self.assertEqual(full["image"], "i.png")
+
+    def test_not_pages(self):
+        async def preview(url, cls=HP.AsyncHyperLinkPreview):
+            hlp = await cls.create(url)
+            return hlp, hlp.get_data(fields=["title", "image"])
+
+        with LocalServer(ROUTES) as server:
+            pdf, data = run(preview(server.url("/doc.pdf")))
+            self.assertFalse(pdf.is_valid)
+            self.assertIsNone(pdf.fetched_bytes)
+            self.assertEqual(data, {"title": None, "image": None})
+
+            image, data = run(preview(server.url("/untyped.png")))
+            self.assertEqual((image.direct_image.width, image.direct_image.height), (320, 200))
+            self.assertEqual(data, {"title": "untyped.png", "image": server.url("/untyped.png")})
+
+            page, data = run(preview(server.url("/long"), SmallPagesPreview))
+            self.assertEqual(page.fetched_bytes, 1000)
+            self.assertEqual(data["title"], "Long")
+
+    def test_pool_parse_on_loop(self):
+        async def preview(url):
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.005)
+                    ticks += 1
+
+            task = asyncio.ensure_future(ticker())
+            await asyncio.sleep(0.01)
+            start, ticks = time.monotonic(), 0
+            hlp = await HP.AsyncHyperLinkPreview.create(url)
+            task.cancel()
+            return hlp, ticks, time.monotonic() - start
+
+        with parse_pool.ParsePool(processes=1, min_chars=0) as pool:
+            parse_pool.set_default_parse_pool(pool)
+            try:
+                with LocalServer(ROUTES) as server:
+                    hlp, ticks, seconds = run(preview(server.url("/big")))
+            finally:
+                parse_pool.set_default_parse_pool(None)
+        self.assertEqual(hlp.get_data()["title"], "Big")
+        self.assertGreater(ticks, seconds / 0.005 / 4)  # the loop ran during the parse
+
+    def test_fetch_errors(self):
+        with self.assertRaises(ValueError):
+            run(HP.AsyncHyperLinkPreview.create(""))
@@ -0,0 +1,53 @@
+import threading
+import unittest
+import src.hyperlink_preview as HP
+from local_server import LocalServer, png
+
+def page(index):
+    return (f'<html><head><title>Page {index}</title></head><body>'
+            f'<img src="/img{index}.png"><img src="/img{index + 1}.png"></body></html>').encode()
+
+ROUTES = {f"/page{index}": (200, {"Content-Type": "text/html"}, page(index)) for index in range(40)}
+ROUTES.update({f"/img{index}.png": (200, {"Content-Type": "image/png"}, png(100 + index, 100)) for index in range(41)})
+
+class TestPreviewMany(unittest.TestCase):
+    def test_preview_many(self):
+        with LocalServer(ROUTES) as server:
+            urls = [server.url(f"/page{index}") for index in range(40)] + [""]
+            max_threads = 0
+            results = {}
+            for url, result in HP.preview_many(urls, max_concurrency=4, per_host_limit=2):
+                fetch_threads = [thread for thread in threading.enumerate() if thread.name.startswith("hlp-fetch")]
+                max_threads = max(max_threads, len(fetch_threads))
+                results[url] = result
+
+        self.assertEqual(len(results), 41)
+        self.assertIsInstance(results[""], ValueError)
+        for index in range(40):
+            data = results[server.url(f"/page{index}")].get_data(wait_for_imgs=False)
+            self.assertEqual(data["title"], f"Page {index}")
+            self.assertEqual(data["image"], server.url(f"/img{index + 1}.png"))
+        self.assertLessEqual(max_threads, 4)
+
+    def test_scheduler_per_host_limit(self):
+        scheduler = HP.FetchScheduler(max_concurrency=8, per_host_limit=2)
+        lock = threading.Lock()
+        running = [0, 0]
+        release = threading.Event()
+
+        def task():
+            with lock:
+                running[0] += 1
+                running[1] = max(running[1], running[0])
+            release.wait(1)
+            with lock:
+                running[0] -= 1
+
+        futures = [scheduler.submit("http://same.host/x", task) for _ in range(6)]
+        other = scheduler.submit("http://other.host/x", lambda: "other")
+        self.assertEqual(other.result(timeout=5), "other")
+        release.set()
+        for future in futures:
+            future.result(timeout=5)
+        scheduler.shutdown()
+        self.assertEqual(running[1], 2)
@@ -0,0 +1,118 @@
+import os
+import tempfile
+import time
+import unittest
+import src.hyperlink_preview as HP
+from src.hyperlink_preview import cache as HP_cache
+from local_server import LocalServer
+
+ROUTES = {"/page": (200, {"Content-Type": "text/html"},
+                    b'<html><head><meta property="og:title" content="Cached"><meta property="og:image" content="i.png">'
+                    b'</head></html>')}
+
+class TestMemoryCache(unittest.TestCase):
+    def test_lru(self):
+        cache = HP_cache.MemoryCache(max_entries=2)
+        cache.set("http://a/", HP_cache.CacheEntry({"title": "a"}, True))
+        cache.set("http://b/", HP_cache.CacheEntry({"title": "b"}, True))
+        self.assertEqual(cache.get("HTTP://A#fragment").datas["title"], "a")
+        cache.set("http://c/", HP_cache.CacheEntry({"title": "c"}, True))
+        self.assertIsNone(cache.get("http://b/"))
+        self.assertIsNotNone(cache.get("http://a/"))
+        self.assertEqual(cache.stats(), {"hits": 2, "stale_hits": 0, "misses": 1, "not_modified": 0, "size": 2})
+
+    def test_ttl(self):
+        cache = HP_cache.MemoryCache(ttl=10, stale_while_revalidate=10)
+        cache.set("http://fresh/", HP_cache.CacheEntry({}, True))
+        cache.set("http://stale/", HP_cache.CacheEntry({}, True, stored_at=time.time() - 15))
+        cache.set("http://expired/", HP_cache.CacheEntry({}, True, stored_at=time.time() - 25))
+        self.assertEqual(cache.lookup("http://fresh/")[1], HP_cache.FRESH)
+        self.assertEqual(cache.lookup("http://stale/")[1], HP_cache.STALE)
+        self.assertEqual(cache.lookup("http://expired/")[1], HP_cache.EXPIRED)
+        self.assertIsNone(cache.get("http://expired/"))
+        self.assertEqual(cache.lookup("http://unknown/"), (None, None))
+
+class TestSqliteCache(unittest.TestCase):
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "previews.sqlite")
+            cache = HP_cache.SqliteCache(path, max_entries=2)
+            for index in range(3):
+                cache.set(f"http://site/{index}", HP_cache.CacheEntry({"title": str(index)}, True,
+                                                                      stored_at=time.time() + index))
+            cache.close()
+            cache = HP_cache.SqliteCache(path)
+            self.assertEqual(len(cache), 2)
+            self.assertIsNone(cache.get("http://site/0"))
+            self.assertEqual(cache.get("http://site/2").datas["title"], "2")
+            cache.close()
+
+    def test_aliases_bounded(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = HP_cache.SqliteCache(os.path.join(folder, "previews.sqlite"), max_entries=2)
+            cache.max_aliases = 3
+            for index in range(3):
+                cache.set(f"http://site/{index}", HP_cache.CacheEntry({"title": str(index)}, True,
+                                                                      stored_at=time.time() + index),
+                          aliases=[f"http://alias/{index}"])
+            self.assertIsNone(cache.get("http://alias/0"))
+            self.assertEqual(cache.get("http://alias/2").datas["title"], "2")
+            self.assertEqual(aliases_count(cache), 2)  # the alias of the removed entry is removed too
+            cache.set("http://site/3", HP_cache.CacheEntry({"title": "3"}, True, stored_at=time.time() + 3),
+                      aliases=[f"http://other/{index}" for index in range(4)])
+            self.assertEqual(aliases_count(cache), 3)
+            self.assertEqual(cache.get("http://other/3").datas["title"], "3")
+            cache.delete("http://site/3")
+            self.assertEqual(aliases_count(cache), 0)
+            cache.close()
+
+def aliases_count(cache):
+    return cache._connection.execute("SELECT COUNT(*) FROM aliases").fetchone()[0]  # pylint: disable=protected-access
+
+def conditional_page(handler):
+    if handler.headers.get("If-None-Match") == '"v1"':
+        return (304, {"ETag": '"v1"'}, b"")
+    return (200, {"Content-Type": "text/html", "ETag": '"v1"', "Last-Modified": "Wed, 21 Oct 2015 07:28:00 GMT"},
+            b'<html><head><meta property="og:title" content="Fetched"></head></html>')
+
+class TestPreviewWithCache(unittest.TestCase):
+    def test_hit_does_not_fetch(self):
+        cache = HP_cache.MemoryCache()
+        with LocalServer(ROUTES) as server:
+            first = HP.HyperLinkPreview(server.url("/page"), cache=cache)
+            second = HP.HyperLinkPreview(server.url("/page"), cache=cache)
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(second.get_data(), first.get_data())
+        self.assertTrue(second.is_valid)
+        self.assertEqual(cache.stats()["hits"], 1)
+
+    def test_stale_while_revalidate(self):
+        cache = HP_cache.MemoryCache(ttl=10, stale_while_revalidate=100)
+        with LocalServer(ROUTES) as server:
+            cache.set(server.url("/page"), HP_cache.CacheEntry({"title": "Old"}, True, stored_at=time.time() - 50))
+            hlp = HP.HyperLinkPreview(server.url("/page"), cache=cache)
+            self.assertEqual(hlp.get_data()["title"], "Old")
+            for _ in range(100):
+                if cache.get(server.url("/page")).datas["title"] == "Cached":
+                    break
+                time.sleep(0.02)
+        self.assertEqual(cache.get(server.url("/page")).datas["title"], "Cached")
+        self.assertEqual(cache.lookup(server.url("/page"))[1], HP_cache.FRESH)
+
+    def test_expired_not_modified(self):
+        cache = HP_cache.MemoryCache(ttl=10)
+        with LocalServer({"/page": (200, {}, conditional_page)}) as server:
+            url = server.url("/page")
+            cache.set(url, HP_cache.CacheEntry({"title": "Cached"}, True, stored_at=time.time() - 50, etag='"v1"'))
+            hlp = HP.HyperLinkPreview(url, cache=cache)
+            self.assertEqual(hlp.get_data()["title"], "Cached")
+            self.assertEqual(server.requests[-1][1]["If-None-Match"], '"v1"')
+            self.assertEqual(cache.lookup(url)[1], HP_cache.FRESH)
+            self.assertEqual(cache.stats()["not_modified"], 1)
+
+            cache.set(url, HP_cache.CacheEntry({"title": "Cached"}, True, stored_at=time.time() - 50, etag='"v0"'))
+            hlp = HP.HyperLinkPreview(url, cache=cache)
+            self.assertEqual(hlp.get_data()["title"], "Fetched")
+        entry = cache.peek(url)
+        self.assertEqual(entry.etag, '"v1"')
+        self.assertEqual(entry.last_modified, "Wed, 21 Oct 2015 07:28:00 GMT")
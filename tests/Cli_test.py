@@ -0,0 +1,38 @@
+import json
+import os
+import tempfile
+import unittest
+from src.hyperlink_preview.__main__ import main
+from src.hyperlink_preview.store import PreviewStore
+from local_server import LocalServer, png
+
+ROUTES = {
+    "/page": (200, {"Content-Type": "text/html"}, b'<html><head><title>Page</title></head><body>'
+                                                   b'<img src="/big.png"></body></html>'),
+    "/big.png": (200, {"Content-Type": "image/png"}, png(800, 600)),
+    "/doc.pdf": (200, {"Content-Type": "application/pdf"}, b"%PDF-1.4"),
+}
+
+class TestCli(unittest.TestCase):
+    def test_jsonl(self):
+        with tempfile.TemporaryDirectory() as folder, LocalServer(ROUTES) as server:
+            input_path = os.path.join(folder, "urls.txt")
+            output_path = os.path.join(folder, "previews.jsonl")
+            store_path = os.path.join(folder, "previews.hlp")
+            with open(input_path, "w", encoding="utf-8") as file:
+                file.write(f"# urls\n{server.url('/page')}\n\n{server.url('/doc.pdf')}\nhttp://\n")
+            self.assertEqual(main([input_path, "-o", output_path, "--workers", "2", "--store", store_path]), 0)
+            with open(output_path, encoding="utf-8") as file:
+                records = {record["url"]: record for record in map(json.loads, file)}
+            store = PreviewStore(store_path)
+            stored = store.get(server.url("/page"))
+            store.close()
+        self.assertEqual(len(records), 3)
+        page = records[server.url("/page")]
+        self.assertEqual(page["status"], "ok")
+        self.assertEqual(page["data"]["image"], server.url("/big.png"))
+        self.assertEqual(set(page["timings"]), {"fetch", "parse", "images", "total"})
+        self.assertEqual(records[server.url("/doc.pdf")]["status"], "not_a_page")
+        self.assertEqual(records["http://"]["status"], "error")
+        self.assertIn("error", records["http://"])
+        self.assertEqual(stored.datas["title"], "Page")
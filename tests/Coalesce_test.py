@@ -0,0 +1,129 @@
+import threading
+import time
+import unittest
+import requests
+import src.hyperlink_preview as HP
+from src.hyperlink_preview.image_cache import ImageSizeCache
+from src.hyperlink_preview.scheduler import FetchScheduler
+from src.hyperlink_preview.singleflight import SingleFlight
+from local_server import LocalServer, png, slow
+
+def page(title):
+    return (f'<html><head><title>{title}</title></head><body><img src="/logo.png"><img src="/big.png">'
+            f'</body></html>').encode()
+
+ROUTES = {
+    "/viral": (200, {}, slow(0.3, (200, {"Content-Type": "text/html"}, page("Viral")))),
+    "/other": (200, {"Content-Type": "text/html"}, page("Other")),
+    "/another": (200, {"Content-Type": "text/html"}, page("Another")),
+    "/logo.png": (200, {}, slow(0.3, (200, {"Content-Type": "image/png"}, png(100, 100)))),
+    "/big.png": (200, {}, slow(0.3, (200, {"Content-Type": "image/png"}, png(800, 600)))),
+}
+
+def preview_concurrently(urls, **kwargs):
+    previews = [None] * len(urls)
+
+    def preview(index):
+        previews[index] = HP.HyperLinkPreview(urls[index], image_cache=ImageSizeCache(), **kwargs)
+        previews[index].get_data()
+    threads = [threading.Thread(target=preview, args=(index,)) for index in range(len(urls))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return previews
+
+class TestCoalesce(unittest.TestCase):
+    def test_same_url(self):
+        with LocalServer(ROUTES) as server:
+            previews = preview_concurrently([server.url("/viral")] * 20)
+            paths = [path for path, _ in server.requests]
+        self.assertEqual(paths.count("/viral"), 1)
+        self.assertLessEqual(paths.count("/big.png"), 1)
+        self.assertEqual(sum(preview.shared for preview in previews), 19)
+        for preview in previews:
+            self.assertEqual(preview.get_data()["image"], server.url("/big.png"))
+            self.assertEqual(preview.get_data()["title"], "Viral")
+
+    def test_same_image(self):
+        with LocalServer(ROUTES) as server:
+            previews = preview_concurrently([server.url("/other"), server.url("/another")])
+            paths = [path for path, _ in server.requests]
+        self.assertEqual(paths.count("/big.png"), 1)
+        self.assertEqual([preview.get_data()["image"] for preview in previews], [server.url("/big.png")] * 2)
+        self.assertFalse(any(preview.shared for preview in previews))
+
+    def test_different_waits(self):
+        image_cache = ImageSizeCache()
+        with LocalServer(ROUTES) as server:
+            leader = HP.HyperLinkPreview(server.url("/other"), image_cache=image_cache)
+            follower = HP.HyperLinkPreview(server.url("/other"), image_cache=image_cache)  # images in flight
+            self.assertTrue(follower.shared)
+            self.assertIsNone(follower.get_data(timeout=0.05)["image"])  # impatient
+            self.assertEqual(leader.get_data()["image"], server.url("/big.png"))  # patient
+            self.assertEqual(follower.get_data()["image"], server.url("/big.png"))
+        self.assertFalse(leader.is_partial or follower.is_partial)
+
+    def test_follower_holds_no_worker(self):
+        scheduler = FetchScheduler(max_concurrency=3, per_host_limit=3)
+        try:
+            with LocalServer(ROUTES) as server:
+                leader = HP.HyperLinkPreview(server.url("/other"), scheduler=scheduler, image_cache=ImageSizeCache())
+                follower = HP.HyperLinkPreview(server.url("/another"), scheduler=scheduler,
+                                               image_cache=ImageSizeCache())
+                time.sleep(0.05)
+                # the leader probes hold 2 workers: the probes following them hold none
+                start = time.monotonic()
+                scheduler.submit("", time.monotonic).result()
+                self.assertLess(time.monotonic() - start, 0.15)
+                self.assertEqual(follower.get_data()["image"], server.url("/big.png"))
+                self.assertEqual(leader.get_data()["image"], server.url("/big.png"))
+                paths = [path for path, _ in server.requests]
+            self.assertEqual(paths.count("/big.png"), 1)
+            self.assertEqual(paths.count("/logo.png"), 1)
+        finally:
+            scheduler.shutdown()
+
+    def test_no_coalesce(self):
+        with LocalServer(ROUTES) as server:
+            previews = preview_concurrently([server.url("/viral")] * 3, coalesce=False)
+            paths = [path for path, _ in server.requests]
+        self.assertEqual(paths.count("/viral"), 3)
+        self.assertFalse(any(preview.shared for preview in previews))
+
+    def test_leader_failure(self):
+        errors = [None] * 5
+
+        def preview(index):
+            try:
+                HP.HyperLinkPreview(server.url("/viral"), fetch_timeout=0.1)
+            except requests.exceptions.Timeout as ex:
+                errors[index] = ex
+
+        with LocalServer(ROUTES) as server:
+            threads = [threading.Thread(target=preview, args=(index,)) for index in range(len(errors))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertTrue(all(isinstance(error, requests.exceptions.Timeout) for error in errors))
+        self.assertEqual(len({id(error) for error in errors}), len(errors))  # each follower raises its own copy
+        causes = {id(error.__cause__) for error in errors if error.__cause__ is not None}
+        self.assertEqual(len(causes), 1)  # the error of the leader
+        self.assertIn(next(iter(causes)), {id(error) for error in errors})
+
+    def test_single_flight_failure(self):
+        flights = SingleFlight()
+        future, leader = flights.begin("key")
+        self.assertTrue(leader)
+        waiting, leader = flights.begin("key")
+        self.assertIs(waiting, future)
+        self.assertFalse(leader)
+        flights.fail("key", future, ValueError("shared"))
+        with self.assertRaises(ValueError):
+            waiting.result()
+        self.assertEqual(len(flights), 0)
+        self.assertTrue(flights.begin("key")[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import time
+import unittest
+import requests
+import src.hyperlink_preview as HP
+from src.hyperlink_preview import extractor
+from src.hyperlink_preview.cache import MemoryCache
+from src.hyperlink_preview.image_cache import ImageSizeCache
+from local_server import LocalServer, drip, png, slow
+
+PAGE = b'<html><head><title>Slow images</title></head><body><img src="/medium.png"><img src="/big.png"></body></html>'
+
+def routes(image_delay=0, page_delay=0):
+    return {
+        "/": (200, {}, slow(page_delay, (200, {"Content-Type": "text/html"}, PAGE))),
+        "/medium.png": (200, {}, slow(image_delay, (200, {"Content-Type": "image/png"}, png(200, 150)))),
+        "/big.png": (200, {}, slow(image_delay, (200, {"Content-Type": "image/png"}, png(800, 600)))),
+    }
+
+class TestDeadline(unittest.TestCase):
+    def test_total_timeout(self):
+        cache = MemoryCache()
+        with LocalServer(routes(image_delay=2)) as server:
+            start = time.monotonic()
+            hlp = HP.HyperLinkPreview(server.url("/"), timeout=0.5, cache=cache,
+                                      image_cache=ImageSizeCache())
+            data = hlp.get_data()
+            self.assertLess(time.monotonic() - start, 1.5)
+        self.assertEqual(data["title"], "Slow images")
+        self.assertIsNone(data["image"])
+        self.assertTrue(hlp.is_partial)
+        self.assertTrue(data.is_partial)
+        self.assertIsNone(cache.peek(server.url("/")))  # a partial result is not cached
+
+    def test_get_data_timeout(self):
+        with LocalServer(routes(image_delay=2)) as server:
+            hlp = HP.HyperLinkPreview(server.url("/"), image_cache=ImageSizeCache())
+            self.assertFalse(hlp.is_partial)
+            start = time.monotonic()
+            data = hlp.get_data(timeout=0.2)
+            self.assertLess(time.monotonic() - start, 1)
+            self.assertIsNone(data["image"])
+            self.assertTrue(data.is_partial)
+            self.assertFalse(hlp.image_search.finished)  # only the wait ended
+            data = hlp.get_data()
+            self.assertEqual(data["image"], server.url("/big.png"))
+            self.assertFalse(data.is_partial)
+        self.assertFalse(hlp.is_partial)
+
+    def test_fetch_timeout(self):
+        with LocalServer(routes(page_delay=2)) as server:
+            start = time.monotonic()
+            with self.assertRaises(requests.exceptions.Timeout):
+                HP.HyperLinkPreview(server.url("/"), fetch_timeout=0.3)
+            self.assertLess(time.monotonic() - start, 1.5)
+
+    def test_slow_body(self):
+        page = b'<html><head><title>Slow body</title></head><body>' + b'<p>text</p>' * 2000 + b'</body></html>'
+        for timeouts in ({"fetch_timeout": 0.5}, {"timeout": 0.5}):
+            with self.subTest(**timeouts):
+                # 200 bytes every 50 ms: each read is quick, the whole body takes 5 seconds
+                with LocalServer({"/": (200, {}, drip("text/html", page, 200, 0.05))}) as server:
+                    start = time.monotonic()
+                    hlp = HP.HyperLinkPreview(server.url("/"), **timeouts)
+                    self.assertLess(time.monotonic() - start, 1.5)
+                self.assertTrue(hlp.is_partial)
+                self.assertLess(hlp.fetched_bytes, len(page))
+                if "fetch_timeout" in timeouts:  # else, no time is left to parse
+                    self.assertEqual(hlp.get_data()["title"], "Slow body")
+
+    def test_complete_in_time(self):
+        with LocalServer(routes()) as server:
+            hlp = HP.HyperLinkPreview(server.url("/"), timeout=5, fetch_timeout=2, parse_timeout=2,
+                                      image_cache=ImageSizeCache())
+            self.assertEqual(hlp.get_data()["image"], server.url("/big.png"))
+        self.assertFalse(hlp.is_partial)
+
+    def test_parse_deadline(self):
+        html = "<html><head><title>Big</title></head><body>" + "<p>word</p>" * 50000 + "</body></html>"
+        for parser in ("html.parser", "lxml"):
+            with self.subTest(parser=parser):
+                page = extractor.extract(html, parser, deadline=time.monotonic())
+                self.assertTrue(page.truncated)
+                self.assertIsNone(page.title)
+                page = extractor.extract(html, parser, deadline=time.monotonic() + 60)
+                self.assertFalse(page.truncated)
+                self.assertEqual(page.title, "Big")
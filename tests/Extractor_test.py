@@ -0,0 +1,92 @@
+import unittest
+from bs4 import BeautifulSoup
+from src.hyperlink_preview import extractor
+
+SNIPPETS = [
+    '<html><head><title>T</title><meta property="og:title" content="OG"><meta property="og:image">'
+    '<meta name="Description" content="D"><link rel="icon image_src" href="/i.png"></head>'
+    '<body><h1>H1</h1><p>One <b>two</b></p><img src="a.png"><img></body></html>',
+    "<p>a<script>x</script>b<style>s</style><template>t</template><ruby>r<rt>rt</rt><rp>rp</rp></ruby>"
+    "<!--c--><![CDATA[cd]]>z</p>",
+    "<p>a<p>b</p>c</p><div><p>one<b>two</div>three</p>",
+    "<p>x &amp; &nbsp; &lt; &notin &copy &bogus; &#150; y</p>",
+    "<title>T<b>b</b></title><h2>\n  </h2><h1>first</h1><h1>second</h1>",
+    "<p/>after<p>x<br>y</br>z</p><pre>\n  </pre>",
+    '<h2 src><img rel="x image_src" href="h">\ttext</img>\n  ',
+    "<template><p>in template <script>s</script></p></template><head><p>in head</p></head>",
+    '<meta name="Description"><meta name="Description" content="second"><p>text',
+    '<body><p>shown <span hidden>hidden</span><b aria-hidden="true">aria</b><i style="DISPLAY: none;">none</i>end</p>'
+    '<div style="display:none"><p>in hidden div</p></div><noscript><p>no script</p></noscript>'
+    '<p aria-hidden="false">visible</p><p hidden>hidden p</p></body>',
+    "<body><p>First para<p>Second para<p>Third</body>",
+    "<body><p>Intro<div>block</div>tail</p></body>",
+]
+
+# lxml builds the tree as browsers do, bs4 does not: the paragraphs lxml finds where they differ.
+LXML_PARAGRAPHS = {
+    SNIPPETS[1]: ["abrz"],  # bs4 has no <body>: a top level <p> is in [document], not scraped
+    SNIPPETS[2]: ["a", "b", "onetwo"],  # <p> closes the open <p>
+    SNIPPETS[3]: ["x & \xa0 < \xacin \xa9 &bogus; \u2013 y"],
+    SNIPPETS[5]: ["", "xyz"],
+    SNIPPETS[7]: ["in head"],  # <p> ends the <head>
+    SNIPPETS[8]: ["text"],
+    SNIPPETS[10]: ["First para", "Second para", "Third"],  # bs4 nests the unclosed <p>
+    SNIPPETS[11]: ["Intro"],  # <div> closes the <p>, "tail" is out of any <p>
+}
+
+class TestPageExtractor(unittest.TestCase):
+    def test_same_as_soup(self):
+        for html in SNIPPETS:
+            with self.subTest(html=html):
+                self.assertEqual(extractor.PageExtractor.extract(html).__dict__,
+                                 extractor.soup_page_data(BeautifulSoup(html, "html.parser")).__dict__)
+
+    def test_lxml_same_as_soup(self):
+        if extractor.lxml is None:
+            self.skipTest("lxml is not installed")
+        for html in SNIPPETS:
+            with self.subTest(html=html):
+                page = extractor.lxml_page_data(html).__dict__
+                expected = extractor.soup_page_data(BeautifulSoup(html, "html.parser")).__dict__
+                if html in LXML_PARAGRAPHS:
+                    self.assertEqual(page.pop("paragraphs"), LXML_PARAGRAPHS[html])
+                    expected.pop("paragraphs")
+                    page.pop("description")
+                    expected.pop("description")
+                self.assertEqual(page, expected)
+
+    def test_markup_in_title(self):
+        for parser in extractor.PARSERS:
+            with self.subTest(parser=parser):
+                self.assertEqual(extractor.extract(SNIPPETS[4], parser).title, "Tb")
+
+    def test_default_parser(self):
+        self.assertEqual(extractor.default_parser, "html.parser")
+
+    def test_page_data(self):
+        page = extractor.PageExtractor.extract(SNIPPETS[0])
+        self.assertEqual(page.og, {"title": "OG"})
+        self.assertEqual(page.title, "T")
+        self.assertEqual(page.h1, "H1")
+        self.assertIsNone(page.h2)
+        self.assertEqual(page.description_meta, "D")
+        self.assertEqual(page.paragraphs, ["One two"])
+        self.assertEqual(page.image_link, "/i.png")
+        self.assertEqual(page.img_srcs, ["a.png"])
+        self.assertEqual(page.description, "One two")
+
+class TestDescription(unittest.TestCase):
+    def test_hidden_elements(self):
+        for parser in extractor.PARSERS:
+            with self.subTest(parser=parser):
+                page = extractor.extract(SNIPPETS[9], parser)
+                self.assertEqual(page.paragraphs, ["shown end", "visible"])
+                self.assertEqual(page.description, "shown end visible")
+
+    def test_stops_after_max_chars(self):
+        html = "<body><p>  first\n paragraph </p>" + "<p>" + "word " * 300 + "</p>" + "<p>never used</p>" * 1000
+        for parser in extractor.PARSERS:
+            with self.subTest(parser=parser):
+                page = extractor.extract(html, parser)
+                self.assertEqual(len(page.paragraphs), 2)
+                self.assertEqual(page.description, ("first paragraph " + "word " * 300)[:1000])
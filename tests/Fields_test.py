@@ -0,0 +1,52 @@
+import unittest
+import src.hyperlink_preview as HP
+from src.hyperlink_preview.cache import MemoryCache
+from src.hyperlink_preview.image_cache import ImageSizeCache
+from local_server import LocalServer, png
+
+PAGE = b'<html><head><title>Lazy</title></head><body><p>Some text.</p><img src="/small.png"><img src="/big.png">' \
+       b'</body></html>'
+ROUTES = {
+    "/": (200, {"Content-Type": "text/html"}, PAGE),
+    "/small.png": (200, {"Content-Type": "image/png"}, png(20, 20)),
+    "/big.png": (200, {"Content-Type": "image/png"}, png(800, 600)),
+}
+
+class TestFields(unittest.TestCase):
+    def test_image_searched_when_requested(self):
+        with LocalServer(ROUTES) as server:
+            hlp = HP.HyperLinkPreview(server.url("/"), fields=["title", "domain"], image_cache=ImageSizeCache())
+            self.assertEqual(hlp.get_data(), {"title": "Lazy", "domain": f"127.0.0.1:{server.httpd.server_port}"})
+            self.assertIsNone(hlp.image_search)
+            self.assertEqual([path for path, _ in server.requests], ["/"])
+
+            self.assertEqual(hlp.get_data(fields=["image"]), {"image": server.url("/big.png")})
+            self.assertEqual(hlp.get_data(fields=["image", "description"]),
+                             {"image": server.url("/big.png"), "description": "Some text."})
+            probes = len(server.requests)
+            self.assertEqual(hlp.get_data(fields=["image"]), {"image": server.url("/big.png")})
+            self.assertEqual(len(server.requests), probes)  # kept
+
+    def test_dependencies(self):
+        with LocalServer(ROUTES) as server:
+            hlp = HP.HyperLinkPreview(server.url("/"), fields=["site_name"])
+            self.assertEqual(hlp.get_data(wait_for_imgs=False), {"site_name": "127.0.0"})
+            self.assertEqual(hlp.get_data(wait_for_imgs=False, fields=["url", "domain"]),
+                             {"url": server.url("/"), "domain": f"127.0.0.1:{server.httpd.server_port}"})
+
+    def test_unknown_field(self):
+        with self.assertRaises(ValueError):
+            HP.HyperLinkPreview("http://127.0.0.1:1/", fields=["titel"])
+
+    def test_not_cached_until_all_fields(self):
+        cache = MemoryCache()
+        with LocalServer(ROUTES) as server:
+            hlp = HP.HyperLinkPreview(server.url("/"), fields=["title"], cache=cache, image_cache=ImageSizeCache())
+            hlp.get_data()
+            self.assertIsNone(cache.peek(server.url("/")))
+            hlp = HP.HyperLinkPreview(server.url("/"), cache=cache, image_cache=ImageSizeCache())
+            hlp.get_data()
+            self.assertEqual(cache.peek(server.url("/")).datas["image"], server.url("/big.png"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -20,7 +20,8 @@ class TestUrl(unittest.TestCase):
 
         url_img = "https://www.tolkiendil.com/_media/logo/logo.png?w=500"
         hp = HP.HyperLinkPreview(url=url_img)
-        self.assertFalse(hp.is_valid)
+        self.assertTrue(hp.is_valid)  # a link to an image is its own preview
+        self.assertEqual(hp.get_data()["image"], url_img)
 
 
     # def test_fetch_bot_forbiden(self):
@@ -59,8 +60,11 @@ class TestParseHtml(unittest.TestCase):
     def test_not_html(self):
         url = "https://andrejgajdos.com/wp-content/uploads/2019/11/generating-link-preview.png"
         hp = HP.HyperLinkPreview(url=url)
-        for one_value in hp.get_data().values():
-            self.assertIsNone(one_value)
+        data = hp.get_data()
+        self.assertEqual(data["image"], url)
+        self.assertEqual(data["title"], "generating-link-preview.png")
+        self.assertIsNone(data["description"])
+        self.assertIsNotNone(hp.direct_image)
 
     def test_html_begins_with_windows_nl(self):
         url = "https://social.technet.microsoft.com/wiki/contents/articles/51722.windows-problem-steps-recorder-psr-quick-and-easy-documenting-of-your-steps-and-procedures.aspx"
@@ -0,0 +1,72 @@
+import os
+import tempfile
+import time
+import unittest
+import src.hyperlink_preview as HP
+from src.hyperlink_preview.image_cache import ImageSizeCache
+from local_server import LocalServer, jpeg, png, ranged
+
+PAGE = b'<html><body><img src="/banner.png"><img src="/missing.png"><img src="/photo.png"></body></html>'
+ROUTES = {
+    "/page1": (200, {"Content-Type": "text/html"}, PAGE),
+    "/page2": (200, {"Content-Type": "text/html"}, PAGE),
+    "/banner.png": (200, {"Content-Type": "image/png"}, png(100, 20)),
+    "/photo.png": (200, {"Content-Type": "image/png"}, png(400, 300)),
+}
+
+def image_requests(server):
+    return sorted(path for path, _ in server.requests if path.endswith(".png"))
+
+class TestImageCache(unittest.TestCase):
+    def test_shared_between_previews(self):
+        image_cache = ImageSizeCache()
+        with LocalServer(ROUTES) as server:
+            first = HP.HyperLinkPreview(server.url("/page1"), image_cache=image_cache)
+            self.assertEqual(first.get_data()["image"], server.url("/photo.png"))
+            self.assertEqual(image_requests(server), ["/banner.png", "/missing.png", "/photo.png"])
+            second = HP.HyperLinkPreview(server.url("/page2"), image_cache=image_cache)
+            self.assertEqual(second.get_data()["image"], server.url("/photo.png"))
+            self.assertEqual(len(image_requests(server)), 3)  # the 404 is cached too
+        self.assertEqual(image_cache.stats(), {"hits": 2, "negative_hits": 1, "misses": 3, "size": 3})
+
+    def test_negative_ttl(self):
+        image_cache = ImageSizeCache(negative_ttl=0.1)
+        image_cache.set_failed("https://h/missing.png")
+        image_cache.set("https://h/ok.png", 10, 20, "png")
+        self.assertTrue(image_cache.get("https://h/missing.png").is_negative())
+        time.sleep(0.15)
+        self.assertIsNone(image_cache.get("https://h/missing.png"))
+        self.assertEqual(image_cache.get("https://h/ok.png").format, "png")
+
+    def test_range_cut_not_cached(self):
+        photo = jpeg(800, 600, padding=105000)
+        routes = {"/page": (200, {"Content-Type": "text/html"}, b'<html><body><img src="/photo.jpg"></body></html>'),
+                  "/photo.jpg": (200, {}, ranged("image/jpeg", photo, max_ranges=1)),  # no next range
+                  "/empty.png": (200, {"Content-Type": "image/png"}, b'not an image')}
+        image_cache = ImageSizeCache()
+        with LocalServer(routes) as server:
+            hlp = HP.HyperLinkPreview(server.url("/page"), image_cache=image_cache)
+            self.assertIsNone(hlp.get_data()["image"])
+            self.assertIsNone(image_cache.get(server.url("/photo.jpg")))  # not sized, but not known as unsized
+
+            routes["/page"] = (200, {"Content-Type": "text/html"}, b'<html><body><img src="/empty.png"></body></html>')
+            HP.HyperLinkPreview(server.url("/page"), image_cache=image_cache, coalesce=False).get_data()
+            self.assertTrue(image_cache.get(server.url("/empty.png")).is_negative())  # read to its end
+
+    def test_lru(self):
+        image_cache = ImageSizeCache(max_entries=2)
+        for name in ("a", "b", "c"):
+            image_cache.set(f"https://h/{name}.png", 10, 20, "png")
+        self.assertIsNone(image_cache.get("https://h/a.png"))
+        self.assertEqual(len(image_cache), 2)
+
+    def test_persistence(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "images.sqlite")
+            image_cache = ImageSizeCache(path=path)
+            image_cache.set("https://h/a.png", 10, 20, "png")
+            image_cache.close()
+            image_cache = ImageSizeCache(path=path)
+            entry = image_cache.get("https://H/a.png#fragment")
+            image_cache.close()
+        self.assertEqual((entry.width, entry.height, entry.format), (10, 20, "png"))
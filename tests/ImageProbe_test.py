@@ -0,0 +1,98 @@
+import time
+import unittest
+import src.hyperlink_preview as HP
+from src.hyperlink_preview import image_probe
+from src.hyperlink_preview.image_cache import ImageSizeCache
+from local_server import LocalServer, jpeg, png, ranged
+
+def gallery(count, big_attributes=''):
+    """
+    Returns: a page with count thumbnails, then one big image.
+    """
+    thumbnails = "".join(f'<img src="/thumb{index}.png" width="40" height="40">' for index in range(count))
+    return f'<html><body><p>Gallery</p>{thumbnails}<img src="/big.png"{big_attributes}></body></html>'.encode()
+
+def routes(page, image_delay=0):
+    def slow_png(width, height):
+        def respond(_handler):
+            time.sleep(image_delay)
+            return (200, {"Content-Type": "image/png"}, png(width, height))
+        return respond
+    routes = {f"/thumb{index}.png": (200, {}, slow_png(40, 40)) for index in range(300)}
+    routes["/big.png"] = (200, {}, slow_png(800, 600))
+    routes["/medium.png"] = (200, {}, slow_png(200, 150))
+    routes["/"] = (200, {"Content-Type": "text/html"}, page)
+    return routes
+
+def probed(server):
+    return [path for path, _ in server.requests if path.endswith(".png")]
+
+class TestRank(unittest.TestCase):
+    def test_hints(self):
+        self.assertEqual(image_probe.parse_length("300"), 300)
+        self.assertEqual(image_probe.parse_length(" 300px "), 300)
+        self.assertIsNone(image_probe.parse_length("50%"))
+        self.assertEqual(image_probe.parse_srcset_width("a.jpg 320w, b.jpg 1024w, c.jpg 2x"), 1024)
+        self.assertIsNone(image_probe.parse_srcset_width("a.jpg 2x"))
+
+    def test_rank(self):
+        candidates = [
+            image_probe.ImageCandidate.from_tag("https://h/logo.png", 0, {}),
+            image_probe.ImageCandidate.from_tag("https://h/small.png", 1, {"width": "32", "height": "32"}),
+            image_probe.ImageCandidate.from_tag("https://h/unknown.png", 2, {}),
+            image_probe.ImageCandidate.from_tag("https://h/photo.jpg", 3, {"srcset": "p.jpg 1200w"}),
+            image_probe.ImageCandidate.from_tag("https://h/unknown.png", 4, {}),
+            image_probe.ImageCandidate.from_tag("https://h/medium.jpg", 5, {"width": "300", "height": "200"}),
+        ]
+        ranked = [candidate.url for candidate in image_probe.rank(candidates)]
+        self.assertEqual(ranked, ["https://h/photo.jpg", "https://h/medium.jpg", "https://h/unknown.png",
+                                  "https://h/logo.png", "https://h/small.png"])
+        self.assertEqual(len(image_probe.rank(candidates, max_probes=2)), 2)
+
+class TestImageProbes(unittest.TestCase):
+    def test_budget(self):
+        with LocalServer(routes(gallery(100))) as server:
+            hlp = HP.HyperLinkPreview(server.url("/"))
+            self.assertEqual(hlp.get_data()["image"], server.url("/big.png"))
+            self.assertLessEqual(len(probed(server)), HP.HyperLinkPreview.max_image_probes)
+            self.assertIn("/big.png", probed(server))
+            self.assertTrue(all(headers.get("Range") == "bytes=0-65535" for path, headers in server.requests
+                                if path.endswith(".png")))
+
+    def test_stops_when_clear_winner(self):
+        class OneProbeAtATime(HP.HyperLinkPreview):
+            max_concurrent_images = 1
+
+        page = gallery(50, ' width="800" height="600"')
+        with LocalServer(routes(page)) as server:
+            hlp = OneProbeAtATime(server.url("/"))
+            self.assertEqual(hlp.get_data()["image"], server.url("/big.png"))
+            self.assertEqual(hlp.image_search.probes, 1)
+
+    def test_with_scheduler(self):
+        scheduler = HP.FetchScheduler(max_concurrency=4, per_host_limit=2)
+        try:
+            with LocalServer(routes(gallery(30))) as server:
+                hlp = HP.HyperLinkPreview(server.url("/"), scheduler=scheduler)
+                self.assertEqual(hlp.get_data()["image"], server.url("/big.png"))
+                self.assertLessEqual(hlp.image_search.probes, HP.HyperLinkPreview.max_image_probes)
+        finally:
+            scheduler.shutdown()
+
+    def test_images_timeout(self):
+        page = b'<html><body><img src="/medium.png"><img src="/big.png"></body></html>'
+        with LocalServer(routes(page, image_delay=2)) as server:
+            start = time.monotonic()
+            hlp = HP.HyperLinkPreview(server.url("/"), images_timeout=0.3)
+            self.assertIsNone(hlp.get_data()["image"])
+            self.assertLess(time.monotonic() - start, 1.5)
+            self.assertTrue(hlp.image_search.timed_out)
+
+    def test_header_after_first_range(self):
+        page = b'<html><body><img src="/medium.png"><img src="/photo.jpg"></body></html>'
+        photo = jpeg(800, 600, padding=105000)  # 65000 bytes of EXIF, 40000 of ICC
+        with LocalServer(dict(routes(page), **{"/photo.jpg": (200, {}, ranged("image/jpeg", photo))})) as server:
+            hlp = HP.HyperLinkPreview(server.url("/"), image_cache=ImageSizeCache())
+            self.assertEqual(hlp.get_data()["image"], server.url("/photo.jpg"))
+            self.assertEqual([headers["Range"] for path, headers in server.requests if path == "/photo.jpg"],
+                             ["bytes=0-65535", "bytes=65536-131071"])
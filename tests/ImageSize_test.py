@@ -0,0 +1,108 @@
+import struct
+import unittest
+import requests
+from src.hyperlink_preview import image_size
+from local_server import LocalServer, jpeg, png, ranged
+
+def gif(width, height):
+    return b'GIF89a' + struct.pack("<HH", width, height) + b'\0' * 16
+
+def box(box_type, payload):
+    return struct.pack(">L", 8 + len(payload)) + box_type + payload
+
+def avif(width, height, brand=b'avif'):
+    ispe = box(b'ispe', b'\0' * 4 + struct.pack(">LL", width, height))
+    thumbnail = box(b'ispe', b'\0' * 4 + struct.pack(">LL", 64, 64))
+    meta = box(b'meta', b'\0' * 4 + box(b'hdlr', b'\0' * 24) + box(b'iprp', box(b'ipco', thumbnail + ispe)))
+    return box(b'ftyp', brand + b'\0\0\0\0' + b'mif1') + meta + box(b'mdat', b'\0' * 100)
+
+def tiff(width, height, endian):
+    header = (b'II*\0' if endian == "<" else b'MM\0*') + struct.pack(endian + "L", 8)
+    entries = struct.pack(endian + "HHLHH", 256, 3, 1, width, 0) + struct.pack(endian + "HHLL", 257, 4, 1, height)
+    return header + struct.pack(endian + "H", 2) + entries
+
+FORMATS = [
+    (jpeg(300, 200, marker=0xc2), (300, 200, "jpeg")),  # progressive
+    (jpeg(300, 200, marker=0xc9), (300, 200, "jpeg")),  # arithmetic
+    (b'RIFF\0\0\0\0WEBPVP8 \0\0\0\0' + b'\0\0\0\x9d\x01\x2a' + struct.pack("<HH", 640, 480), (640, 480, "webp")),
+    (b'RIFF\0\0\0\0WEBPVP8L\0\0\0\0\x2f' + struct.pack("<L", 639 | 479 << 14), (640, 480, "webp")),
+    (b'RIFF\0\0\0\0WEBPVP8X\0\0\0\0\0\0\0\0' + (639).to_bytes(3, "little") + (479).to_bytes(3, "little"),
+     (640, 480, "webp")),
+    (avif(1200, 800), (1200, 800, "avif")),
+    (avif(1200, 800, brand=b'heic'), (1200, 800, "heif")),
+    (box(b'ftyp', b'isom\0\0\0\0mp41') + box(b'mdat', b''), (-1, -1, None)),  # a video
+    (b'BM' + b'\0' * 12 + struct.pack("<Lll", 40, 320, -240), (320, 240, "bmp")),
+    (b'\0\0\1\0\2\0' + bytes([16, 16]) + b'\0' * 14 + bytes([0, 0]) + b'\0' * 14, (256, 256, "ico")),
+    (tiff(101, 102, "<"), (101, 102, "tiff")),
+    (tiff(101, 102, ">"), (101, 102, "tiff")),
+    (b'<svg width="300" height="150px" xmlns="http://www.w3.org/2000/svg">', (300, 150, "svg")),
+    (b'\xef\xbb\xbf<?xml version="1.0"?>\n<!-- comment -->\n<!DOCTYPE svg>\n<svg viewBox="0, 0, 400 100">',
+     (400, 100, "svg")),
+    (b"<svg width='200' viewBox='0 0 400 100'>", (200, 50, "svg")),
+    (b'<svg width="100%" height="100%">', (-1, -1, None)),
+    (b'<html><body><svg width="300" height="150"></svg></body></html>', (-1, -1, None)),
+]
+
+class TestReaders(unittest.TestCase):
+    def test_formats(self):
+        for data, size in ((gif(10, 20), (10, 20)), (png(300, 200), (300, 200)), (jpeg(640, 480), (640, 480)),
+                           (jpeg(641, 481, padding=200000), (641, 481)), (b'not an image', (-1, -1)),
+                           (b'GIF', (-1, -1))):
+            with self.subTest(data=data[:12], size=size):
+                self.assertEqual(image_size.get_size_from_reader(image_size.BytesReader(data, complete=True)), size)
+
+    def test_more_formats(self):
+        for data, expected in FORMATS:
+            with self.subTest(data=data[:16], expected=expected):
+                reader = image_size.BytesReader(data, complete=True)
+                self.assertEqual(image_size.get_size_and_format_from_reader(reader), expected)
+
+    def test_reads_only_the_header(self):
+        data = avif(1200, 800)
+        reader = image_size.BytesReader(data[:data.index(b'mdat') + 4])
+        self.assertEqual(image_size.get_size_from_reader(reader), (1200, 800))
+
+    def test_need_more_data(self):
+        data = jpeg(640, 480, padding=5000)
+        reader = image_size.BytesReader(data[:100])
+        with self.assertRaises(image_size.NeedMoreData) as context:
+            image_size.get_size_from_reader(reader)
+        self.assertGreater(context.exception.size, 100)
+        reader.feed(data[100:])
+        self.assertEqual(image_size.get_size_from_reader(reader), (640, 480))
+
+    def test_response_reader(self):
+        data = jpeg(800, 600, padding=300000)
+        with LocalServer({"/deep.jpg": (200, {"Content-Type": "image/jpeg"}, data)}) as server:
+            with requests.get(server.url("/deep.jpg"), stream=True) as response:
+                reads = []
+                read = response.raw.read
+                response.raw.read = lambda amount, **kwargs: reads.append(amount) or read(amount, **kwargs)
+                reader = image_size.ResponseReader(response)
+                self.assertEqual(image_size.get_size_from_reader(reader), (800, 600))
+        self.assertLess(len(reads), 12)  # growing chunks, not 32 bytes at a time
+        self.assertEqual(reader[0:2], b'\xff\xd8')
+
+    def test_next_ranges(self):
+        data = jpeg(800, 600, padding=105000)  # EXIF and ICC segments longer than the first range
+        with LocalServer({"/deep.jpg": (200, {}, ranged("image/jpeg", data))}) as server:
+            responses = []
+
+            def fetch_range(first, last):
+                responses.append(requests.get(server.url("/deep.jpg"), stream=True,
+                                              headers={"Range": f"bytes={first}-{last}"}))
+                return responses[-1]
+
+            reader = image_size.ResponseReader(fetch_range(0, 65535), fetch_range=fetch_range)
+            self.assertEqual(image_size.get_size_from_reader(reader), (800, 600))
+            self.assertFalse(reader.truncated)
+            self.assertEqual([path_headers[1]["Range"] for path_headers in server.requests],
+                             ["bytes=0-65535", "bytes=65536-131071"])
+
+            reader = image_size.ResponseReader(fetch_range(0, 65535))  # no next range
+            self.assertEqual(image_size.get_size_from_reader(reader), (-1, -1))
+            self.assertTrue(reader.truncated)
+            for response in responses:
+                response.close()
+        self.assertEqual(image_size.parse_content_range("bytes 0-99/*"), (0, 99, None))
+        self.assertIsNone(image_size.parse_content_range("items 0-1/2"))
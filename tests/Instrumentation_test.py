@@ -0,0 +1,126 @@
+import asyncio
+import threading
+import time
+import unittest
+import src.hyperlink_preview as HP
+from src.hyperlink_preview import instrumentation
+from src.hyperlink_preview.cache import MemoryCache
+from src.hyperlink_preview.image_cache import ImageSizeCache
+from local_server import LocalServer, png
+
+PAGE = b'<html><head><title>Images</title></head><body><img src="/small.png"><img src="/big.png"></body></html>'
+ROUTES = {
+    "/": (200, {"Content-Type": "text/html"}, PAGE),
+    "/small.png": (200, {"Content-Type": "image/png"}, png(20, 20)),
+    "/big.png": (200, {"Content-Type": "image/png"}, png(800, 600)),
+}
+
+class RecordingObserver(instrumentation.PreviewObserver):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spans = []
+        self.counts = []
+
+    def span(self, name, url, start, duration, attributes):
+        with self.lock:
+            self.spans.append((name, url, duration, attributes))
+
+    def count(self, name, value, url, attributes):
+        with self.lock:
+            self.counts.append((name, value, attributes))
+
+class TestInstrumentation(unittest.TestCase):
+    def test_spans_and_counters(self):
+        observer = RecordingObserver()
+        with LocalServer(ROUTES) as server:
+            hlp = HP.HyperLinkPreview(server.url("/"), observer=observer, image_cache=ImageSizeCache())
+            self.assertEqual(hlp.get_data()["image"], server.url("/big.png"))
+        names = [span[0] for span in observer.spans]
+        for name in ("fetch", "parse", "parse.url", "parse.domain", "parse.site_name", "parse.title",
+                     "parse.description", "parse.image", "images", "preview"):
+            self.assertEqual(names.count(name), 1, name)
+        probes = {span[1]: span[3] for span in observer.spans if span[0] == "image_probe"}
+        self.assertEqual(probes[server.url("/big.png")], {"status": 200, "found": True})
+        counts = {name: value for name, value, _ in observer.counts}
+        self.assertEqual(counts["page_bytes"], len(PAGE))
+        self.assertGreaterEqual(sum(value for name, value, _ in observer.counts if name == "images_probed"), 1)
+        self.assertNotIn("timeouts", counts)
+
+    def test_cache_hits_and_timeouts(self):
+        def slow_image(_handler):
+            time.sleep(1)
+            return (200, {"Content-Type": "image/png"}, png(800, 600))
+        routes = dict(ROUTES, **{"/big.png": (200, {}, slow_image)})
+        observer = instrumentation.StatsObserver()
+        cache = MemoryCache()
+        with LocalServer(routes) as server:
+            HP.HyperLinkPreview(server.url("/"), observer=observer, images_timeout=0.2,
+                                image_cache=ImageSizeCache()).get_data()
+            HP.HyperLinkPreview(server.url("/"), observer=observer, cache=cache, image_cache=ImageSizeCache()).get_data()
+            HP.HyperLinkPreview(server.url("/"), observer=observer, cache=cache, image_cache=ImageSizeCache()).get_data()
+        stats = observer.stats()
+        self.assertEqual(stats["counters"]["timeouts"], 1)
+        self.assertEqual(stats["counters"]["cache_hits"], 1)
+        self.assertEqual(stats["spans"]["preview"]["count"], 3)
+        self.assertEqual(stats["spans"]["fetch"]["count"], 2)
+
+    def test_preview_reported_once(self):
+        def slow_image(_handler):
+            time.sleep(0.3)
+            return (200, {"Content-Type": "image/png"}, png(800, 600))
+        routes = dict(ROUTES, **{"/big.png": (200, {}, slow_image)})
+
+        async def preview_async(url):
+            hlp = await HP.AsyncHyperLinkPreview.create(url)
+            return await hlp.get_data_full()
+
+        with LocalServer(routes) as server:
+            observer = instrumentation.StatsObserver()
+            HP.HyperLinkPreview(server.url("/"), observer=observer, image_cache=ImageSizeCache()).get_data()
+            self.assertEqual(observer.stats()["spans"]["preview"]["count"], 1)
+
+            observer = instrumentation.StatsObserver()
+            hlp = HP.HyperLinkPreview(server.url("/"), observer=observer, fields=["title"],
+                                      image_cache=ImageSizeCache())
+            hlp.get_data()
+            hlp.get_data(fields=["image"])
+            self.assertEqual(observer.stats()["spans"]["preview"]["count"], 1)
+            self.assertGreaterEqual(hlp.timings["total"], hlp.timings["images"])  # total after the images phase
+            self.assertGreaterEqual(hlp.timings["images"], 0.3)
+
+            observer = instrumentation.StatsObserver()
+            instrumentation.set_default_observer(observer)
+            loop = asyncio.new_event_loop()
+            try:
+                loop.run_until_complete(preview_async(server.url("/")))
+                loop.run_until_complete(asyncio.sleep(0.01))
+            finally:
+                loop.close()
+                instrumentation.set_default_observer(None)
+            self.assertEqual(observer.stats()["spans"]["preview"]["count"], 1)
+
+    def test_default_observer_and_errors(self):
+        class FailingObserver(instrumentation.PreviewObserver):
+            def span(self, name, url, start, duration, attributes):
+                raise RuntimeError("observer bug")
+
+        instrumentation.set_default_observer(FailingObserver())
+        try:
+            with LocalServer(ROUTES) as server, self.assertLogs("hyperlinkpreview", "ERROR"):
+                data = HP.HyperLinkPreview(server.url("/"), image_cache=ImageSizeCache()).get_data()
+        finally:
+            instrumentation.set_default_observer(None)
+        self.assertEqual(data["title"], "Images")
+        self.assertIsNone(instrumentation.get_default_observer())
+
+    def test_optional_adapters(self):
+        for adapter, module in ((instrumentation.PrometheusObserver, "prometheus_client"),
+                                (instrumentation.OpenTelemetryObserver, "opentelemetry")):
+            try:
+                __import__(module)
+            except ImportError:
+                with self.assertRaises(ImportError):
+                    adapter()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+import src.hyperlink_preview as HP
+from src.hyperlink_preview.cache import CacheEntry, MemoryCache, SqliteCache
+from src.hyperlink_preview.normalization import TRACKING_PARAMS, UrlNormalizer
+from local_server import LocalServer
+
+POST = b'<html><head><title>Post</title><link rel="canonical" href="/post"><meta property="og:image" ' \
+       b'content="/og.png"></head><body></body></html>'
+CLAIMING = b'<html><head><title>Claiming</title><meta property="og:url" content="https://bank.example/">' \
+           b'<meta property="og:image" content="/og.png"></head><body></body></html>'
+
+class TestNormalizer(unittest.TestCase):
+    def test_variants_same_key(self):
+        normalizer = UrlNormalizer()
+        key = normalizer.key("https://example.com/post?a=1&b=2")
+        for variant in ("http://example.com/post?a=1&b=2", "https://www.Example.com:443/post?b=2&a=1",
+                        "https://example.com/post?utm_source=feed&a=1&fbclid=xyz&b=2#comments",
+                        "HTTPS://EXAMPLE.COM/post?a=1&UTM_Medium=x&b=2&"):
+            with self.subTest(variant):
+                self.assertEqual(normalizer.key(variant), key)
+        self.assertEqual(normalizer.key(key), key)
+        self.assertNotEqual(normalizer.key("https://example.com/post?a=2&b=2"), key)
+        self.assertNotEqual(normalizer.key("https://example.com/Post?a=1&b=2"), key)
+
+    def test_clean(self):
+        normalizer = UrlNormalizer()
+        self.assertEqual(normalizer.clean("http://www.example.com/p?utm_source=x&id=3&gclid=1#top"),
+                         "http://www.example.com/p?id=3")
+        self.assertEqual(normalizer.clean("https://example.com"), "https://example.com/")
+
+    def test_options(self):
+        normalizer = UrlNormalizer(strip_params=TRACKING_PARAMS | {"ref"}, merge_schemes=False, merge_www=False)
+        self.assertEqual(normalizer.key("http://www.example.com/?ref=home&utm_id=1"), "http://www.example.com/")
+        self.assertNotEqual(normalizer.key("http://example.com/"), normalizer.key("https://example.com/"))
+        self.assertTrue(UrlNormalizer().same_site("https://www.example.com/a", "http://example.com/b"))
+        self.assertFalse(UrlNormalizer().same_site("https://example.com/a", "https://other.com/a"))
+
+class TestAliases(unittest.TestCase):
+    def test_memory_cache(self):
+        cache = MemoryCache()
+        cache.set("https://sho.rt/abc", CacheEntry({"title": "Post"}, True), aliases=["https://example.com/post"])
+        self.assertEqual(cache.get("http://www.example.com/post?utm_source=x").datas["title"], "Post")
+        self.assertEqual(len(cache), 1)
+        cache.clear()
+        self.assertIsNone(cache.get("https://example.com/post"))
+
+    def test_sqlite_cache(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "cache.sqlite")
+            cache = SqliteCache(path)
+            cache.set("https://sho.rt/abc", CacheEntry({"title": "Post"}, True), aliases=["https://example.com/post"])
+            cache.close()
+            cache = SqliteCache(path)
+            self.assertEqual(cache.get("https://example.com/post").datas["title"], "Post")
+            cache.close()
+
+    def test_preview_variants(self):
+        routes = {
+            "/short": (302, {"Location": "/post?utm_source=share"}, b""),
+            "/post?utm_source=share": (200, {"Content-Type": "text/html"}, POST),
+            "/claiming": (200, {"Content-Type": "text/html"}, CLAIMING),
+        }
+        cache = MemoryCache()
+        with LocalServer(routes) as server:
+            hlp = HP.HyperLinkPreview(server.url("/short"), cache=cache)
+            self.assertEqual(hlp.final_url, server.url("/post?utm_source=share"))
+            self.assertEqual(hlp.canonical_url, server.url("/post"))
+            requests = len(server.requests)
+            for variant in (server.url("/post"), server.url("/post?utm_campaign=x#top"), server.url("/short")):
+                self.assertEqual(HP.HyperLinkPreview(variant, cache=cache).get_data()["title"], "Post")
+            self.assertEqual(len(server.requests), requests)
+
+            claiming = HP.HyperLinkPreview(server.url("/claiming"), cache=cache)
+            self.assertIsNone(claiming.canonical_url)  # og:url of another site
+        self.assertIsNone(cache.peek("https://bank.example/"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import os
+import unittest
+import src.hyperlink_preview as HP
+from src.hyperlink_preview import extractor
+from src.hyperlink_preview.image_cache import ImageSizeCache
+from src.hyperlink_preview.parse_pool import ParsePool
+from local_server import LocalServer, png
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+PAGE = ('<html><head><title>Pooled</title></head><body>'
+        + '<p>Some text.</p>' * 5000 + '<img src="/big.png"></body></html>').encode()
+
+class TestPoolParsing(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = ParsePool(processes=2, min_chars=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.close()
+
+    def test_same_page_data(self):
+        for name in sorted(os.listdir(FIXTURES))[:3]:
+            with open(os.path.join(FIXTURES, name), encoding="utf-8", errors="replace") as file:
+                html = file.read()
+            with self.subTest(name):
+                self.assertEqual(repr(self.pool.extract(html)), repr(extractor.extract(html)))
+
+    def test_preview(self):
+        routes = {"/": (200, {"Content-Type": "text/html"}, PAGE),
+                  "/big.png": (200, {"Content-Type": "image/png"}, png(800, 600))}
+        with LocalServer(routes) as server:
+            pooled = HP.HyperLinkPreview(server.url("/"), parse_pool=self.pool, image_cache=ImageSizeCache())
+            threaded = HP.HyperLinkPreview(server.url("/"), image_cache=ImageSizeCache())
+            self.assertEqual(pooled.get_data(), threaded.get_data())
+        self.assertEqual(pooled.get_data()["title"], "Pooled")
+
+    def test_closed_pool(self):
+        pool = ParsePool(processes=1, min_chars=0)
+        pool.close()
+        with self.assertLogs("hyperlinkpreview", "WARNING"):
+            page = pool.extract("<html><head><title>Fallback</title></head></html>")
+        self.assertEqual(page.title, "Fallback")
+
+if __name__ == '__main__':
+    unittest.main()
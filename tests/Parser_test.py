@@ -0,0 +1,46 @@
+import os
+import unittest
+import src.hyperlink_preview as HP
+from src.hyperlink_preview import extractor
+from local_server import LocalServer, png
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+PAGES = sorted(name for name in os.listdir(FIXTURES) if name.endswith(".html"))
+# lxml nests malformed markup as browsers do: there, its description differs from bs4 (see Extractor_test)
+LXML_DESCRIPTION = {
+    "malformed.html": "First paragraph, never closed Second paragraph, never closed Intro Last paragraph",
+}
+
+def routes():
+    routes = {"/small.png": (200, {"Content-Type": "image/png"}, png(20, 20)),
+              "/big.png": (200, {"Content-Type": "image/png"}, png(400, 300))}
+    for name in PAGES:
+        with open(os.path.join(FIXTURES, name), "rb") as page:
+            routes["/" + name] = (200, {"Content-Type": "text/html; charset=utf-8"}, page.read())
+    return routes
+
+class TestHtmlParsers(unittest.TestCase):
+    def test_same_data_with_all_parsers(self):
+        parsers = ["html.parser", "lxml"] if extractor.lxml is not None else ["html.parser"]
+        with LocalServer(routes()) as server:
+            for name in PAGES:
+                expected = HP.HyperLinkPreview(server.url("/" + name), parser="bs4").get_data()
+                for parser in parsers:
+                    with self.subTest(page=name, parser=parser):
+                        datas = HP.HyperLinkPreview(server.url("/" + name), parser=parser).get_data().to_dict()
+                        expected_datas = expected.to_dict()
+                        if parser == "lxml" and name in LXML_DESCRIPTION:
+                            self.assertEqual(datas.pop("description"), LXML_DESCRIPTION[name])
+                            expected_datas.pop("description")
+                        self.assertEqual(datas, expected_datas)
+
+    def test_scraped_fields(self):
+        with LocalServer(routes()) as server:
+            datas = HP.HyperLinkPreview(server.url("/no_og.html")).get_data()
+        self.assertEqual(datas["title"].strip(), "A page without og tags")
+        self.assertTrue(datas["description"].startswith("This page has no open graph tags"))
+        self.assertTrue(datas["image"].endswith("/big.png"))
+
+    def test_unknown_parser(self):
+        with self.assertRaises(ValueError):
+            HP.HyperLinkPreview("https://example.com", parser="html5lib")
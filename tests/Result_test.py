@@ -0,0 +1,54 @@
+import json
+import pickle
+import unittest
+from src.hyperlink_preview.cache import CacheEntry
+from src.hyperlink_preview.image_size import ImageSize
+from src.hyperlink_preview.result import FIELDS, PreviewResult
+
+DATAS = {"title": "Title", "type": "article", "image": "https://a.b/i.png", "url": "https://a.b/",
+         "description": None, "site_name": "a", "domain": "a.b"}
+
+class TestPreviewResult(unittest.TestCase):
+    def test_mapping(self):
+        result = PreviewResult(DATAS)
+        self.assertEqual(result, DATAS)
+        self.assertEqual(list(result), list(FIELDS))
+        self.assertEqual(result["title"], "Title")
+        self.assertEqual(result.image, "https://a.b/i.png")
+        self.assertIsNone(result.get("description", "default"))
+        self.assertEqual(json.loads(json.dumps(result.to_dict())), DATAS)
+        self.assertFalse(hasattr(result, "__dict__"))
+
+    def test_some_fields(self):
+        result = PreviewResult(title="Title", domain="a.b", unknown="ignored")
+        self.assertEqual(dict(result), {"title": "Title", "domain": "a.b"})
+        self.assertNotIn("image", result)
+        with self.assertRaises(KeyError):
+            result["image"]  # pylint: disable=pointless-statement
+
+    def test_frozen(self):
+        result = PreviewResult(DATAS)
+        with self.assertRaises(AttributeError):
+            result.title = "Other"
+        with self.assertRaises(TypeError):
+            result["title"] = "Other"  # pylint: disable=unsupported-assignment-operation
+        self.assertEqual(pickle.loads(pickle.dumps(result)), result)
+
+    def test_partial(self):
+        self.assertFalse(PreviewResult(DATAS).is_partial)
+        result = PreviewResult(DATAS, is_partial=True)
+        self.assertEqual(result, DATAS)
+        self.assertNotIn("is_partial", result.to_dict())
+        copy = pickle.loads(pickle.dumps(result))
+        self.assertTrue(copy.is_partial)
+        self.assertEqual(copy, result)
+
+    def test_cache_entry(self):
+        entry = CacheEntry(dict(DATAS), True, etag='"v1"')
+        self.assertIsInstance(entry.datas, PreviewResult)
+        self.assertEqual(CacheEntry.from_json(entry.to_json()).datas, DATAS)
+        self.assertFalse(hasattr(entry, "__dict__"))
+        self.assertFalse(hasattr(ImageSize("https://a.b/i.png", 10, 20), "__dict__"))
+
+if __name__ == '__main__':
+    unittest.main()
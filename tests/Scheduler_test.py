@@ -0,0 +1,84 @@
+import threading
+import time
+import unittest
+from email.utils import formatdate
+import src.hyperlink_preview as HP
+from src.hyperlink_preview import scheduler as scheduler_module
+from src.hyperlink_preview.image_cache import ImageSizeCache
+from local_server import LocalServer, png
+
+class TestScheduler(unittest.TestCase):
+    def test_groups_in_turn(self):
+        scheduler = HP.FetchScheduler(max_concurrency=1)
+        order = []
+        scheduler.defer_host("http://h/", 0.2)  # queue everything before the first task runs
+        futures = [scheduler.submit("http://h/", order.append, f"big{index}", group="big") for index in range(6)]
+        futures += [scheduler.submit("http://h/", order.append, f"small{index}", group="small") for index in range(2)]
+        for future in futures:
+            future.result(timeout=5)
+        scheduler.shutdown()
+        self.assertEqual(order[:4], ["big0", "small0", "big1", "small1"])
+
+    def test_defer_host(self):
+        scheduler = HP.FetchScheduler()
+        scheduler.defer_host("http://slow.host/a", 0.3)
+        start = time.monotonic()
+        paused = scheduler.submit("http://slow.host/b", time.monotonic)
+        other = scheduler.submit("http://other.host/", time.monotonic)
+        self.assertLess(other.result(timeout=5) - start, 0.2)
+        self.assertGreaterEqual(paused.result(timeout=5) - start, 0.3)
+        scheduler.shutdown()
+
+    def test_call_later(self):
+        scheduler = HP.FetchScheduler(max_concurrency=2)
+        start = time.monotonic()
+        late = scheduler.call_later(0.3, time.monotonic)
+        soon = scheduler.call_later(0.1, time.monotonic)
+        cancelled = scheduler.call_later(0.1, self.fail, "cancelled call run")
+        self.assertTrue(cancelled.cancel())
+        self.assertLess(soon.result(timeout=5), late.result(timeout=5))
+        self.assertGreaterEqual(soon.result() - start, 0.1)
+        self.assertGreaterEqual(late.result() - start, 0.3)
+        scheduler.shutdown()
+
+    def test_deadlines_without_threads(self):
+        page = b'<html><body><img src="/slow.png"></body></html>'
+        routes = {"/": (200, {"Content-Type": "text/html"}, page),
+                  "/slow.png": (200, {}, lambda _handler: time.sleep(0.5) or (200, {}, png(800, 600)))}
+        scheduler = HP.FetchScheduler(max_concurrency=4)
+        try:
+            with LocalServer(routes) as server:
+                threads = threading.active_count()
+                previews = [HP.HyperLinkPreview(server.url("/"), scheduler=scheduler, images_timeout=0.2,
+                                                image_cache=ImageSizeCache(), coalesce=False) for _ in range(8)]
+                self.assertLessEqual(threading.active_count() - threads, 4 + 8)  # workers, server handlers
+                for hlp in previews:
+                    self.assertIsNone(hlp.get_data()["image"])
+                    self.assertTrue(hlp.image_search.timed_out)
+        finally:
+            scheduler.shutdown()
+
+    def test_parse_retry_after(self):
+        self.assertEqual(scheduler_module.parse_retry_after("120"), 120)
+        self.assertAlmostEqual(scheduler_module.parse_retry_after(formatdate(time.time() + 60, usegmt=True)), 60,
+                               delta=2)
+        self.assertEqual(scheduler_module.parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT"), 0)
+        self.assertIsNone(scheduler_module.parse_retry_after("soon"))
+        self.assertIsNone(scheduler_module.parse_retry_after(None))
+
+    def test_retry_after_pauses_the_host(self):
+        page = b'<html><body><img src="/throttled.png"><img src="/big.png"></body></html>'
+        routes = {
+            "/": (200, {"Content-Type": "text/html"}, page),
+            "/throttled.png": (429, {"Retry-After": "1"}, b""),
+            "/big.png": (200, {"Content-Type": "image/png"}, png(800, 600)),
+        }
+        scheduler = HP.FetchScheduler(max_concurrency=4, per_host_limit=1)
+        try:
+            with LocalServer(routes) as server:
+                hlp = HP.HyperLinkPreview(server.url("/"), scheduler=scheduler, image_cache=ImageSizeCache())
+                start = time.monotonic()
+                self.assertEqual(hlp.get_data()["image"], server.url("/big.png"))
+                self.assertGreaterEqual(time.monotonic() - start, 0.8)
+        finally:
+            scheduler.shutdown()
@@ -0,0 +1,53 @@
+import time
+import unittest
+import src.hyperlink_preview as HP
+from src.hyperlink_preview import session as HP_session
+from local_server import LocalServer, png
+
+PAGE = b'<html><head><title>t</title></head><body><img src="/a.png"><img src="/b.png"><img src="/c.png"></body></html>'
+
+ROUTES = {
+    "/page": (200, {"Content-Type": "text/html"}, PAGE),
+    "/a.png": (200, {"Content-Type": "image/png"}, png(100, 100)),
+    "/b.png": (200, {"Content-Type": "image/png"}, png(200, 100) + b"\0" * 20000),
+    "/c.png": (200, {"Content-Type": "image/png"}, png(50, 100)),
+    "/busy": (503, {"Retry-After": "3"}, b"busy"),
+    "/bad-gateway": (502, {}, b"bad gateway"),
+}
+
+class TestSession(unittest.TestCase):
+    def test_images_reuse_page_connection(self):
+        session = HP_session.create_session()
+        scheduler = HP.FetchScheduler(max_concurrency=1, per_host_limit=1)
+        with LocalServer(ROUTES) as server:
+            hlp = HP.HyperLinkPreview(server.url("/page"), scheduler=scheduler, session=session)
+            self.assertEqual(hlp.get_data()["image"], server.url("/b.png"))
+        scheduler.shutdown()
+        self.assertEqual(len(server.requests), 4)
+        self.assertEqual(len(server.connections), 1)
+
+    def test_default_session_shared(self):
+        self.assertIs(HP_session.get_default_session(), HP_session.get_default_session())
+        session = HP_session.create_session()
+        HP_session.set_default_session(session)
+        try:
+            self.assertIs(HP_session.get_default_session(), session)
+        finally:
+            HP_session.set_default_session(None)
+
+    def test_default_timeout(self):
+        session = HP_session.create_session(timeout=3)
+        self.assertEqual(session.get_adapter("https://example.com").timeout, 3)
+
+    def test_retry_after_left_to_scheduler(self):
+        session = HP_session.create_session()
+        scheduler = HP.FetchScheduler()
+        with LocalServer(ROUTES) as server:
+            start = time.monotonic()
+            response = session.get(server.url("/busy"))
+            self.assertLess(time.monotonic() - start, 1)  # no sleep of the Retry-After
+            self.assertEqual(response.status_code, 503)
+            self.assertTrue(scheduler.defer_host_if_throttled(server.url("/busy"), response))
+            session.get(server.url("/bad-gateway"))
+        self.assertEqual([path for path, _ in server.requests], ["/busy"] + ["/bad-gateway"] * 3)
+        scheduler.shutdown()
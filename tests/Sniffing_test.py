@@ -0,0 +1,54 @@
+import unittest
+import src.hyperlink_preview as HP
+from src.hyperlink_preview import sniffing
+from src.hyperlink_preview.image_cache import ImageSizeCache
+from local_server import LocalServer, png
+
+HTML = b'<html><head><title>A page</title></head><body><p>Text</p></body></html>'
+ROUTES = {
+    "/doc.pdf": (200, {"Content-Type": "application/pdf"}, b'%PDF-1.4' + b'\0' * 2000000),
+    "/page": (200, {"Content-Type": "application/octet-stream"}, HTML),
+    "/archive": (200, {"Content-Type": "application/octet-stream"}, b'PK\3\4' + b'\0' * 200000),
+    "/images/My%20photo.png": (200, {"Content-Type": "image/png"}, png(640, 480) + b'\0' * 200000),
+    "/untyped.png": (200, {}, png(320, 200)),
+}
+
+class TestSniffing(unittest.TestCase):
+    def test_kind(self):
+        self.assertEqual(sniffing.media_type("Text/HTML; charset=utf-8"), "text/html")
+        self.assertEqual(sniffing.kind_from_headers("text/html", None, 1000), sniffing.HTML)
+        self.assertEqual(sniffing.kind_from_headers("image/webp", None, 1000), sniffing.IMAGE)
+        self.assertEqual(sniffing.kind_from_headers("video/mp4", None, 1000), sniffing.OTHER)
+        self.assertIsNone(sniffing.kind_from_headers("", "500", 1000))
+        self.assertEqual(sniffing.kind_from_headers("application/octet-stream", "5000", 1000), sniffing.OTHER)
+        self.assertEqual(sniffing.sniff(b'\xef\xbb\xbf\n  <!DOCTYPE html><html>'), sniffing.HTML)
+        self.assertEqual(sniffing.sniff(b'\xff\xfe<\0h\0t\0m\0l\0'), sniffing.HTML)
+        self.assertEqual(sniffing.sniff(b'<?xml version="1.0"?>\n<svg width="10">'), sniffing.IMAGE)
+        self.assertEqual(sniffing.sniff(png(1, 1)), sniffing.IMAGE)
+        self.assertEqual(sniffing.sniff(b'%PDF-1.4'), sniffing.OTHER)
+
+    def test_previews(self):
+        with LocalServer(ROUTES) as server:
+            pdf = HP.HyperLinkPreview(server.url("/doc.pdf"))
+            self.assertFalse(pdf.is_valid)
+            self.assertIsNone(pdf.fetched_bytes)
+            self.assertTrue(all(value is None for value in pdf.get_data().values()))
+
+            page = HP.HyperLinkPreview(server.url("/page"))
+            self.assertTrue(page.is_valid)
+            self.assertEqual(page.get_data()["title"], "A page")
+
+            archive = HP.HyperLinkPreview(server.url("/archive"))
+            self.assertFalse(archive.is_valid)
+            self.assertLessEqual(archive.fetched_bytes or 0, sniffing.SNIFF_BYTES)
+
+            url = server.url("/images/My%20photo.png")
+            image = HP.HyperLinkPreview(url, image_cache=ImageSizeCache())
+            self.assertTrue(image.is_valid)
+            self.assertEqual((image.direct_image.width, image.direct_image.height), (640, 480))
+            self.assertLess(image.fetched_bytes, 64 * 1024)
+            data = image.get_data()
+            self.assertEqual((data["image"], data["title"], data["url"]), (url, "My photo.png", url))
+
+            untyped = HP.HyperLinkPreview(server.url("/untyped.png"))
+            self.assertEqual((untyped.direct_image.width, untyped.direct_image.height), (320, 200))
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+import src.hyperlink_preview as HP
+from src.hyperlink_preview.cache import CacheEntry
+from src.hyperlink_preview.store import PreviewStore
+from local_server import LocalServer
+
+class TestPreviewStore(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()  # pylint: disable=consider-using-with
+        self.path = os.path.join(self.folder.name, "previews.hlp")
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_reopen(self):
+        store = PreviewStore(self.path)
+        for index in range(100):
+            store.set(f"https://site/{index}", CacheEntry({"title": str(index)}, True))
+        store.set("https://site/1", CacheEntry({"title": "replaced"}, True))
+        store.delete("https://site/2")
+        store.close()
+        store = PreviewStore(self.path)  # loads the saved index
+        store.set("https://site/100", CacheEntry({"title": "100"}, True))
+        store._file.close()  # pylint: disable=protected-access  # as a crash: the index is not saved
+        with open(self.path, "ab") as file:
+            file.write(b"\1\2\3")  # interrupted write
+        store = PreviewStore(self.path)
+        self.assertEqual(len(store), 100)
+        self.assertEqual(store.get("https://SITE/1#top").datas["title"], "replaced")
+        self.assertIsNone(store.get("https://site/2"))
+        self.assertEqual(store.get("https://site/100").datas["title"], "100")
+        size = os.path.getsize(self.path)
+        store.compact()
+        self.assertLess(os.path.getsize(self.path), size)
+        self.assertEqual(store.get("https://site/99").datas["title"], "99")
+        store.close()
+
+    def test_export_import(self):
+        store = PreviewStore(self.path)
+        for index in range(10):
+            store.set(f"https://site/{index}", CacheEntry({"title": str(index)}, True, etag=f'"{index}"'))
+        export_path = os.path.join(self.folder.name, "previews.jsonl")
+        self.assertEqual(store.export_jsonl(export_path), 10)
+        store.close()
+        with open(export_path, "a", encoding="utf-8") as file:
+            file.write("not json\n")
+        other = PreviewStore(os.path.join(self.folder.name, "other.hlp"))
+        self.assertEqual(other.import_jsonl(export_path), 10)
+        self.assertEqual(other.get("https://site/3").etag, '"3"')
+        other.close()
+
+    def test_serves_previews_without_fetch(self):
+        store = PreviewStore(self.path, ttl=3600)
+        store.set("http://127.0.0.1:1/page", CacheEntry({"title": "Stored", "image": None}, True))
+        hlp = HP.HyperLinkPreview("http://127.0.0.1:1/page", cache=store)  # nothing listens on port 1
+        self.assertEqual(hlp.get_data()["title"], "Stored")
+        with LocalServer({"/": (200, {"Content-Type": "text/html"}, b"<html><title>New</title></html>")}) as server:
+            HP.HyperLinkPreview(server.url("/"), cache=store)
+        self.assertEqual(store.get(server.url("/")).datas["title"], "New")
+        store.close()
+
+    def test_not_a_store(self):
+        with open(self.path, "wb") as file:
+            file.write(b"something else")
+        with self.assertRaises(ValueError):
+            PreviewStore(self.path)
@@ -0,0 +1,48 @@
+import unittest
+import src.hyperlink_preview as HP
+from local_server import LocalServer
+
+BODY = b"<p>" + b"Long text. " * 100000 + b"</p></body></html>"
+HEAD_COMPLETE = (b'<html><head><title>Title</title><meta name="Description" content="From meta">'
+                 b'<link rel="image_src" href="https://img/i.png"></head><body>' + BODY)
+OG_COMPLETE = (b'<html><head>' + b''.join(f'<meta property="og:{name}" content="og {name}">'.encode()
+                                           for name in HP.HyperLinkPreview.properties) + b'<script>' +
+               b'var x = 1;' * 100000 + b'</script></head><body>' + BODY)
+NEEDS_BODY = b'<html><head><title>Title</title></head><body>' + BODY
+
+ROUTES = {
+    "/head_complete": (200, {"Content-Type": "text/html; charset=utf-8"}, HEAD_COMPLETE),
+    "/og_complete": (200, {"Content-Type": "text/html; charset=utf-8"}, OG_COMPLETE),
+    "/needs_body": (200, {"Content-Type": "text/html; charset=utf-8"}, NEEDS_BODY),
+}
+
+class TestHeadOnly(unittest.TestCase):
+    def compare(self, server, path):
+        full = HP.HyperLinkPreview(server.url(path)).get_data()
+        hlp = HP.HyperLinkPreview(server.url(path), head_only=True)
+        self.assertEqual(hlp.get_data(), full)
+        return hlp
+
+    def test_stops_at_head_end(self):
+        with LocalServer(ROUTES) as server:
+            hlp = self.compare(server, "/head_complete")
+        self.assertLess(hlp.fetched_bytes, 100 * 1024)
+        self.assertEqual(hlp.get_data()["description"], "From meta")
+
+    def test_stops_when_og_complete(self):
+        with LocalServer(ROUTES) as server:
+            hlp = self.compare(server, "/og_complete")
+        self.assertLess(hlp.fetched_bytes, 100 * 1024)
+
+    def test_reads_body_when_needed(self):
+        with LocalServer(ROUTES) as server:
+            hlp = self.compare(server, "/needs_body")
+        self.assertEqual(hlp.fetched_bytes, len(NEEDS_BODY))
+        self.assertTrue(hlp.get_data()["description"].startswith("Long text."))
+
+    def test_max_bytes(self):
+        with LocalServer(ROUTES) as server:
+            hlp = HP.HyperLinkPreview(server.url("/needs_body"), head_only=True, max_bytes=50000)
+        self.assertEqual(hlp.fetched_bytes, 50000)
+        self.assertEqual(hlp.get_data()["title"], "Title")
+        self.assertTrue(hlp.get_data()["description"].startswith("Long text."))
@@ -0,0 +1,138 @@
+"""
+Small http server serving in memory pages, to test without internet access.
+"""
+
+from socketserver import ThreadingMixIn
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """
+    http.server.ThreadingHTTPServer, which is not in python 3.6.
+    """
+    daemon_threads = True
+
+
+class LocalServer:
+    """
+    Serves routes: path -> (status, headers dict, body bytes). body can also be a callable(handler) returning
+    such a tuple, or an iterable of chunks sent one by one (then headers give the Content-Length).
+
+    Exemple:
+        with LocalServer({"/": (200, {"Content-Type": "text/html"}, b"<html></html>")}) as server:
+            url = server.url("/")
+    """
+    def __init__(self, routes):
+        self.routes = routes
+        self.requests = []  # (path, headers) of received requests
+        self.connections = set()  # client (host, port) of the received requests
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                server.requests.append((self.path, dict(self.headers)))
+                server.connections.add(self.client_address)
+                status, headers, body = server.routes.get(self.path, (404, {}, b"not found"))
+                if callable(body):
+                    status, headers, body = body(self)
+                self.send_response(status)
+                for key, value in headers.items():
+                    self.send_header(key, value)
+                if isinstance(body, bytes):
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                self.end_headers()  # body is an iterable of chunks, headers give the Content-Length
+                try:
+                    for chunk in body:
+                        self.wfile.write(chunk)
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    self.close_connection = True  # the client closed the connection
+
+            def log_message(self, *args):  # pylint: disable=arguments-differ
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, path):
+        return f"http://127.0.0.1:{self.httpd.server_port}{path}"
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def png(width, height):
+    """
+    Returns: the first bytes of a png with the given size (enough for image_size).
+    """
+    return b'\211PNG\r\n\032\n' + b'\0\0\0\rIHDR' + width.to_bytes(4, "big") + height.to_bytes(4, "big") + b'\0' * 64
+
+
+def jpeg(width, height, padding=0, marker=0xc0):
+    """
+    Returns: the start of a jpeg with the given size, after padding bytes of APP1 segments (EXIF, ICC...).
+    """
+    data = b'\xff\xd8'
+    while padding > 0:
+        length = min(padding, 65533)
+        data += b'\xff\xe1' + struct.pack(">H", length + 2) + b'\0' * length
+        padding -= length
+    return data + bytes([0xff, marker]) + struct.pack(">HBHHB", 17, 8, height, width, 3) + b'\0' * 9
+
+
+def ranged(content_type, body, max_ranges=None):
+    """
+    Returns: a route serving the ranges of body (206 with Content-Range) that the requests ask, at most max_ranges
+    (then 200 with the whole body).
+    """
+    served = []
+
+    def respond(handler):
+        range_header = handler.headers.get("Range", "")
+        if not range_header.startswith("bytes=") or (max_ranges is not None and len(served) >= max_ranges):
+            return (200, {"Content-Type": content_type}, body)
+        first, last = range_header[len("bytes="):].split("-")
+        first, last = int(first), min(int(last), len(body) - 1)
+        served.append((first, last))
+        return (206, {"Content-Type": content_type, "Content-Range": f"bytes {first}-{last}/{len(body)}"},
+                body[first:last + 1])
+    return respond
+
+
+def slow(delay, response):
+    """
+    Returns: a route answering response (status, headers, body) after delay seconds.
+    """
+    def respond(_handler):
+        time.sleep(delay)
+        return response
+    return respond
+
+
+def drip(content_type, body, chunk_size=1, delay=0.1):
+    """
+    Returns: a route sending body by chunk_size bytes every delay seconds (a slow server, that never times out).
+    """
+    def chunks():
+        for start in range(0, len(body), chunk_size):
+            time.sleep(delay)
+            yield body[start:start + chunk_size]
+
+    def respond(_handler):
+        return (200, {"Content-Type": content_type, "Content-Length": str(len(body))}, chunks())
+    return respond